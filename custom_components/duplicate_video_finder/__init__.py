@@ -1,34 +1,51 @@
 """The Duplicate Video Finder integration."""
 import logging
 import os
-from datetime import timedelta
 from typing import Any, Dict, List, Optional
 
 import voluptuous as vol
 
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant, ServiceCall, callback
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse, callback
+from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers.entity_component import EntityComponent
 from homeassistant.helpers.typing import ConfigType
-from homeassistant.helpers.event import async_track_time_interval
 
 from .const import (
     DOMAIN,
     SERVICE_START_SCAN,
+    SERVICE_CHECK_FILE,
+    SIGNAL_SCAN_PROGRESS,
+    ATTR_PATH,
+    ATTR_VERIFY,
     EVENT_SCAN_STARTED,
     EVENT_SCAN_COMPLETED,
     EVENT_SCAN_ERROR,
     STATE_IDLE,
     STATE_SCANNING,
+    STATE_PAUSED,
+    CONF_SCHEDULE,
+    CONF_WINDOW_START,
+    CONF_WINDOW_END,
+    CONF_MEMORY_BUDGET,
+    CONF_VERIFY_PARTIAL,
+    DEFAULT_MEMORY_BUDGET,
+    DEFAULT_VERIFY_PARTIAL,
 )
 from .scanner import DuplicateVideoScanner
+from .scheduler import CronSchedule, ScanScheduler, parse_time_window
 from .sidebar import setup_sidebar
 
 _LOGGER = logging.getLogger(__name__)
 
 CONFIG_SCHEMA = vol.Schema({DOMAIN: vol.Schema({})}, extra=vol.ALLOW_EXTRA)
 
+CHECK_FILE_SCHEMA = vol.Schema({
+    vol.Required(ATTR_PATH): cv.string,
+    vol.Optional(ATTR_VERIFY, default=False): cv.boolean,
+})
+
 
 async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
     """Set up the Duplicate Video Finder component."""
@@ -46,11 +63,19 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     hass.data.setdefault(DOMAIN, {})
     
     # Create scanner instance
-    scanner = DuplicateVideoScanner(hass)
+    scanner = DuplicateVideoScanner(
+        hass,
+        progress_signal=SIGNAL_SCAN_PROGRESS.format(entry.entry_id),
+        memory_budget=entry.options.get(CONF_MEMORY_BUDGET, DEFAULT_MEMORY_BUDGET),
+        verify_partial=entry.options.get(CONF_VERIFY_PARTIAL, DEFAULT_VERIFY_PARTIAL),
+    )
+    # Lookups work right after a restart, from the index of earlier scans
+    await scanner.async_load_index()
     hass.data[DOMAIN][entry.entry_id] = {
         "scanner": scanner,
         "state": STATE_IDLE,
         "duplicates": [],
+        "scheduled": False,
     }
     
     # Register services
@@ -62,6 +87,44 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         DOMAIN, SERVICE_START_SCAN, start_scan_service
     )
     
+    async def check_file_service(call: ServiceCall) -> ServiceResponse:
+        """Check whether a file already exists in the scanned library."""
+        if not scanner.has_index:
+            raise HomeAssistantError("No scan has completed yet")
+        try:
+            return await scanner.check_file(call.data[ATTR_PATH], call.data[ATTR_VERIFY])
+        except OSError as exc:
+            raise HomeAssistantError(f"Cannot read {call.data[ATTR_PATH]}: {exc}") from exc
+    
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_CHECK_FILE,
+        check_file_service,
+        schema=CHECK_FILE_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+    
+    # Set up the off-peak scan scheduler from the options flow settings
+    schedule = entry.options.get(CONF_SCHEDULE)
+    window_start = entry.options.get(CONF_WINDOW_START, "")
+    window_end = entry.options.get(CONF_WINDOW_END, "")
+    if schedule:
+        try:
+            scheduler = ScanScheduler(
+                hass,
+                entry.entry_id,
+                lambda: _start_scan(hass, entry.entry_id, scheduled=True),
+                CronSchedule(schedule),
+                parse_time_window(window_start, window_end),
+            )
+        except ValueError as exc:
+            _LOGGER.error(f"Invalid scan schedule, scheduled scans disabled: {exc}")
+        else:
+            scheduler.async_start()
+            hass.data[DOMAIN][entry.entry_id]["scheduler"] = scheduler
+    
+    entry.async_on_unload(entry.add_update_listener(_async_update_listener))
+    
     # Set up sensor platform
     hass.async_create_task(
         hass.config_entries.async_forward_entry_setup(entry, "sensor")
@@ -70,32 +133,47 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     return True
 
 
+async def _async_update_listener(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Reload the entry when its options change."""
+    await hass.config_entries.async_reload(entry.entry_id)
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     # Remove services
     hass.services.async_remove(DOMAIN, SERVICE_START_SCAN)
+    hass.services.async_remove(DOMAIN, SERVICE_CHECK_FILE)
     
     # Unload sensor platform
     await hass.config_entries.async_forward_entry_unload(entry, "sensor")
     
     # Cleanup
-    hass.data[DOMAIN].pop(entry.entry_id)
+    data = hass.data[DOMAIN].pop(entry.entry_id)
+    if "scheduler" in data:
+        data["scheduler"].async_stop()
+    # Let a paused scan run to completion instead of waiting forever
+    data["scanner"].resume()
+    await hass.async_add_executor_job(data["scanner"].close)
     
     return True
 
 
-async def _start_scan(hass: HomeAssistant, entry_id: str) -> None:
-    """Start scanning process."""
+async def _start_scan(hass: HomeAssistant, entry_id: str, scheduled: bool = False) -> None:
+    """Start scanning process.
+    
+    Scheduled scans run incrementally and may be paused by the scheduler.
+    """
     data = hass.data[DOMAIN][entry_id]
     scanner = data["scanner"]
     
     # Avoid starting a new scan if one is already in progress
-    if data["state"] == STATE_SCANNING:
+    if data["state"] in (STATE_SCANNING, STATE_PAUSED):
         _LOGGER.warning("A scan is already in progress")
         return
     
     # Update state
     data["state"] = STATE_SCANNING
+    data["scheduled"] = scheduled
     data["duplicates"] = []
     
     # Fire event
@@ -104,11 +182,12 @@ async def _start_scan(hass: HomeAssistant, entry_id: str) -> None:
     try:
         # Start the scan
         _LOGGER.info("Starting scan for duplicate videos")
-        result = await scanner.scan()
+        result = await scanner.scan(incremental=scheduled)
         
         # Store results
         data["duplicates"] = result
         data["state"] = STATE_IDLE
+        data["scheduled"] = False
         
         # Fire completion event
         hass.bus.async_fire(
@@ -119,5 +198,6 @@ async def _start_scan(hass: HomeAssistant, entry_id: str) -> None:
         
     except Exception as exc:
         data["state"] = STATE_IDLE
+        data["scheduled"] = False
         _LOGGER.error(f"Error during scan: {exc}")
         hass.bus.async_fire(EVENT_SCAN_ERROR, {"error": str(exc)})
@@ -5,7 +5,17 @@ import voluptuous as vol
 from homeassistant import config_entries
 from homeassistant.core import callback
 
-from .const import DOMAIN
+from .const import (
+    DOMAIN,
+    CONF_MEMORY_BUDGET,
+    CONF_SCHEDULE,
+    CONF_WINDOW_START,
+    CONF_WINDOW_END,
+    CONF_VERIFY_PARTIAL,
+    DEFAULT_MEMORY_BUDGET,
+    DEFAULT_VERIFY_PARTIAL,
+)
+from .scheduler import CronSchedule, parse_time_window
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -45,10 +55,48 @@ class DuplicateVideoFinderOptionsFlow(config_entries.OptionsFlow):
 
     async def async_step_init(self, user_input=None):
         """Manage the options."""
+        errors = {}
+
         if user_input is not None:
-            return self.async_create_entry(title="", data=user_input)
+            if user_input.get(CONF_SCHEDULE):
+                try:
+                    CronSchedule(user_input[CONF_SCHEDULE])
+                except ValueError:
+                    errors[CONF_SCHEDULE] = "invalid_schedule"
+            try:
+                parse_time_window(
+                    user_input.get(CONF_WINDOW_START, ""),
+                    user_input.get(CONF_WINDOW_END, ""),
+                )
+            except ValueError:
+                errors["base"] = "invalid_window"
+
+            if not errors:
+                return self.async_create_entry(title="", data=user_input)
 
+        options = self.config_entry.options
         return self.async_show_form(
             step_id="init",
-            data_schema=vol.Schema({}),
+            data_schema=vol.Schema(
+                {
+                    vol.Optional(
+                        CONF_SCHEDULE, default=options.get(CONF_SCHEDULE, "")
+                    ): str,
+                    vol.Optional(
+                        CONF_WINDOW_START, default=options.get(CONF_WINDOW_START, "")
+                    ): str,
+                    vol.Optional(
+                        CONF_WINDOW_END, default=options.get(CONF_WINDOW_END, "")
+                    ): str,
+                    vol.Optional(
+                        CONF_MEMORY_BUDGET,
+                        default=options.get(CONF_MEMORY_BUDGET, DEFAULT_MEMORY_BUDGET),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=16)),
+                    vol.Optional(
+                        CONF_VERIFY_PARTIAL,
+                        default=options.get(CONF_VERIFY_PARTIAL, DEFAULT_VERIFY_PARTIAL),
+                    ): bool,
+                }
+            ),
+            errors=errors,
         )
@@ -9,10 +9,47 @@ EVENT_SCAN_ERROR = f"{DOMAIN}_scan_error"
 
 # Service calls
 SERVICE_START_SCAN = "start_scan"
+SERVICE_CHECK_FILE = "check_file"
+
+# Service call fields
+ATTR_PATH = "path"
+ATTR_VERIFY = "verify"
+
+# Dispatcher signal carrying scan progress, formatted with the entry id
+SIGNAL_SCAN_PROGRESS = f"{DOMAIN}_scan_progress_{{}}"
+
+# Minimum number of seconds between two progress updates
+PROGRESS_INTERVAL = 5
 
 # States
 STATE_IDLE = "idle"
 STATE_SCANNING = "scanning"
+STATE_PAUSED = "paused"
+
+# Options
+CONF_SCHEDULE = "schedule"
+CONF_WINDOW_START = "window_start"
+CONF_WINDOW_END = "window_end"
+CONF_MEMORY_BUDGET = "memory_budget_mb"
+CONF_VERIFY_PARTIAL = "verify_partial"
+
+# Memory in MB for grouping files by name before spilling to disk
+DEFAULT_MEMORY_BUDGET = 256
+
+# Compare the first PARTIAL_HASH_SIZE bytes of same-size, same-name files
+DEFAULT_VERIFY_PARTIAL = True
+
+# Directory in the config dir for sorted runs of scans beyond the budget
+SPILL_DIR = f".{DOMAIN}_spill"
+
+# Number of leading bytes compared by a quick duplicate check
+PARTIAL_HASH_SIZE = 1024 * 1024
+
+# Number of partial digests kept in memory, most recently used first
+PARTIAL_CACHE_SIZE = 10000
+
+# Database in the config dir indexing the video files of the last scan
+INDEX_FILE = f".{DOMAIN}_index.db"
 
 # Video file extensions
 VIDEO_EXTENSIONS = [
@@ -1,7 +1,11 @@
 """Frontend for Duplicate Video Finder."""
+import hashlib
+import json
 import os
 import logging
 
+from aiohttp import hdrs, web
+
 from homeassistant.components.frontend import add_extra_js_url
 from homeassistant.components.http import HomeAssistantView
 from homeassistant.core import HomeAssistant, callback
@@ -73,11 +77,28 @@ class DuplicateVideoFinderPanelView(HomeAssistantView):
     def __init__(self, hass: HomeAssistant):
         """Initialize the view."""
         self.hass = hass
+        self._body = None
+        self._etag = None
         
     async def get(self, request):
-        """Handle GET request."""
-        html = self._generate_html()
-        return self.json({"html_response": html})
+        """Handle GET request.
+
+        The dashboard never changes while Home Assistant runs, so it is
+        rendered once and revalidated with its ETag afterwards.
+        """
+        if self._body is None:
+            self._body = json.dumps({"html_response": self._generate_html()}).encode()
+            # Weak, because the body may be sent gzip compressed or not
+            self._etag = f'W/"{hashlib.sha1(self._body).hexdigest()[:16]}"'
+
+        headers = {hdrs.ETAG: self._etag, hdrs.CACHE_CONTROL: "no-cache"}
+        if_none_match = request.headers.get(hdrs.IF_NONE_MATCH, "")
+        if self._etag[2:] in [tag.strip().replace("W/", "", 1) for tag in if_none_match.split(",")]:
+            return web.Response(status=304, headers=headers)
+
+        response = web.Response(body=self._body, content_type="application/json", headers=headers)
+        response.enable_compression()
+        return response
     
     def _generate_html(self):
         """Generate the HTML for the panel."""
@@ -272,7 +293,7 @@ class DuplicateVideoFinderPanelView(HomeAssistantView):
                         }}
                         
                         const countText = document.createElement('p');
-                        countText.innerText = `Found ${duplicates.length} sets of duplicate videos.`;
+                        countText.innerText = `Found ${{duplicates.length}} sets of duplicate videos.`;
                         resultsDiv.appendChild(countText);
                         
                         duplicates.forEach((dup, index) => {{
@@ -282,13 +303,13 @@ class DuplicateVideoFinderPanelView(HomeAssistantView):
                             const dupHeader = document.createElement('div');
                             dupHeader.className = 'duplicate-header';
                             dupHeader.innerHTML = `
-                                <div>${dup.name || 'Unnamed Video'}</div>
-                                <div>${dup.count || dup.paths.length} copies</div>
+                                <div>${{dup.name || 'Unnamed Video'}}</div>
+                                <div>${{dup.count || dup.paths.length}} copies</div>
                             `;
                             
                             const dupDetails = document.createElement('div');
                             dupDetails.className = 'duplicate-details';
-                            dupDetails.id = `duplicate-${index}`;
+                            dupDetails.id = `duplicate-${{index}}`;
                             
                             // Add the paths
                             const pathList = document.createElement('ul');
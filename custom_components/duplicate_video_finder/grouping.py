@@ -0,0 +1,137 @@
+"""Grouping of scanned files by key that spills to disk past a memory budget."""
+
+import heapq
+import itertools
+import json
+import logging
+import os
+import tempfile
+from operator import itemgetter
+from typing import Any, Dict, IO, Iterator, List, Optional, Tuple
+
+_LOGGER = logging.getLogger(__name__)
+
+# Rough number of bytes a buffered record costs beyond its strings
+RECORD_OVERHEAD = 200
+
+# Maximum number of runs merged at once; more are first merged into larger runs
+MERGE_FAN_IN = 64
+
+
+def _read_run(f: IO[str]) -> Iterator[Tuple[str, Any]]:
+    for line in f:
+        key, value = json.loads(line)
+        yield key, value
+
+
+class ExternalGrouper:
+    """Group ``(key, value)`` records, spilling sorted runs to disk when large.
+
+    Records are grouped in a dict as long as their estimated size stays
+    within ``memory_budget`` bytes. Past that the buffer is sorted by key and
+    written to a run file, and ``groups`` merges all runs so that only one
+    group has to be held at a time. Small libraries therefore never touch the
+    disk, while peak memory for large ones is bounded by the budget.
+
+    The buffer, the run files and the number of spilled records live in
+    ``state``, which callers may persist to resume grouping after a restart.
+    """
+
+    def __init__(self, spill_dir: str, memory_budget: int, state: Optional[Dict[str, Any]] = None):
+        """Initialize the grouper, continuing from ``state`` if given."""
+        self.spill_dir = spill_dir
+        self.memory_budget = memory_budget
+        self.state = state if state is not None else {}
+        self.buffer: Dict[str, List[Any]] = self.state.setdefault("files", {})
+        self.runs: List[str] = self.state.setdefault("runs", [])
+        self.state.setdefault("spilled_records", 0)
+        self._buffered = 0
+        self._buffer_bytes = 0
+        for key, values in self.buffer.items():
+            for value in values:
+                self._account(key, value)
+
+    @property
+    def spilled(self) -> bool:
+        """Return True once records have been written to disk."""
+        return bool(self.runs)
+
+    def __len__(self) -> int:
+        return self.state["spilled_records"] + self._buffered
+
+    def _account(self, key: str, value: Any) -> None:
+        self._buffered += 1
+        self._buffer_bytes += RECORD_OVERHEAD + len(key) + len(str(value))
+
+    def add(self, key: str, value: Any) -> None:
+        """Add a record, spilling the buffer if it outgrew the budget."""
+        self.buffer.setdefault(key, []).append(value)
+        self._account(key, value)
+        if self._buffer_bytes > self.memory_budget:
+            self.spill()
+
+    def _new_run(self) -> Tuple[IO[str], str]:
+        os.makedirs(self.spill_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix="run-", suffix=".jsonl", dir=self.spill_dir)
+        return os.fdopen(fd, "w"), path
+
+    def spill(self) -> None:
+        """Write the buffered records to a new sorted run."""
+        if not self.buffer:
+            return
+        f, path = self._new_run()
+        with f:
+            for key in sorted(self.buffer):
+                for value in self.buffer[key]:
+                    f.write(json.dumps([key, value]) + "\n")
+        if not self.runs:
+            _LOGGER.info(f"Grouping exceeds the memory budget, spilling to {self.spill_dir}")
+        self.runs.append(path)
+        self.state["spilled_records"] += self._buffered
+        self.buffer.clear()
+        self._buffered = 0
+        self._buffer_bytes = 0
+
+    def _merge(self, runs: List[str]) -> Iterator[Tuple[str, Any]]:
+        files = [open(path, "r") for path in runs]
+        try:
+            yield from heapq.merge(*(_read_run(f) for f in files), key=itemgetter(0))
+        finally:
+            for f in files:
+                f.close()
+
+    def _compact(self) -> None:
+        """Merge runs in batches until all of them can be opened at once."""
+        while len(self.runs) > MERGE_FAN_IN:
+            batch = self.runs[:MERGE_FAN_IN]
+            f, path = self._new_run()
+            with f:
+                for key, value in self._merge(batch):
+                    f.write(json.dumps([key, value]) + "\n")
+            self.runs[:MERGE_FAN_IN] = [path]
+            for run in batch:
+                os.remove(run)
+
+    def groups(self) -> Iterator[Tuple[str, List[Any]]]:
+        """Yield every key that has more than one value, with its values."""
+        if not self.runs:
+            for key, values in self.buffer.items():
+                if len(values) > 1:
+                    yield key, list(values)
+            return
+
+        self.spill()
+        self._compact()
+        for key, records in itertools.groupby(self._merge(self.runs), key=itemgetter(0)):
+            values = [value for _, value in records]
+            if len(values) > 1:
+                yield key, values
+
+    def close(self) -> None:
+        """Remove the run files."""
+        for path in self.runs:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.runs.clear()
@@ -0,0 +1,183 @@
+"""Persistent index of the directories and video files found by scans."""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+
+_LOGGER = logging.getLogger(__name__)
+
+# Columns of the files table beyond the path; added to older databases on open
+FILE_COLUMNS = {
+    "size": "INTEGER",
+    "mtime_ns": "INTEGER",
+    "directory": "TEXT",
+    "name": "TEXT",
+    "scan": "INTEGER",
+    "partial_hash": "TEXT",
+}
+
+
+def _unchanged_digest(previous: Optional[Tuple[int, int, Optional[str]]], size: int, mtime_ns: int) -> Optional[str]:
+    """Return the stored head digest of a file if its size and mtime did not change."""
+    if previous is None or previous[:2] != (size, mtime_ns):
+        return None
+    return previous[2]
+
+
+class LibraryIndex:
+    """SQLite tables of scanned directories and video files.
+
+    Files are keyed by path and indexed by size, so looking up a file reads
+    only the rows of its size however large the library is. Directory
+    listings are written as the walk goes and read back by incremental
+    scans, so neither has to be held in memory, and both survive restarts.
+    Rows carry the number of the scan that wrote them; rows a completed
+    scan did not see are removed. The digest of a file's first MiB is kept
+    on its row for as long as its size and mtime are unchanged, so lookups
+    after a restart do not read every candidate again. All methods block
+    and are meant to run in an executor.
+    """
+
+    def __init__(self, db_path: str):
+        """Open (and create if needed) the index database."""
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        except (OSError, sqlite3.Error) as e:
+            _LOGGER.warning(f"Could not open index at {db_path}, using an in-memory index: {e}")
+            self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY)")
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(files)")}
+            for column, column_type in FILE_COLUMNS.items():
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE files ADD COLUMN {column} {column_type}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS files_size ON files (size)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS files_directory ON files (directory)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS directories ("
+                "path TEXT PRIMARY KEY, mtime_ns INTEGER, subdirs TEXT, file_count INTEGER, scan INTEGER)"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+
+    def _meta(self, key: str) -> int:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row and row[0] else 0
+
+    @property
+    def completed(self) -> bool:
+        """Return True once a scan has completed."""
+        with self._lock:
+            return bool(self._meta("completed"))
+
+    def begin_scan(self) -> int:
+        """Return the number of a new scan."""
+        with self._lock, self._conn:
+            scan = self._meta("scan") + 1
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('scan', ?)", (scan,))
+        return scan
+
+    def count_files(self) -> int:
+        """Return the number of indexed video files."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def get_listing(self, directory: str) -> Optional[Tuple[int, List[str], int, List[Tuple[str, int, int]]]]:
+        """Return the stored listing of a directory.
+
+        The listing is ``(mtime_ns, subdirs, file_count, files)`` with files
+        as ``(name, size, mtime_ns)``, or None if the directory is unknown.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT mtime_ns, subdirs, file_count FROM directories WHERE path = ?", (directory,)
+            ).fetchone()
+            if row is None:
+                return None
+            files = self._conn.execute(
+                "SELECT name, size, mtime_ns FROM files WHERE directory = ? ORDER BY name", (directory,)
+            ).fetchall()
+        return row[0], json.loads(row[1]), row[2], files
+
+    def put_listing(
+        self,
+        scan: int,
+        directory: str,
+        mtime_ns: int,
+        subdirs: List[str],
+        file_count: int,
+        files: List[Tuple[str, int, int]],
+    ) -> None:
+        """Store the listing of a directory seen by ``scan``, replacing the previous one.
+
+        Stored head digests are kept for files whose size and mtime did not
+        change. Writes are committed by ``commit`` or ``finish_scan``.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO directories (path, mtime_ns, subdirs, file_count, scan) VALUES (?, ?, ?, ?, ?)",
+                (directory, mtime_ns, json.dumps(subdirs), file_count, scan),
+            )
+            previous = {
+                name: (size, mtime, digest)
+                for name, size, mtime, digest in self._conn.execute(
+                    "SELECT name, size, mtime_ns, partial_hash FROM files WHERE directory = ?", (directory,)
+                )
+            }
+            self._conn.execute("DELETE FROM files WHERE directory = ?", (directory,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, directory, name, scan, partial_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (os.path.join(directory, name), size, mtime, directory, name, scan,
+                     _unchanged_digest(previous.get(name), size, mtime))
+                    for name, size, mtime in files
+                ),
+            )
+
+    def commit(self) -> None:
+        """Flush stored listings to disk."""
+        with self._lock:
+            self._conn.commit()
+
+    def finish_scan(self, scan: int) -> None:
+        """Remove directories and files a completed scan did not see."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM directories WHERE scan IS NOT ?", (scan,))
+            self._conn.execute("DELETE FROM files WHERE scan IS NOT ?", (scan,))
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('completed', 1)")
+
+    def find_by_size(self, size: int) -> List[str]:
+        """Return the paths of the indexed files of a size."""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT path FROM files WHERE size = ?", (size,))]
+
+    def get_partial_hash(self, path: str, size: int, mtime_ns: int) -> Optional[str]:
+        """Return the stored head digest of a file, or None if it changed or has none."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT partial_hash FROM files WHERE path = ? AND size = ? AND mtime_ns = ?", (path, size, mtime_ns)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put_partial_hash(self, path: str, size: int, mtime_ns: int, digest: str) -> None:
+        """Store the head digest of an indexed file while its size and mtime are unchanged.
+
+        Writes are committed by ``commit``.
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE files SET partial_hash = ? WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (digest, path, size, mtime_ns),
+            )
+
+    def close(self) -> None:
+        """Commit and close the database."""
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
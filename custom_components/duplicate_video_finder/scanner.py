@@ -1,98 +1,612 @@
 """File scanner for duplicate video files."""
 import asyncio
+import hashlib
+import itertools
 import logging
 import os
+import threading
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
+import time
 from pathlib import Path
-from typing import Dict, List, Set, Tuple
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
 
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.dispatcher import dispatcher_send
 
-from .const import VIDEO_EXTENSIONS
+from .const import (
+    DEFAULT_MEMORY_BUDGET,
+    DEFAULT_VERIFY_PARTIAL,
+    INDEX_FILE,
+    PARTIAL_CACHE_SIZE,
+    PARTIAL_HASH_SIZE,
+    PROGRESS_INTERVAL,
+    SPILL_DIR,
+    VIDEO_EXTENSIONS,
+)
+from .container import metadata_signature, read_metadata
+from .grouping import ExternalGrouper
+from .index import LibraryIndex
 
 _LOGGER = logging.getLogger(__name__)
 
+# Directory names that are never descended into
+SKIP_DIR_PREFIXES = ('.', '$', 'System Volume Information')
+
+# Seconds a scan runs in one executor job before handing its thread back
+WALK_BATCH_SECONDS = 1.0
+
+
+class DirListing(NamedTuple):
+    """Result of reading one directory, stored in the file index."""
+
+    mtime_ns: int
+    subdirs: List[str]
+    video_files: List[str]
+    file_count: int
+    video_sizes: List[int]
+    video_mtimes: List[int]
+
+
+class ScanProgress:
+    """Progress of a scan, sent from the scan thread at most every PROGRESS_INTERVAL seconds."""
+
+    def __init__(self, hass: HomeAssistant, signal: Optional[str], expected_files: Optional[int]):
+        """Initialize the reporter.
+        
+        Args:
+            hass: Home Assistant instance
+            signal: Dispatcher signal to send updates on, None to disable them
+            expected_files: Video files found by the previous scan, used for the ETA
+        """
+        self.hass = hass
+        self.signal = signal
+        self.expected_files = expected_files
+        self.phase = "walking"
+        self.files = 0
+        self.directories = 0
+        self._phase_files = 0
+        self._phase_total = expected_files
+        self._phase_started = time.monotonic()
+        self._last_sent = 0.0
+    
+    def start_phase(self, phase: str, total: Optional[int]) -> None:
+        """Switch to a new phase that processes ``total`` files."""
+        self.phase = phase
+        self._phase_files = 0
+        self._phase_total = total
+        self._phase_started = time.monotonic()
+        self.update(force=True)
+    
+    def advance(self, files: int = 1, directories: int = 0) -> None:
+        """Count processed files and directories, sending an update when due."""
+        if self.phase == "walking":
+            self.files += files
+        self.directories += directories
+        self._phase_files += files
+        self.update()
+    
+    def update(self, force: bool = False) -> None:
+        """Send the current progress unless an update was sent recently."""
+        now = time.monotonic()
+        if self.signal is None or (not force and now - self._last_sent < PROGRESS_INTERVAL):
+            return
+        self._last_sent = now
+        elapsed = now - self._phase_started
+        rate = self._phase_files / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if rate > 0 and self._phase_total:
+            eta = round(max(self._phase_total - self._phase_files, 0) / rate)
+        dispatcher_send(self.hass, self.signal, {
+            "phase": self.phase,
+            "files": self.files,
+            "directories": self.directories,
+            "phase_files": self._phase_files,
+            "phase_total": self._phase_total,
+            "files_per_second": round(rate, 1),
+            "eta_seconds": eta,
+        })
+
+
+class _ScanRun:
+    """State of one scan, carried between the executor jobs of its walk."""
+
+    def __init__(self, file_map: ExternalGrouper, progress: ScanProgress, scan_id: int):
+        """Initialize an empty run."""
+        self.file_map = file_map
+        self.progress = progress
+        # Number of this scan in the file index
+        self.scan_id = scan_id
+        # (directory, listing, reused) tuples still to be processed
+        self.directories: Iterator[Tuple[str, DirListing, bool]] = iter(())
+        self.total_files = 0
+        self.video_files = 0
+        self.reused_dirs = 0
+
 
 class DuplicateVideoScanner:
     """Scanner class that searches for duplicate video files."""
 
-    def __init__(self, hass: HomeAssistant):
-        """Initialize the scanner."""
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        use_metadata: bool = True,
+        progress_signal: Optional[str] = None,
+        memory_budget: int = DEFAULT_MEMORY_BUDGET,
+        verify_partial: bool = DEFAULT_VERIFY_PARTIAL,
+    ):
+        """Initialize the scanner.
+        
+        Args:
+            hass: Home Assistant instance
+            use_metadata: Split same-name candidates by container metadata
+            progress_signal: Dispatcher signal that receives progress updates
+            memory_budget: MB for grouping files by name before spilling
+                sorted runs to disk
+            verify_partial: Split candidate sets by the digest of the first
+                PARTIAL_HASH_SIZE bytes of each file
+        """
         self.hass = hass
+        self.use_metadata = use_metadata
+        self.progress_signal = progress_signal
+        self.memory_budget = memory_budget
+        self.verify_partial = verify_partial
         self._executor = ThreadPoolExecutor(max_workers=2)  # Limit workers to avoid overloading system
+        # Directory listings and video files of the scans, opened on first use
+        self._index: Optional[LibraryIndex] = None
+        self._indexed = False
+        # Path -> (size, mtime_ns, digest of the first PARTIAL_HASH_SIZE bytes)
+        # of the PARTIAL_CACHE_SIZE most recently used files
+        self._partial_cache: "OrderedDict[str, Tuple[int, int, str]]" = OrderedDict()
+        self._partial_lock = threading.Lock()
+        # Cleared while the scan is paused; checked between directories and
+        # between candidate sets
+        self._running = asyncio.Event()
+        self._running.set()
         
-    async def scan(self) -> List[List[str]]:
+    async def scan(self, incremental: bool = False) -> List[List[str]]:
         """Scan the file system for duplicate video files.
         
+        The walk and the metadata and first-MiB checks run in executor jobs
+        of about WALK_BATCH_SECONDS each. A paused scan waits between two
+        jobs, so it holds no executor thread.
+        
+        Args:
+            incremental: Reuse the listing of directories whose mtime has not
+                changed since the previous scan instead of reading them again
+        
         Returns:
             List of lists, where each inner list contains paths to duplicate files
         """
-        # Run the scan in a thread pool to avoid blocking
-        return await self.hass.async_add_executor_job(self._scan_for_duplicates)
+        run = await self.hass.async_add_executor_job(self._start_scan, incremental)
+        try:
+            while True:
+                await self._running.wait()
+                if await self.hass.async_add_executor_job(self._walk_batch, run):
+                    break
+            duplicates = await self.hass.async_add_executor_job(self._finish_walk, run)
+        except BaseException:
+            # Sorted runs of an abandoned scan are not needed any more
+            self._executor.submit(run.file_map.close)
+            raise
         
-    def _scan_for_duplicates(self) -> List[List[str]]:
-        """Perform the actual scan for duplicate video files."""
-        _LOGGER.info("Starting to scan for duplicate video files")
+        # Drop same-name files whose duration, resolution or codec differ
+        if self.use_metadata:
+            duplicates = await self._split_phase("metadata", duplicates, self._split_by_metadata, run.progress)
         
-        # Dictionary to store filename -> file paths mapping
-        file_map: Dict[str, List[str]] = {}
+        # Drop same-size files whose first MiB differs
+        if self.verify_partial:
+            duplicates = await self._split_phase(
+                "verifying", duplicates, self._split_by_partial_digest, run.progress
+            )
         
-        # Track root drives/filesystems to scan
-        root_paths = self._get_root_paths()
+        _LOGGER.info(f"Found {len(duplicates)} sets of duplicate videos")
+        return duplicates
+    
+    async def _split_phase(
+        self,
+        phase: str,
+        candidates: List[List[str]],
+        split: Callable[[List[List[str]], Optional[ScanProgress]], List[List[str]]],
+        progress: ScanProgress,
+    ) -> List[List[str]]:
+        """Split candidate sets in executor jobs, waiting between them while paused."""
+        progress.start_phase(phase, sum(len(paths) for paths in candidates))
+        remaining = iter(candidates)
+        duplicates: List[List[str]] = []
+        while True:
+            await self._running.wait()
+            batch, done = await self.hass.async_add_executor_job(self._split_batch, remaining, split, progress)
+            duplicates.extend(batch)
+            if done:
+                return duplicates
+    
+    def _split_batch(
+        self,
+        candidates: Iterator[List[str]],
+        split: Callable[[List[List[str]], Optional[ScanProgress]], List[List[str]]],
+        progress: ScanProgress,
+    ) -> Tuple[List[List[str]], bool]:
+        """Split candidate sets for up to WALK_BATCH_SECONDS.
         
-        # Track total files scanned for logging
-        total_files = 0
-        video_files = 0
+        Returns the sets kept and True once every candidate set has been
+        split, or False when the time is up or the scan was paused. Head
+        digests read are committed to the file index at the end of each batch.
+        """
+        deadline = time.monotonic() + WALK_BATCH_SECONDS
+        duplicates: List[List[str]] = []
+        index = self._open_index()
+        for paths in candidates:
+            duplicates.extend(split([paths], progress))
+            if not self._running.is_set() or time.monotonic() >= deadline:
+                index.commit()
+                return duplicates, False
+        index.commit()
+        return duplicates, True
+    
+    @property
+    def has_index(self) -> bool:
+        """Return True once a scan has built the file index."""
+        return self._indexed
+    
+    async def async_load_index(self) -> None:
+        """Open the file index left by scans before a restart."""
+        await self.hass.async_add_executor_job(self._open_index)
+    
+    def close(self) -> None:
+        """Close the file index."""
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+    
+    async def check_file(self, path: str, verify: bool = False) -> Dict[str, Any]:
+        """Check whether a file already exists in the scanned library.
+        
+        Args:
+            path: File to look up
+            verify: Compare whole files instead of only their first MiB
         
-        # Scan each root path
-        for root_path in root_paths:
-            _LOGGER.info(f"Scanning {root_path}")
+        Returns:
+            Dict with the file size, whether copies were found, whether they
+            are confirmed by a full comparison and the matching paths
+        """
+        return await self.hass.async_add_executor_job(self._check_file, path, verify)
+    
+    @callback
+    def pause(self) -> None:
+        """Pause a running scan before the next directory or candidate set is read."""
+        self._running.clear()
+    
+    @callback
+    def resume(self) -> None:
+        """Resume a paused scan."""
+        self._running.set()
+    
+    def _open_index(self) -> LibraryIndex:
+        """Return the file index, opening it if needed."""
+        if self._index is None:
+            self._index = LibraryIndex(self.hass.config.path(INDEX_FILE))
+            self._indexed = self._index.completed
+        return self._index
+    
+    def _start_scan(self, incremental: bool) -> "_ScanRun":
+        """Set up the walk of a new scan."""
+        _LOGGER.info(f"Starting to scan for duplicate video files (incremental: {incremental})")
+        
+        # Size and filename -> file paths, spilled to disk beyond the memory budget
+        file_map = ExternalGrouper(self.hass.config.path(SPILL_DIR), self.memory_budget * 1024 * 1024)
+        
+        # The previous scan tells roughly how many files to expect
+        index = self._open_index()
+        progress = ScanProgress(self.hass, self.progress_signal, index.count_files() or None)
+        progress.update(force=True)
+        
+        run = _ScanRun(file_map, progress, index.begin_scan())
+        run.directories = itertools.chain.from_iterable(
+            self._walk(root_path, incremental, run.scan_id) for root_path in self._get_root_paths()
+        )
+        return run
+    
+    def _walk_batch(self, run: "_ScanRun") -> bool:
+        """Walk directories for up to WALK_BATCH_SECONDS.
+        
+        Returns True once every directory has been read, and False when the
+        time is up or the scan was paused. The listings read are committed
+        to the file index at the end of each batch.
+        """
+        deadline = time.monotonic() + WALK_BATCH_SECONDS
+        for root, listing, reused in run.directories:
+            run.total_files += listing.file_count
+            run.reused_dirs += reused
+            run.progress.advance(len(listing.video_files), directories=1)
             
+            for file, size in zip(listing.video_files, listing.video_sizes):
+                run.video_files += 1
+                
+                # Copies share their size as well as their name; the size comes
+                # from the directory listing, so this costs no extra stat
+                if size == 0:
+                    continue
+                filename_without_ext = os.path.splitext(file)[0]
+                full_path = os.path.join(root, file)
+                
+                run.file_map.add(f"{size}:{filename_without_ext}", full_path)
+                
+                # Log progress occasionally
+                if run.video_files % 1000 == 0:
+                    _LOGGER.info(f"Processed {run.video_files} video files so far...")
+            
+            if not self._running.is_set() or time.monotonic() >= deadline:
+                self._open_index().commit()
+                return False
+        self._open_index().commit()
+        return True
+    
+    def _finish_walk(self, run: "_ScanRun") -> List[List[str]]:
+        """Group the walked files into candidate sets of the same size and name."""
+        self._open_index().finish_scan(run.scan_id)
+        self._indexed = True
+        _LOGGER.info(
+            f"Scan completed. Processed {run.total_files} total files, {run.video_files} video files "
+            f"({run.reused_dirs} unchanged directories reused)"
+        )
+        
+        # Filter results to only include files with duplicates
+        try:
+            return [paths for name, paths in run.file_map.groups()]
+        finally:
+            run.file_map.close()
+    
+    def _check_file(self, path: str, verify: bool) -> Dict[str, Any]:
+        """Compare a file with the indexed files of the same size."""
+        st = os.stat(path)
+        result: Dict[str, Any] = {
+            "path": path,
+            "size": st.st_size,
+            "duplicate": False,
+            "confirmed": False,
+            "matches": [],
+        }
+        # Empty files are never reported as duplicates
+        candidates = [p for p in self._open_index().find_by_size(st.st_size) if p != path] if st.st_size else []
+        if not candidates:
+            return result
+        
+        digest = self._partial_digest(path, st)
+        full_digest = None
+        for candidate in candidates:
+            try:
+                candidate_st = os.stat(candidate)
+            except OSError:
+                continue
+            # Skip replaced files and hard links to the file itself
+            if candidate_st.st_size != st.st_size:
+                continue
+            if (candidate_st.st_dev, candidate_st.st_ino) == (st.st_dev, st.st_ino):
+                continue
+            if self._partial_digest(candidate, candidate_st) != digest:
+                continue
+            if verify and st.st_size > PARTIAL_HASH_SIZE:
+                if full_digest is None:
+                    full_digest = self._file_digest(path)
+                if self._file_digest(candidate) != full_digest:
+                    continue
+            result["matches"].append(candidate)
+        
+        self._open_index().commit()
+        result["duplicate"] = bool(result["matches"])
+        result["confirmed"] = result["duplicate"] and (verify or st.st_size <= PARTIAL_HASH_SIZE)
+        return result
+    
+    def _partial_digest(self, path: str, st: os.stat_result) -> str:
+        """MD5 of the first PARTIAL_HASH_SIZE bytes, cached while the file is unchanged.
+        
+        Recently used digests are kept in memory and the digests of indexed
+        files in the file index, so they survive restarts.
+        """
+        with self._partial_lock:
+            cached = self._partial_cache.get(path)
+            if cached is not None and cached[:2] == (st.st_size, st.st_mtime_ns):
+                self._partial_cache.move_to_end(path)
+                return cached[2]
+        index = self._open_index()
+        digest = index.get_partial_hash(path, st.st_size, st.st_mtime_ns)
+        if digest is None:
+            with open(path, "rb") as f:
+                digest = hashlib.md5(f.read(PARTIAL_HASH_SIZE)).hexdigest()
+            index.put_partial_hash(path, st.st_size, st.st_mtime_ns, digest)
+        with self._partial_lock:
+            self._partial_cache[path] = (st.st_size, st.st_mtime_ns, digest)
+            self._partial_cache.move_to_end(path)
+            # Drop the least recently used digests
+            while len(self._partial_cache) > PARTIAL_CACHE_SIZE:
+                self._partial_cache.popitem(last=False)
+        return digest
+    
+    @staticmethod
+    def _file_digest(path: str) -> str:
+        """MD5 of a whole file."""
+        hash_md5 = hashlib.md5()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hash_md5.update(chunk)
+        return hash_md5.hexdigest()
+    
+    def _walk(self, root_path: str, incremental: bool, scan_id: int) -> Iterator[Tuple[str, DirListing, bool]]:
+        """Walk a directory tree yielding (directory, listing, reused) tuples.
+        
+        Every listing is stored in the file index under ``scan_id``. In
+        incremental mode a directory whose mtime matches the previous scan
+        is not listed again; its stored subdirectories and video files are
+        used, with the sizes of the video files checked again.
+        """
+        index = self._open_index()
+        _LOGGER.info(f"Scanning {root_path}")
+        stack = [root_path]
+        while stack:
+            root = stack.pop()
             try:
-                for root, dirs, files in os.walk(root_path):
-                    # Skip directories that are not accessible
-                    if not os.access(root, os.R_OK):
-                        _LOGGER.debug(f"Skipping inaccessible directory: {root}")
+                mtime_ns = os.stat(root).st_mtime_ns
+            except OSError as e:
+                _LOGGER.debug(f"Skipping unreadable directory {root}: {e}")
+                continue
+            
+            stored = index.get_listing(root) if incremental else None
+            reused = stored is not None and stored[0] == mtime_ns
+            if reused:
+                stored_mtime, subdirs, file_count, files = stored
+                listing = self._refresh_listing(root, DirListing(
+                    stored_mtime, subdirs, [f[0] for f in files], file_count, [f[1] for f in files], [f[2] for f in files]
+                ))
+            else:
+                listing = self._list_directory(root, mtime_ns)
+                if listing is None:
+                    continue
+            
+            index.put_listing(
+                scan_id, root, listing.mtime_ns, listing.subdirs, listing.file_count,
+                list(zip(listing.video_files, listing.video_sizes, listing.video_mtimes)),
+            )
+            stack.extend(os.path.join(root, d) for d in reversed(listing.subdirs))
+            yield root, listing, reused
+    
+    @staticmethod
+    def _refresh_listing(root: str, listing: DirListing) -> DirListing:
+        """Stat the video files of a reused listing again.
+        
+        Rewriting a file in place does not change the mtime of its directory,
+        so cached sizes are only kept for files whose size and mtime still
+        match; files that are gone or became links are dropped. The stats
+        are taken from the entries of a single listing of the directory
+        instead of one lookup per path.
+        """
+        wanted = set(listing.video_files)
+        stats: Dict[str, os.stat_result] = {}
+        try:
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    if entry.name not in wanted or entry.is_symlink():
                         continue
-                    
-                    # Skip system directories that might cause issues
-                    if any(d.startswith(('.', '$', 'System Volume Information')) for d in root.split(os.sep)):
+                    try:
+                        stats[entry.name] = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+        except OSError as e:
+            _LOGGER.debug(f"Could not list {root} again: {e}")
+        names = [name for name in listing.video_files if name in stats]
+        return listing._replace(
+            video_files=names,
+            video_sizes=[stats[name].st_size for name in names],
+            video_mtimes=[stats[name].st_mtime_ns for name in names],
+        )
+    
+    def _list_directory(self, root: str, mtime_ns: int) -> Optional[DirListing]:
+        """Read a directory, keeping only subdirectories to descend and video files."""
+        # Skip directories that are not accessible
+        if not os.access(root, os.R_OK):
+            _LOGGER.debug(f"Skipping inaccessible directory: {root}")
+            return None
+        
+        subdirs: List[str] = []
+        video_files: List[str] = []
+        video_sizes: List[int] = []
+        video_mtimes: List[int] = []
+        file_count = 0
+        try:
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if is_dir:
+                        # Skip system directories that might cause issues
+                        if not entry.name.startswith(SKIP_DIR_PREFIXES):
+                            subdirs.append(entry.name)
                         continue
-                        
-                    for file in files:
-                        total_files += 1
-                        
-                        # Only process video files
-                        _, ext = os.path.splitext(file.lower())
-                        if ext not in VIDEO_EXTENSIONS:
-                            continue
-                            
-                        video_files += 1
-                        
-                        # Use the filename (without extension) as key for duplicate detection
-                        filename_without_ext = os.path.splitext(file)[0]
-                        full_path = os.path.join(root, file)
-                        
-                        if filename_without_ext in file_map:
-                            file_map[filename_without_ext].append(full_path)
-                        else:
-                            file_map[filename_without_ext] = [full_path]
-                        
-                        # Log progress occasionally
-                        if video_files % 1000 == 0:
-                            _LOGGER.info(f"Processed {video_files} video files so far...")
                     
-            except PermissionError as e:
-                _LOGGER.warning(f"Permission error accessing {root}: {e}")
-            except Exception as e:
-                _LOGGER.error(f"Error scanning {root}: {e}")
-                
-        _LOGGER.info(f"Scan completed. Processed {total_files} total files, {video_files} video files")
+                    file_count += 1
+                    
+                    # Only keep video files; links are skipped so their size is
+                    # never taken from the link itself
+                    _, ext = os.path.splitext(entry.name.lower())
+                    if ext in VIDEO_EXTENSIONS:
+                        try:
+                            if entry.is_symlink():
+                                continue
+                            st = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        video_files.append(entry.name)
+                        video_sizes.append(st.st_size)
+                        video_mtimes.append(st.st_mtime_ns)
+        except PermissionError as e:
+            _LOGGER.warning(f"Permission error accessing {root}: {e}")
+            return None
+        except Exception as e:
+            _LOGGER.error(f"Error scanning {root}: {e}")
+            return None
         
-        # Filter results to only include files with duplicates
-        duplicates = [paths for name, paths in file_map.items() if len(paths) > 1]
-        _LOGGER.info(f"Found {len(duplicates)} sets of duplicate videos")
+        return DirListing(mtime_ns, subdirs, video_files, file_count, video_sizes, video_mtimes)
+    
+    def _split_by_metadata(
+        self, candidates: List[List[str]], progress: Optional[ScanProgress] = None
+    ) -> List[List[str]]:
+        """Split candidate sets by container metadata read from file headers.
+        
+        Files whose container is not supported are kept together in their
+        original set.
+        """
+        duplicates = []
+        for paths in candidates:
+            by_signature: Dict[str, List[str]] = {}
+            for path in paths:
+                signature = metadata_signature(read_metadata(path)) or "unknown"
+                by_signature.setdefault(signature, []).append(path)
+                if progress is not None:
+                    progress.advance()
+            duplicates.extend(group for group in by_signature.values() if len(group) > 1)
+        return duplicates
+    
+    def _split_by_partial_digest(
+        self, candidates: List[List[str]], progress: Optional[ScanProgress] = None
+    ) -> List[List[str]]:
+        """Split candidate sets by the digest of their first PARTIAL_HASH_SIZE bytes.
         
+        Hard links to the same file are collapsed to their first path, as
+        removing one frees no space. Files are read on the scanner's own
+        executor, two at a time. Files that can no longer be read are
+        dropped.
+        """
+        def digest(file: Tuple[str, os.stat_result]) -> Optional[str]:
+            path, st = file
+            try:
+                return self._partial_digest(path, st)
+            except OSError as e:
+                _LOGGER.debug(f"Skipping unreadable file {path}: {e}")
+                return None
+        
+        duplicates = []
+        for paths in candidates:
+            unique: Dict[Tuple[int, int], Tuple[str, os.stat_result]] = {}
+            for path in paths:
+                try:
+                    st = os.stat(path)
+                except OSError as e:
+                    _LOGGER.debug(f"Skipping unreadable file {path}: {e}")
+                    continue
+                unique.setdefault((st.st_dev, st.st_ino), (path, st))
+            files = list(unique.values()) if len(unique) > 1 else []
+            if progress is not None:
+                progress.advance(len(paths) - len(files))
+            
+            by_digest: Dict[str, List[str]] = {}
+            for (path, _), path_digest in zip(files, self._executor.map(digest, files)):
+                if progress is not None:
+                    progress.advance()
+                if path_digest is not None:
+                    by_digest.setdefault(path_digest, []).append(path)
+            duplicates.extend(group for group in by_digest.values() if len(group) > 1)
         return duplicates
     
     def _get_root_paths(self) -> List[str]:
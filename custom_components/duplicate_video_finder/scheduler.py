@@ -0,0 +1,187 @@
+"""Scheduled off-peak scans for the Duplicate Video Finder integration."""
+import logging
+from datetime import datetime, time, timedelta
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN, STATE_PAUSED, STATE_SCANNING
+
+_LOGGER = logging.getLogger(__name__)
+
+# (name, minimum, maximum) for the five cron fields
+CRON_FIELDS = [
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day of month", 1, 31),
+    ("month", 1, 12),
+    ("day of week", 0, 6),
+]
+
+
+class CronSchedule:
+    """Minimal five-field cron expression (minute hour day month weekday).
+
+    Supports ``*``, lists (``1,15``), ranges (``1-5``) and steps (``*/10``).
+    Day of week uses 0 or 7 for Sunday.
+    """
+
+    def __init__(self, expression: str):
+        """Parse the expression, raising ValueError if it is invalid."""
+        parts = expression.split()
+        if len(parts) != len(CRON_FIELDS):
+            raise ValueError(f"Expected 5 cron fields, got {len(parts)}")
+        self.expression = expression
+        self._fields: List[Set[int]] = [
+            self._parse_field(part, name, low, high)
+            for part, (name, low, high) in zip(parts, CRON_FIELDS)
+        ]
+        # Like cron, a day field starting with ``*`` counts as unrestricted
+        # when combining day of month and day of week, even with a step
+        self._any_day = parts[2].startswith("*")
+        self._any_weekday = parts[4].startswith("*")
+
+    @staticmethod
+    def _parse_field(part: str, name: str, low: int, high: int) -> Set[int]:
+        # Explicit days of week may use 7 for Sunday
+        limit = 7 if name == "day of week" else high
+        values: Set[int] = set()
+        for item in part.split(","):
+            step = 1
+            if "/" in item:
+                item, step_text = item.split("/", 1)
+                step = int(step_text)
+                if step < 1:
+                    raise ValueError(f"Invalid step in {name} field")
+            if item == "*":
+                # Steps count from the field's minimum, so */2 is every odd
+                # day of the month and every other weekday from Sunday
+                start, end = low, high
+            elif "-" in item:
+                start_text, end_text = item.split("-", 1)
+                start, end = int(start_text), int(end_text)
+            else:
+                start = int(item)
+                end = limit if step > 1 else start
+            if start < low or end > limit or start > end:
+                raise ValueError(f"Value out of range in {name} field: {item}")
+            values.update(range(start, end + 1, step))
+        if 7 in values and name == "day of week":
+            values = (values - {7}) | {0}
+        return values
+
+    def matches(self, when: datetime) -> bool:
+        """Return True if the schedule fires in the minute of ``when``."""
+        minutes, hours, days, months, weekdays = self._fields
+        if when.minute not in minutes or when.hour not in hours or when.month not in months:
+            return False
+        day_match = when.day in days
+        # Python weekday() has Monday as 0, cron has Sunday as 0
+        weekday_match = (when.weekday() + 1) % 7 in weekdays
+        # Like cron, a restricted day of month and day of week match either
+        if not self._any_day and not self._any_weekday:
+            return day_match or weekday_match
+        return day_match and weekday_match
+
+
+def parse_time_window(start: str, end: str) -> Optional[Tuple[time, time]]:
+    """Parse "HH:MM" window bounds, returning None if no window is set.
+
+    A window that starts when it ends would never be open, so it is rejected.
+    """
+    if not start and not end:
+        return None
+    if not start or not end:
+        raise ValueError("Both window start and end are required")
+    window = time.fromisoformat(start), time.fromisoformat(end)
+    if window[0] == window[1]:
+        raise ValueError("Window start and end must differ")
+    return window
+
+
+def in_time_window(now: time, window: Optional[Tuple[time, time]]) -> bool:
+    """Return True if ``now`` falls inside the (possibly overnight) window."""
+    if window is None:
+        return True
+    start, end = window
+    if start <= end:
+        return start <= now < end
+    return now >= start or now < end
+
+
+class ScanScheduler:
+    """Start scans on a cron schedule and keep them inside a time window.
+
+    Scheduled scans run in incremental mode. A scheduled scan that is still
+    running when the window closes is paused and resumed when it reopens. A
+    schedule that fires while another scan runs starts its scan once that
+    scan has finished.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        entry_id: str,
+        start_scan: Callable[[], Awaitable[None]],
+        schedule: Optional[CronSchedule],
+        window: Optional[Tuple[time, time]],
+    ):
+        """Initialize the scheduler."""
+        self.hass = hass
+        self.entry_id = entry_id
+        self._start_scan = start_scan
+        self.schedule = schedule
+        self.window = window
+        self._last_fired: Optional[datetime] = None
+        self._pending = False
+        self._unsub: Optional[Callable[[], None]] = None
+
+    @callback
+    def async_start(self) -> None:
+        """Start checking the schedule once a minute."""
+        self._unsub = async_track_time_interval(
+            self.hass, self._async_tick, timedelta(minutes=1)
+        )
+
+    @callback
+    def async_stop(self) -> None:
+        """Stop the scheduler."""
+        if self._unsub is not None:
+            self._unsub()
+            self._unsub = None
+
+    @callback
+    def _async_tick(self, now: datetime) -> None:
+        """Fire due scans and pause or resume scheduled scans."""
+        data = self.hass.data[DOMAIN].get(self.entry_id)
+        if data is None:
+            return
+
+        local_now = dt_util.as_local(now).replace(second=0, microsecond=0)
+        inside = in_time_window(local_now.time(), self.window)
+
+        running = data["state"] in (STATE_SCANNING, STATE_PAUSED)
+        if self.schedule is not None and local_now != self._last_fired and self.schedule.matches(local_now):
+            self._last_fired = local_now
+            self._pending = True
+            if running and not data.get("scheduled"):
+                _LOGGER.info("A scan is already running, the scheduled scan starts once it has finished")
+
+        if data.get("scheduled") and running:
+            scanner = data["scanner"]
+            if inside and data["state"] == STATE_PAUSED:
+                _LOGGER.info("Scan window opened, resuming scheduled scan")
+                scanner.resume()
+                data["state"] = STATE_SCANNING
+            elif not inside and data["state"] == STATE_SCANNING:
+                _LOGGER.info("Scan window closed, pausing scheduled scan")
+                scanner.pause()
+                data["state"] = STATE_PAUSED
+            return
+
+        if self._pending and inside and not running:
+            self._pending = False
+            _LOGGER.info("Starting scheduled scan")
+            self.hass.async_create_task(self._start_scan())
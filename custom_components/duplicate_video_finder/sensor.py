@@ -6,10 +6,19 @@ from typing import Any, Callable, Dict, List, Optional
 from homeassistant.components.sensor import SensorEntity
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.update_coordinator import UpdateCoordinator
 
-from .const import DOMAIN, EVENT_SCAN_COMPLETED, EVENT_SCAN_ERROR, STATE_IDLE, STATE_SCANNING
+from .const import (
+    DOMAIN,
+    EVENT_SCAN_COMPLETED,
+    EVENT_SCAN_ERROR,
+    SIGNAL_SCAN_PROGRESS,
+    STATE_IDLE,
+    STATE_SCANNING,
+    STATE_PAUSED,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -35,7 +44,8 @@ class DuplicateVideoFinderSensor(SensorEntity):
         self._attr_extra_state_attributes = {
             "duplicates": [],
             "last_scan": None,
-            "scan_state": STATE_IDLE
+            "scan_state": STATE_IDLE,
+            "progress": None,
         }
         
     async def async_added_to_hass(self) -> None:
@@ -53,6 +63,23 @@ class DuplicateVideoFinderSensor(SensorEntity):
         self.async_on_remove(
             self.hass.bus.async_listen(EVENT_SCAN_ERROR, handle_scan_event)
         )
+        
+        # Progress is rate limited by the scanner, so every update is written
+        @callback
+        def handle_progress(progress: Dict[str, Any]) -> None:
+            """Handle a progress update from the scan thread."""
+            domain_data = self.hass.data[DOMAIN].get(self.entry_id, {})
+            self._attr_extra_state_attributes.update({
+                "scan_state": domain_data.get("state", STATE_IDLE),
+                "progress": progress,
+            })
+            self.async_write_ha_state()
+        
+        self.async_on_remove(
+            async_dispatcher_connect(
+                self.hass, SIGNAL_SCAN_PROGRESS.format(self.entry_id), handle_progress
+            )
+        )
 
     @property
     def state(self) -> str:
@@ -62,6 +89,8 @@ class DuplicateVideoFinderSensor(SensorEntity):
         
         if scan_state == STATE_SCANNING:
             return "scanning"
+        if scan_state == STATE_PAUSED:
+            return "paused"
         
         duplicates = domain_data.get("duplicates", [])
         return str(len(duplicates))
@@ -92,5 +121,6 @@ class DuplicateVideoFinderSensor(SensorEntity):
         self._attr_extra_state_attributes.update({
             "duplicates": formatted_duplicates,
             "last_scan": self.hass.states.get("sensor.date_time").state,
-            "scan_state": domain_data.get("state", STATE_IDLE)
+            "scan_state": domain_data.get("state", STATE_IDLE),
+            "progress": None,
         })
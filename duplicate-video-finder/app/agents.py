@@ -0,0 +1,379 @@
+"""Scans spread over several hosts.
+
+Agents walk and hash their local disks and report a compact index (size,
+inode, mtime and any digests) to a coordinator add-on, so file contents
+never cross the network. The coordinator merges the indexes of all agents
+and tells each one which of its files collide with files elsewhere and
+need a partial or full digest; agents hash only those and report back.
+The coordinator's own library takes part as the agent ``local``.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from hashing import PARTIAL_HASH_SIZE, get_file_hash, get_partial_hash
+from index import FileIndex
+from state_store import StateStore
+from walker import initial_frontier, scan_directory
+
+logger = logging.getLogger("duplicate_video_finder")
+
+# Files per upload request
+BATCH_SIZE = 5000
+
+# Seconds between polls of the coordinator for new work
+POLL_SECONDS = 30
+
+# Seconds to wait for a coordinator response
+REQUEST_TIMEOUT = 60
+
+# Agent name the coordinator reports its own library under
+LOCAL_AGENT = "local"
+
+
+class AgentRegistry:
+    """Merged file indexes reported by the agents (coordinator side).
+
+    Reports are kept in tables of the state store, so every API worker sees
+    the reports any of them received, and they survive restarts. Files are
+    indexed by size. A report only marks the sizes it touched, and the
+    digests needed and duplicates found are recomputed for those sizes
+    alone in the report's transaction, so the cost of a report does not
+    grow with the number of files other agents reported and reading the
+    plans never writes. Files only the coordinator's own library has are
+    not compared; its duplicates are already in the scan results.
+    """
+
+    def __init__(self, store: StateStore):
+        """Create the registry tables in ``store`` if needed."""
+        self.store = store
+        with self.store.transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS agents (name TEXT PRIMARY KEY, last_report REAL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS agent_files ("
+                "agent TEXT, path TEXT, size INTEGER, inode INTEGER, mtime_ns INTEGER, "
+                "partial_hash TEXT, full_hash TEXT, PRIMARY KEY (agent, path)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS agent_files_size ON agent_files (size)")
+            # Sizes whose files changed since their plan was computed
+            conn.execute("CREATE TABLE IF NOT EXISTS agent_dirty (size INTEGER PRIMARY KEY)")
+            # Digests needed and duplicate sets, by the size they were planned for
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS agent_needed ("
+                "agent TEXT, kind TEXT, path TEXT, size INTEGER, PRIMARY KEY (agent, kind, path)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS agent_needed_size ON agent_needed (size)")
+            conn.execute("CREATE TABLE IF NOT EXISTS agent_duplicates (name TEXT PRIMARY KEY, size INTEGER, paths TEXT)")
+            conn.execute("CREATE INDEX IF NOT EXISTS agent_duplicates_size ON agent_duplicates (size)")
+
+    @staticmethod
+    def _touch(conn: sqlite3.Connection, agent: str, paths: Iterable[str]) -> None:
+        """Mark the sizes of an agent's stored files as changed."""
+        conn.executemany(
+            "INSERT OR IGNORE INTO agent_dirty (size) "
+            "SELECT size FROM agent_files WHERE agent = ? AND path = ? AND size > 0",
+            ((agent, path) for path in paths),
+        )
+
+    def add_files(self, agent: str, rows: List[List[Any]], reset: bool = False) -> None:
+        """Store files reported by an agent.
+
+        Rows are ``[path, size, inode, mtime_ns, partial_hash, full_hash]``.
+        With ``reset`` the agent's previous report is discarded first.
+        """
+        with self.store.transaction() as conn:
+            if reset:
+                conn.execute(
+                    "INSERT OR IGNORE INTO agent_dirty (size) "
+                    "SELECT DISTINCT size FROM agent_files WHERE agent = ? AND size > 0",
+                    (agent,),
+                )
+                conn.execute("DELETE FROM agent_files WHERE agent = ?", (agent,))
+            self._touch(conn, agent, (row[0] for row in rows))
+            conn.executemany(
+                "INSERT OR REPLACE INTO agent_files (agent, path, size, inode, mtime_ns, partial_hash, full_hash) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((agent, *row) for row in rows),
+            )
+            self._touch(conn, agent, (row[0] for row in rows))
+            conn.execute("INSERT OR REPLACE INTO agents (name, last_report) VALUES (?, ?)", (agent, time.time()))
+            self._compute(conn)
+
+    def add_digests(
+        self, agent: str, partial: Dict[str, str], full: Dict[str, str], missing: List[str]
+    ) -> None:
+        """Store digests computed by an agent and forget files it no longer has."""
+        with self.store.transaction() as conn:
+            for column, digests in (("partial_hash", partial), ("full_hash", full)):
+                conn.executemany(
+                    f"UPDATE agent_files SET {column} = ? WHERE agent = ? AND path = ?",
+                    ((digest, agent, path) for path, digest in digests.items()),
+                )
+                self._touch(conn, agent, digests)
+            self._touch(conn, agent, missing)
+            conn.executemany("DELETE FROM agent_files WHERE agent = ? AND path = ?", ((agent, path) for path in missing))
+            conn.execute("UPDATE agents SET last_report = ? WHERE name = ?", (time.time(), agent))
+            self._compute(conn)
+
+    def _compute(self, conn: sqlite3.Connection) -> None:
+        """Recompute the plans of the sizes whose files changed."""
+        sizes = [row[0] for row in conn.execute("SELECT size FROM agent_dirty")]
+        # Drop all outdated plans first, a file may have moved between sizes
+        for size in sizes:
+            conn.execute("DELETE FROM agent_needed WHERE size = ?", (size,))
+            conn.execute("DELETE FROM agent_duplicates WHERE size = ?", (size,))
+        for size in sizes:
+            members = [
+                (agent, path, {"partial_hash": partial_hash, "full_hash": full_hash})
+                for agent, path, partial_hash, full_hash in conn.execute(
+                    "SELECT agent, path, partial_hash, full_hash FROM agent_files WHERE size = ? ORDER BY agent, path",
+                    (size,),
+                )
+            ]
+            if len(members) < 2 or self._local_only(members):
+                continue
+            needed, duplicates = self._plan(size, members)
+            conn.executemany(
+                "INSERT OR REPLACE INTO agent_needed (agent, kind, path, size) VALUES (?, ?, ?, ?)",
+                ((agent, kind, path, size) for agent, kind, path in needed),
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO agent_duplicates (name, size, paths) VALUES (?, ?, ?)",
+                ((name, size, json.dumps(paths)) for name, paths in duplicates.items()),
+            )
+        conn.execute("DELETE FROM agent_dirty")
+
+    def _plan(
+        self, size: int, members: List[Tuple[str, str, Dict[str, Any]]]
+    ) -> Tuple[List[Tuple[str, str, str]], Dict[str, List[str]]]:
+        """Find the digests needed and the duplicates among files of one size."""
+        needed: List[Tuple[str, str, str]] = []
+        duplicates: Dict[str, List[str]] = {}
+        by_partial: Dict[str, List[Tuple[str, str, Dict[str, Any]]]] = {}
+        for agent, path, entry in members:
+            if entry["partial_hash"] is None:
+                needed.append((agent, "partial", path))
+            else:
+                by_partial.setdefault(entry["partial_hash"], []).append((agent, path, entry))
+        for partial_hash, group in by_partial.items():
+            if len(group) < 2 or self._local_only(group):
+                continue
+            # Files no larger than the partial window are already fully hashed
+            if size <= PARTIAL_HASH_SIZE:
+                self._add_duplicate(duplicates, group, partial_hash)
+                continue
+            by_full: Dict[str, List[Tuple[str, str, Dict[str, Any]]]] = {}
+            for agent, path, entry in group:
+                if entry["full_hash"] is None:
+                    needed.append((agent, "full", path))
+                else:
+                    by_full.setdefault(entry["full_hash"], []).append((agent, path, entry))
+            for full_hash, same in by_full.items():
+                if len(same) > 1:
+                    self._add_duplicate(duplicates, same, full_hash)
+        return needed, duplicates
+
+    @staticmethod
+    def _local_only(group: List[Tuple[str, str, Dict[str, Any]]]) -> bool:
+        """Return True if a group only holds files of the coordinator's own library."""
+        return all(agent == LOCAL_AGENT for agent, _, _ in group)
+
+    @staticmethod
+    def _add_duplicate(
+        duplicates: Dict[str, List[str]], group: List[Tuple[str, str, Dict[str, Any]]], digest: str
+    ) -> None:
+        paths = [f"{agent}:{path}" for agent, path, _ in group]
+        duplicates[f"{os.path.basename(group[0][1])}_{digest[:8]}"] = paths
+
+    def needed(self, agent: str) -> Dict[str, List[str]]:
+        """Return the paths an agent should hash next."""
+        needed: Dict[str, List[str]] = {"partial": [], "full": []}
+        with self.store.snapshot() as conn:
+            for kind, path in conn.execute(
+                "SELECT kind, path FROM agent_needed WHERE agent = ? ORDER BY kind, path", (agent,)
+            ):
+                needed[kind].append(path)
+        return needed
+
+    def reported(self, agent: str, paths: Iterable[str]) -> Dict[str, List[Any]]:
+        """Return the stored rows of an agent's files, by path."""
+        with self.store.snapshot() as conn:
+            rows = {}
+            for path in paths:
+                row = conn.execute(
+                    "SELECT path, size, inode, mtime_ns, partial_hash, full_hash FROM agent_files "
+                    "WHERE agent = ? AND path = ?",
+                    (agent, path),
+                ).fetchone()
+                if row is not None:
+                    rows[path] = list(row)
+        return rows
+
+    def duplicates(self) -> Dict[str, List[str]]:
+        """Return duplicate sets across all agents, paths as ``agent:path``."""
+        with self.store.snapshot() as conn:
+            return {
+                name: json.loads(paths)
+                for name, paths in conn.execute("SELECT name, paths FROM agent_duplicates ORDER BY name")
+            }
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Describe the agents that have reported so far."""
+        with self.store.snapshot() as conn:
+            files = dict(conn.execute("SELECT agent, COUNT(*) FROM agent_files GROUP BY agent"))
+            pending = dict(conn.execute("SELECT agent, COUNT(*) FROM agent_needed GROUP BY agent"))
+            agents = conn.execute("SELECT name, last_report FROM agents ORDER BY name").fetchall()
+        return [
+            {
+                "name": agent,
+                "files": files.get(agent, 0),
+                "last_report": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(last_report)),
+                "pending_digests": pending.get(agent, 0),
+            }
+            for agent, last_report in agents
+        ]
+
+
+def _post(url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+        return json.loads(response.read())
+
+
+def _rows(paths: Iterable[str], index: FileIndex) -> Iterator[List[Any]]:
+    """Build the rows to report for files, with the digests the index holds."""
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        cached = index.get(path, st) or {}
+        yield [
+            path, st.st_size, st.st_ino, st.st_mtime_ns,
+            cached.get("partial_hash"), cached.get("full_hash"),
+        ]
+
+
+def _collect(scan_paths: List[str], exclude_paths: List[str], index: FileIndex) -> Dict[str, List[Any]]:
+    """Walk the local paths and build the rows to report, by path."""
+    files = {}
+    frontier = initial_frontier(scan_paths)
+    while frontier:
+        subdirs, video_files = scan_directory(frontier.pop(), exclude_paths)
+        frontier.extend(subdirs)
+        for row in _rows(video_files, index):
+            files[row[0]] = row
+    return files
+
+
+def _hash_needed(needed: Dict[str, List[str]], reported: Dict[str, List[Any]], index: FileIndex) -> Dict[str, Any]:
+    """Compute the digests the coordinator asked for."""
+    report: Dict[str, Any] = {"partial": {}, "full": {}, "missing": []}
+    for kind, compute in (("partial", get_partial_hash), ("full", get_file_hash)):
+        for path in needed.get(kind, []):
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+            known = reported.get(path)
+            # Changed files are reported again on the next walk
+            if st is None or known is None or (st.st_size, st.st_mtime_ns) != (known[1], known[3]):
+                report["missing"].append(path)
+                continue
+            digest = compute(index, path, st)
+            if digest is None:
+                report["missing"].append(path)
+            else:
+                report[kind][path] = digest
+    index.commit()
+    return report
+
+
+def report_local(registry: AgentRegistry, paths: Iterable[Iterable[str]], index: FileIndex) -> None:
+    """Merge the coordinator's own library into the registry.
+
+    ``paths`` are the files of a completed scan in batches; they replace the
+    previous report of the library. The digests this calls for are left to
+    ``hash_local``.
+    """
+    reset = True
+    for batch in paths:
+        registry.add_files(LOCAL_AGENT, list(_rows(batch, index)), reset=reset)
+        reset = False
+    if reset:
+        registry.add_files(LOCAL_AGENT, [], reset=True)
+
+
+def hash_local(registry: AgentRegistry, index: FileIndex) -> int:
+    """Compute the digests of the coordinator's own files that agents' reports call for.
+
+    Returns the number of digests computed.
+    """
+    computed = 0
+    needed = registry.needed(LOCAL_AGENT)
+    while needed["partial"] or needed["full"]:
+        report = _hash_needed(needed, registry.reported(LOCAL_AGENT, needed["partial"] + needed["full"]), index)
+        registry.add_digests(LOCAL_AGENT, report["partial"], report["full"], report["missing"])
+        computed += len(report["partial"]) + len(report["full"])
+        needed = registry.needed(LOCAL_AGENT)
+    return computed
+
+
+def run_agent(
+    coordinator: str,
+    name: str,
+    scan_paths: List[str],
+    exclude_paths: List[str],
+    index: FileIndex,
+    interval: float = 3600,
+    once: bool = False,
+) -> None:
+    """Report the local index to a coordinator and hash what it asks for.
+
+    The local paths are walked again every ``interval`` seconds. In between,
+    the coordinator is polled for work caused by other agents' reports. With
+    ``once`` the agent returns as soon as the coordinator needs nothing more.
+    """
+    base = f"{coordinator.rstrip('/')}/api/agents/{name}"
+    while True:
+        try:
+            logger.info(f"Walking {scan_paths} for coordinator {coordinator}")
+            files = _collect(scan_paths, exclude_paths, index)
+            index.prune(scan_paths, files)
+            rows = list(files.values())
+            for start in range(0, max(len(rows), 1), BATCH_SIZE):
+                _post(f"{base}/files", {"reset": start == 0, "files": rows[start:start + BATCH_SIZE]})
+            logger.info(f"Reported {len(rows)} files to {coordinator}")
+
+            deadline = time.monotonic() + interval
+            needed = _post(f"{base}/digests", {})
+            while True:
+                if needed.get("partial") or needed.get("full"):
+                    logger.info(
+                        f"Hashing {len(needed.get('partial', []))} partial and "
+                        f"{len(needed.get('full', []))} full digests for the coordinator"
+                    )
+                    needed = _post(f"{base}/digests", _hash_needed(needed, files, index))
+                    continue
+                if once:
+                    return
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(POLL_SECONDS)
+                needed = _post(f"{base}/digests", {})
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            if once:
+                raise
+            logger.error(f"Error talking to coordinator {coordinator}: {e}")
+            time.sleep(POLL_SECONDS)
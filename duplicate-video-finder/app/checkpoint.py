@@ -0,0 +1,125 @@
+"""On-disk checkpoints that let an interrupted scan be resumed."""
+
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger("duplicate_video_finder")
+
+# Minimum number of seconds between two periodic checkpoint writes
+CHECKPOINT_INTERVAL = 30.0
+
+# Number of paths read back from the file list at a time
+FILES_BATCH_SIZE = 10000
+
+
+class ScanCheckpoint:
+    """Periodically persisted snapshot of a running scan.
+
+    The snapshot is a JSON document holding the scan parameters, the current
+    stage, the walker frontier and the number of files found so far. Digests
+    computed before the interruption are not duplicated here; they live in
+    the file index, which is committed before every checkpoint write.
+
+    The files found are appended to a list next to the snapshot, one JSON
+    string per line, so each write only costs as much as the files found
+    since the previous one.
+    """
+
+    def __init__(self, path: str, interval: float = CHECKPOINT_INTERVAL):
+        """Initialize the checkpoint file location."""
+        self.path = path
+        self.files_path = f"{path}.files"
+        self.interval = interval
+        self._last_save = 0.0
+        self._summary: Optional[Dict[str, Any]] = None
+        self._summary_loaded = False
+
+    def is_due(self) -> bool:
+        """Return True if the periodic save interval has elapsed."""
+        return time.monotonic() - self._last_save >= self.interval
+
+    def save(self, state: Dict[str, Any]) -> None:
+        """Atomically write the scan state to disk."""
+        state["saved_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        tmp_path = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write scan checkpoint to {self.path}: {e}")
+        self._last_save = time.monotonic()
+        self._summary = self._summarize(state)
+        self._summary_loaded = True
+
+    def add_files(self, paths: List[str]) -> None:
+        """Append files found by the walk to the file list."""
+        try:
+            with open(self.files_path, "a") as f:
+                f.writelines(f"{json.dumps(path)}\n" for path in paths)
+        except OSError as e:
+            logger.warning(f"Could not write scan file list to {self.files_path}: {e}")
+
+    def read_files(self) -> Iterator[List[str]]:
+        """Yield the paths of the file list in batches."""
+        try:
+            with open(self.files_path, "r") as f:
+                batch = []
+                for line in f:
+                    batch.append(json.loads(line))
+                    if len(batch) >= FILES_BATCH_SIZE:
+                        yield batch
+                        batch = []
+                if batch:
+                    yield batch
+        except FileNotFoundError:
+            return
+
+    def files(self) -> List[str]:
+        """Return all paths of the file list."""
+        return [path for batch in self.read_files() for path in batch]
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Return the last saved scan state, or None if there is none."""
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable scan checkpoint {self.path}: {e}")
+            return None
+
+    def summary(self) -> Optional[Dict[str, Any]]:
+        """Describe the saved scan without its frontier and file lists."""
+        if not self._summary_loaded:
+            self._summary = self._summarize(self.load())
+            self._summary_loaded = True
+        return self._summary
+
+    @staticmethod
+    def _summarize(state: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if state is None:
+            return None
+        return {
+            "stage": state.get("stage"),
+            "saved_at": state.get("saved_at"),
+            "params": state.get("params", {}),
+            "files_found": state.get("listed_files", 0),
+        }
+
+    def clear(self) -> None:
+        """Remove the checkpoint and its file list."""
+        self._summary = None
+        self._summary_loaded = True
+        for path in (self.path, self.files_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not remove scan checkpoint {path}: {e}")
@@ -0,0 +1,434 @@
+"""Content-defined chunking to find videos that share part of their content.
+
+Files are cut into variable-size chunks with a FastCDC-style gear hash, so
+chunk boundaries follow the content and survive insertions such as an extra
+intro or a re-muxed header. Only files that could plausibly overlap are
+chunked: files of the same format and a similar duration, and files
+sharing a head digest with a file of another size. Chunk digests go into an
+on-disk index, from which the overlap between files and the space
+block-level deduplication would save are computed.
+"""
+
+import bisect
+import hashlib
+import logging
+import os
+import random
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from container import read_metadata
+from index import FileIndex
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, the gear hash falls back to pure Python
+    numpy = None
+
+logger = logging.getLogger("duplicate_video_finder")
+
+# Chunk size bounds; boundaries are normalized towards the average size
+MIN_CHUNK = 256 * 1024
+AVG_CHUNK = 1024 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+
+# Record size of the fixed blocks used to estimate ZFS and btrfs dedup
+# savings: the ZFS default recordsize and the duperemove default block size
+DEDUP_BLOCK = 128 * 1024
+
+# Bytes read from a file at a time
+READ_SIZE = 8 * 1024 * 1024
+
+# Bytes gear-hashed at once with numpy, small enough for the temporary
+# arrays to stay in the CPU cache
+HASH_SEGMENT = 64 * 1024
+
+# Files of the same format are overlap candidates when their durations (or
+# sizes, without metadata) differ by at most this share
+CANDIDATE_TOLERANCE = 0.25
+
+# Bytes of every stored chunk and block digest
+DIGEST_SIZE = 16
+
+# Share of the smaller file two files must have in common to be reported
+DEFAULT_MIN_OVERLAP = 0.5
+
+# Maximum number of overlapping pairs reported
+MAX_PAIRS = 1000
+
+# Bumped whenever the chunker changes, which invalidates stored chunks
+CHUNKER_VERSION = 1
+
+_MASK64 = (1 << 64) - 1
+
+# Number of trailing bytes the gear hash depends on
+_WINDOW = 64
+
+# Gear table; fixed so chunk digests stay comparable across runs
+_rng = random.Random(0x6765617248617368)
+_GEAR = [_rng.getrandbits(64) for _ in range(256)]
+del _rng
+
+# Normalized chunking: a stricter mask below the average size makes small
+# chunks rarer, a looser one above it makes large chunks rarer
+_AVG_BITS = AVG_CHUNK.bit_length() - 1
+_MASK_SMALL = ((1 << (_AVG_BITS + 2)) - 1) << (64 - _AVG_BITS - 2)
+_MASK_LARGE = ((1 << (_AVG_BITS - 2)) - 1) << (64 - _AVG_BITS + 2)
+
+
+if numpy is not None:
+    _GEAR_ARRAY = numpy.array(_GEAR, dtype=numpy.uint64)
+
+
+def _boundaries(data: bytearray, skip: int) -> Tuple[List[int], List[int]]:
+    """Return the offsets after ``skip`` in ``data`` where a chunk may end.
+
+    An offset is listed when the gear hash of the bytes before it passes the
+    strict mask (first list) or the loose one (second list). The hash only
+    depends on the last 64 bytes, so it is the same whichever chunk the
+    offset ends; the bytes before ``skip`` serve as context.
+    """
+    if numpy is None:
+        return _boundaries_python(data, skip)
+    small: List[int] = []
+    large: List[int] = []
+    for begin in range(skip, len(data), HASH_SEGMENT):
+        context = max(begin - (_WINDOW - 1), 0)
+        end = min(begin + HASH_SEGMENT, len(data))
+        h = _GEAR_ARRAY[numpy.frombuffer(data, numpy.uint8, end - context, context)]
+        # Sum the shifted gear values of each window by doubling its length
+        shift = 1
+        while shift < _WINDOW:
+            h[shift:] += h[:-shift] << numpy.uint64(shift)
+            shift *= 2
+        h = h[begin - context:]
+        loose = numpy.flatnonzero((h & numpy.uint64(_MASK_LARGE)) == 0)
+        strict = loose[(h[loose] & numpy.uint64(_MASK_SMALL)) == 0]
+        large.extend((loose + begin + 1).tolist())
+        small.extend((strict + begin + 1).tolist())
+    return small, large
+
+
+def _boundaries_python(data: bytearray, skip: int) -> Tuple[List[int], List[int]]:
+    gear = _GEAR
+    small: List[int] = []
+    large: List[int] = []
+    h = 0
+    for i in range(max(skip - (_WINDOW - 1), 0), skip):
+        h = ((h << 1) + gear[data[i]]) & _MASK64
+    for i in range(skip, len(data)):
+        h = ((h << 1) + gear[data[i]]) & _MASK64
+        if not h & _MASK_LARGE:
+            large.append(i + 1)
+            if not h & _MASK_SMALL:
+                small.append(i + 1)
+    return small, large
+
+
+def _cut_point(small: List[int], large: List[int], start: int, length: int) -> int:
+    """Return the length of the chunk at ``start`` with ``length`` bytes left.
+
+    ``small`` and ``large`` are the sorted chunk ends found by ``_boundaries``.
+    """
+    if length <= MIN_CHUNK:
+        return length
+    limit = min(length, MAX_CHUNK)
+    normal = min(limit, AVG_CHUNK)
+    i = bisect.bisect_right(small, start + MIN_CHUNK)
+    if i < len(small) and small[i] <= start + normal:
+        return small[i] - start
+    i = bisect.bisect_right(large, start + normal)
+    if i < len(large) and large[i] <= start + limit:
+        return large[i] - start
+    return limit
+
+
+def _digest(data: Any) -> bytes:
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).digest()
+
+
+def _count(counts: Dict[bytes, List[int]], digest: bytes, length: int) -> None:
+    entry = counts.get(digest)
+    if entry is None:
+        counts[digest] = [length, 1]
+    else:
+        entry[1] += 1
+
+
+def _count_blocks(blocks: Dict[bytes, List[int]], pending: bytearray, data: bytes) -> None:
+    """Count the whole dedup blocks in ``pending`` plus ``data``, keeping the rest."""
+    pending += data
+    whole = len(pending) - len(pending) % DEDUP_BLOCK
+    view = memoryview(pending)
+    for start in range(0, whole, DEDUP_BLOCK):
+        _count(blocks, _digest(view[start:start + DEDUP_BLOCK]), DEDUP_BLOCK)
+    view.release()
+    del pending[:whole]
+
+
+def chunk_file(file_path: str) -> Tuple[Dict[bytes, List[int]], Dict[bytes, List[int]]]:
+    """Cut a file into content-defined chunks and fixed dedup blocks.
+
+    Returns two dicts mapping digests to ``[length, occurrences]``: one for
+    the chunks and one for the ``DEDUP_BLOCK`` sized blocks a filesystem
+    would deduplicate. Raises OSError if the file cannot be read.
+    """
+    chunks: Dict[bytes, List[int]] = {}
+    blocks: Dict[bytes, List[int]] = {}
+    buffer = bytearray()
+    pending = bytearray()
+    # Chunk ends found in the buffer so far, relative to its start
+    small: List[int] = []
+    large: List[int] = []
+    eof = False
+    with open(file_path, "rb") as f:
+        while not eof:
+            data = f.read(READ_SIZE)
+            if data:
+                buffer += data
+                found = _boundaries(buffer, len(buffer) - len(data))
+                small += found[0]
+                large += found[1]
+                _count_blocks(blocks, pending, data)
+            else:
+                eof = True
+            # A chunk is only cut once MAX_CHUNK bytes are buffered, so its
+            # boundary never depends on where a read ended
+            view = memoryview(buffer)
+            consumed = 0
+            while len(buffer) - consumed >= MAX_CHUNK or (eof and consumed < len(buffer)):
+                cut = _cut_point(small, large, consumed, len(buffer) - consumed)
+                _count(chunks, _digest(view[consumed:consumed + cut]), cut)
+                consumed += cut
+            view.release()
+            del buffer[:consumed]
+            small = [end - consumed for end in small[bisect.bisect_right(small, consumed):]]
+            large = [end - consumed for end in large[bisect.bisect_right(large, consumed):]]
+    if pending:
+        _count(blocks, _digest(pending), len(pending))
+    return chunks, blocks
+
+
+class ChunkIndex:
+    """SQLite store of the chunk and dedup block digests of every file.
+
+    Digests are kept as 16 byte blobs in ``WITHOUT ROWID`` tables, one row
+    per distinct digest and file with its number of occurrences. Files are
+    keyed by path and validated by size, mtime and inode, so unchanged files
+    are never chunked twice.
+    """
+
+    def __init__(self, db_path: str):
+        """Open (and create if needed) the chunk database."""
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Could not open chunk index at {db_path}, using in-memory index: {e}")
+            self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self._ensure_schema()
+
+    def _ensure_schema(self) -> None:
+        with self._lock:
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != CHUNKER_VERSION:
+                for table in ("chunk_files", "chunks", "blocks"):
+                    self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+                self._conn.execute(f"PRAGMA user_version = {CHUNKER_VERSION}")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_files ("
+                "id INTEGER PRIMARY KEY, path TEXT UNIQUE, size INTEGER, mtime_ns INTEGER, inode INTEGER)"
+            )
+            for table in ("chunks", "blocks"):
+                self._conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ("
+                    "digest BLOB, file_id INTEGER, length INTEGER, count INTEGER, "
+                    "PRIMARY KEY (digest, file_id)) WITHOUT ROWID"
+                )
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_file ON {table} (file_id)")
+            self._conn.commit()
+
+    def file_id(self, path: str, st: os.stat_result) -> Optional[int]:
+        """Return the id of a file whose chunks are stored and still current."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, size, mtime_ns, inode FROM chunk_files WHERE path = ?", (path,)
+            ).fetchone()
+        if row is None or tuple(row[1:]) != (st.st_size, st.st_mtime_ns, st.st_ino):
+            return None
+        return row[0]
+
+    def store(
+        self,
+        path: str,
+        st: os.stat_result,
+        chunks: Dict[bytes, List[int]],
+        blocks: Dict[bytes, List[int]],
+    ) -> int:
+        """Replace the stored chunks of a file and return its id."""
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM chunk_files WHERE path = ?", (path,)).fetchone()
+            if row is not None:
+                for table in ("chunks", "blocks"):
+                    self._conn.execute(f"DELETE FROM {table} WHERE file_id = ?", (row[0],))
+                self._conn.execute("DELETE FROM chunk_files WHERE id = ?", (row[0],))
+            file_id = self._conn.execute(
+                "INSERT INTO chunk_files (path, size, mtime_ns, inode) VALUES (?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime_ns, st.st_ino),
+            ).lastrowid
+            for table, digests in (("chunks", chunks), ("blocks", blocks)):
+                self._conn.executemany(
+                    f"INSERT INTO {table} (digest, file_id, length, count) VALUES (?, ?, ?, ?)",
+                    ((digest, file_id, length, count) for digest, (length, count) in digests.items()),
+                )
+            self._conn.commit()
+        return file_id
+
+    def overlaps(self, file_ids: Iterable[int], min_overlap: float = DEFAULT_MIN_OVERLAP) -> List[Dict[str, Any]]:
+        """Find pairs of files sharing at least ``min_overlap`` of the smaller one.
+
+        Byte-identical pairs are left out; they are plain duplicates.
+        """
+        with self._lock:
+            self._select(file_ids)
+            rows = self._conn.execute(
+                "SELECT fa.path, fa.size, fb.path, fb.size, shared FROM ("
+                "  SELECT a.file_id AS id_a, b.file_id AS id_b, SUM(a.length * MIN(a.count, b.count)) AS shared"
+                "  FROM chunks a JOIN chunks b ON a.digest = b.digest AND a.file_id < b.file_id"
+                "  WHERE a.file_id IN (SELECT id FROM selected) AND b.file_id IN (SELECT id FROM selected)"
+                "  GROUP BY a.file_id, b.file_id"
+                ") JOIN chunk_files fa ON fa.id = id_a JOIN chunk_files fb ON fb.id = id_b"
+                " WHERE shared >= ? * MIN(fa.size, fb.size) AND NOT (shared = fa.size AND shared = fb.size)"
+                " ORDER BY shared DESC LIMIT ?",
+                (min_overlap, MAX_PAIRS),
+            ).fetchall()
+        return [
+            {
+                "paths": [path_a, path_b],
+                "sizes": [size_a, size_b],
+                "shared_bytes": shared,
+                "overlap": [round(shared / size_a, 4), round(shared / size_b, 4)],
+            }
+            for path_a, size_a, path_b, size_b, shared in rows
+        ]
+
+    def savings(self, file_ids: Iterable[int]) -> Dict[str, int]:
+        """Estimate the bytes deduplication would free among the given files.
+
+        ``chunks`` is what variable-size deduplication could reach, ``blocks``
+        what ZFS or btrfs deduplicating ``DEDUP_BLOCK`` records would save.
+        """
+        result = {}
+        with self._lock:
+            self._select(file_ids)
+            for table in ("chunks", "blocks"):
+                result[table] = self._conn.execute(
+                    f"SELECT COALESCE(SUM(length * (total - 1)), 0) FROM ("
+                    f"  SELECT MAX(length) AS length, SUM(count) AS total FROM {table}"
+                    f"  WHERE file_id IN (SELECT id FROM selected) GROUP BY digest HAVING total > 1"
+                    f")"
+                ).fetchone()[0]
+        return result
+
+    def _select(self, file_ids: Iterable[int]) -> None:
+        self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS selected (id INTEGER PRIMARY KEY)")
+        self._conn.execute("DELETE FROM selected")
+        self._conn.executemany("INSERT OR IGNORE INTO selected (id) VALUES (?)", ((i,) for i in file_ids))
+
+    def close(self) -> None:
+        """Close the database."""
+        self._conn.close()
+
+
+def overlap_candidates(
+    file_index: FileIndex, file_paths: List[str]
+) -> List[Tuple[str, os.stat_result]]:
+    """Return the files that could share most of their content with another.
+
+    Candidates have the same container, codec and resolution as another file
+    and a duration within ``CANDIDATE_TOLERANCE`` of it (or the same
+    extension and a similar size when their metadata cannot be read), or
+    share the head digest a content scan stored with a file of another
+    size. Files smaller than two minimum chunks are left out; they cannot
+    share a chunk with a file of different content.
+    """
+    files: List[Tuple[str, os.stat_result]] = []
+    by_format: Dict[Tuple[Any, ...], List[Tuple[float, int]]] = {}
+    by_head: Dict[Tuple[str, str], List[int]] = {}
+    for path in file_paths:
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            logger.error(f"Error reading {path}: {e}")
+            continue
+        if st.st_size < 2 * MIN_CHUNK:
+            continue
+        meta = file_index.get_or_compute(path, st, "meta", lambda: read_metadata(path) or {})
+        if meta and meta.get("duration"):
+            key = (meta.get("container"), meta.get("codec"), meta.get("width"), meta.get("height"))
+            length = meta["duration"]
+        else:
+            key = (os.path.splitext(path)[1].lower(),)
+            length = st.st_size
+        by_format.setdefault(key, []).append((length, len(files)))
+        cached = file_index.get(path, st) or {}
+        for column in ("partial_hash", "payload_partial_hash"):
+            if cached.get(column):
+                by_head.setdefault((column, cached[column]), []).append(len(files))
+        files.append((path, st))
+
+    selected = set()
+    for members in by_format.values():
+        # Sorted by length, a file has a close match if its neighbour is one
+        members.sort()
+        for (length_a, a), (length_b, b) in zip(members, members[1:]):
+            if length_b <= length_a * (1 + CANDIDATE_TOLERANCE):
+                selected.update((a, b))
+    for members in by_head.values():
+        if len({files[i][1].st_size for i in members}) > 1:
+            selected.update(members)
+    return [files[i] for i in sorted(selected)]
+
+
+def find_overlaps(
+    index: ChunkIndex,
+    file_index: FileIndex,
+    file_paths: List[str],
+    status: Dict[str, Any],
+    min_overlap: float = DEFAULT_MIN_OVERLAP,
+) -> Dict[str, Any]:
+    """Chunk the candidate files and report overlapping pairs and dedup savings.
+
+    Files chunked by an earlier run are reused while unchanged.
+    """
+    status["stage"] = "chunking"
+    candidates = overlap_candidates(file_index, file_paths)
+    logger.info(f"Chunking {len(candidates)} of {len(file_paths)} files that could overlap")
+    status["total_files"] = len(candidates)
+    status["processed_files"] = 0
+    file_ids = []
+    chunked = 0
+    for path, st in candidates:
+        status["processed_files"] += 1
+        try:
+            file_id = index.file_id(path, st)
+            if file_id is None:
+                chunks, blocks = chunk_file(path)
+                file_id = index.store(path, st, chunks, blocks)
+                chunked += 1
+        except OSError as e:
+            logger.error(f"Error chunking {path}: {e}")
+            continue
+        file_ids.append(file_id)
+        if status["processed_files"] % 100 == 0:
+            logger.info(f"Chunked {status['processed_files']}/{len(candidates)} files")
+
+    logger.info(f"Chunked {chunked} files, reused the chunks of {len(file_ids) - chunked}")
+    return {
+        "pairs": index.overlaps(file_ids, min_overlap),
+        "savings": index.savings(file_ids),
+        "files": len(file_ids),
+    }
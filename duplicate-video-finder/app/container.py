@@ -0,0 +1,390 @@
+"""Lightweight MP4 and Matroska container parsing.
+
+Only box/element headers are read; everything that is not needed is skipped
+by seeking, so extracting metadata costs a few KB of I/O per file.
+"""
+
+import logging
+import struct
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("duplicate_video_finder")
+
+MP4_EXTENSIONS = {".mp4", ".m4v", ".mov", ".3gp"}
+MKV_EXTENSIONS = {".mkv", ".webm"}
+
+# Upper bound for any single box/element we read into memory
+MAX_ELEMENT_READ = 1024 * 1024
+
+# MP4 container boxes that hold other boxes we care about
+_MP4_CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+# Matroska element IDs
+EBML_HEADER = 0x1A45DFA3
+EBML_DOCTYPE = 0x4282
+MKV_SEGMENT = 0x18538067
+MKV_SEEKHEAD = 0x114D9B74
+MKV_SEEK = 0x4DBB
+MKV_SEEK_ID = 0x53AB
+MKV_SEEK_POSITION = 0x53AC
+MKV_INFO = 0x1549A966
+MKV_TIMECODE_SCALE = 0x2AD7B1
+MKV_DURATION = 0x4489
+MKV_TRACKS = 0x1654AE6B
+MKV_TRACK_ENTRY = 0xAE
+MKV_TRACK_TYPE = 0x83
+MKV_CODEC_ID = 0x86
+MKV_VIDEO = 0xE0
+MKV_PIXEL_WIDTH = 0xB0
+MKV_PIXEL_HEIGHT = 0xBA
+MKV_CLUSTER = 0x1F43B675
+
+# Map container specific codec identifiers onto a common name so that the
+# same stream muxed into MP4 and Matroska produces the same signature
+CODEC_ALIASES = {
+    "avc1": "h264", "avc3": "h264", "V_MPEG4/ISO/AVC": "h264",
+    "hvc1": "hevc", "hev1": "hevc", "V_MPEGH/ISO/HEVC": "hevc",
+    "av01": "av1", "V_AV1": "av1",
+    "vp08": "vp8", "V_VP8": "vp8",
+    "vp09": "vp9", "V_VP9": "vp9",
+    "mp4v": "mpeg4", "V_MPEG4/ISO/ASP": "mpeg4",
+    "mp2v": "mpeg2", "V_MPEG2": "mpeg2",
+}
+
+
+def read_metadata(file_path: str) -> Optional[Dict[str, Any]]:
+    """Read duration, track count, resolution and codec from a video header.
+
+    Returns None for unsupported containers or files that cannot be parsed.
+    """
+    lower = file_path.lower()
+    try:
+        with open(file_path, "rb") as f:
+            if any(lower.endswith(ext) for ext in MP4_EXTENSIONS):
+                return _read_mp4_metadata(f)
+            if any(lower.endswith(ext) for ext in MKV_EXTENSIONS):
+                return _read_mkv_metadata(f)
+    except (OSError, struct.error, ValueError) as e:
+        logger.debug(f"Could not read container metadata from {file_path}: {e}")
+    return None
+
+
+def payload_ranges(file_path: str) -> Optional[List[Tuple[int, int]]]:
+    """Locate the media payload of a video as a list of (start, end) offsets.
+
+    For MP4 these are the ``mdat`` boxes, for Matroska the Clusters. Tags,
+    chapters, ``udta`` and other metadata fall outside the returned ranges.
+    Returns None if the container is unsupported or has no payload.
+    """
+    lower = file_path.lower()
+    try:
+        with open(file_path, "rb") as f:
+            if any(lower.endswith(ext) for ext in MP4_EXTENSIONS):
+                ranges = [
+                    (start, end)
+                    for box_type, start, end in iter_mp4_boxes(f, 0, _file_size(f))
+                    if box_type == b"mdat"
+                ]
+            elif any(lower.endswith(ext) for ext in MKV_EXTENSIONS):
+                ranges = _mkv_cluster_ranges(f)
+            else:
+                return None
+    except (OSError, struct.error, ValueError) as e:
+        logger.debug(f"Could not locate payload in {file_path}: {e}")
+        return None
+    return ranges or None
+
+
+def metadata_signature(meta: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Build a compact key that identical videos are guaranteed to share."""
+    if not meta:
+        return None
+    return "{duration}s_{tracks}t_{width}x{height}_{codec}".format(
+        duration=int(round(meta.get("duration") or 0)),
+        tracks=meta.get("tracks", 0),
+        width=meta.get("width", 0),
+        height=meta.get("height", 0),
+        codec=meta.get("codec") or "unknown",
+    )
+
+
+def _file_size(f: BinaryIO) -> int:
+    f.seek(0, 2)
+    size = f.tell()
+    f.seek(0)
+    return size
+
+
+# ---------------------------------------------------------------------------
+# MP4 / ISO base media file format
+# ---------------------------------------------------------------------------
+
+def iter_mp4_boxes(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """Yield (type, payload_start, payload_end) for each box in a range."""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        header_size = 8
+        if size == 1:
+            large = f.read(8)
+            if len(large) < 8:
+                return
+            size = struct.unpack(">Q", large)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size:
+            raise ValueError(f"Invalid MP4 box size {size} at offset {offset}")
+        yield box_type, offset + header_size, min(offset + size, end)
+        offset += size
+
+
+def _read_payload(f: BinaryIO, start: int, end: int, limit: int = MAX_ELEMENT_READ) -> bytes:
+    f.seek(start)
+    return f.read(min(end - start, limit))
+
+
+def _read_mp4_metadata(f: BinaryIO) -> Optional[Dict[str, Any]]:
+    file_size = _file_size(f)
+    for box_type, start, end in iter_mp4_boxes(f, 0, file_size):
+        if box_type == b"moov":
+            return _parse_moov(f, start, end)
+    return None
+
+
+def _parse_moov(f: BinaryIO, start: int, end: int) -> Dict[str, Any]:
+    meta: Dict[str, Any] = {
+        "container": "mp4", "duration": 0.0, "tracks": 0,
+        "width": 0, "height": 0, "codec": None,
+    }
+    for box_type, box_start, box_end in iter_mp4_boxes(f, start, end):
+        if box_type == b"mvhd":
+            data = _read_payload(f, box_start, box_end, 32)
+            # Version 1 boxes hold 64-bit times; truncated boxes are skipped
+            if len(data) >= 32 and data[0] == 1:
+                timescale, duration = struct.unpack(">IQ", data[20:32])
+            elif len(data) >= 20 and data[0] != 1:
+                timescale, duration = struct.unpack(">II", data[12:20])
+            else:
+                continue
+            if timescale:
+                meta["duration"] = duration / timescale
+        elif box_type == b"trak":
+            meta["tracks"] += 1
+            track = _parse_trak(f, box_start, box_end)
+            if track.get("handler") == b"vide" and not meta["codec"]:
+                meta["width"] = track.get("width", 0)
+                meta["height"] = track.get("height", 0)
+                meta["codec"] = track.get("codec")
+    return meta
+
+
+def _parse_trak(f: BinaryIO, start: int, end: int) -> Dict[str, Any]:
+    track: Dict[str, Any] = {}
+    for box_type, box_start, box_end in iter_mp4_boxes(f, start, end):
+        if box_type == b"tkhd":
+            data = _read_payload(f, box_start, box_end, 96)
+            offset = 88 if data[:1] == b"\x01" else 76
+            if len(data) >= offset + 8:
+                width, height = struct.unpack(">II", data[offset:offset + 8])
+                track["width"] = width >> 16
+                track["height"] = height >> 16
+        elif box_type == b"hdlr" and "handler" not in track:
+            data = _read_payload(f, box_start, box_end, 12)
+            track["handler"] = data[8:12]
+        elif box_type == b"stsd":
+            data = _read_payload(f, box_start, box_end, 16)
+            if len(data) >= 16:
+                fourcc = data[12:16].decode("latin-1").strip()
+                track["codec"] = CODEC_ALIASES.get(fourcc, fourcc)
+        elif box_type in _MP4_CONTAINERS:
+            for key, value in _parse_trak(f, box_start, box_end).items():
+                track.setdefault(key, value)
+    return track
+
+
+# ---------------------------------------------------------------------------
+# Matroska / WebM (EBML)
+# ---------------------------------------------------------------------------
+
+def _read_vint(f: BinaryIO, keep_marker: bool) -> Tuple[Optional[int], int]:
+    """Read an EBML variable length integer, returning (value, length).
+
+    A value of None means "unknown size" (all data bits set).
+    """
+    first = f.read(1)
+    if not first:
+        raise ValueError("Unexpected end of file")
+    byte = first[0]
+    mask = 0x80
+    length = 1
+    while length <= 8 and not byte & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise ValueError("Invalid EBML variable length integer")
+    value = byte if keep_marker else byte & (mask - 1)
+    all_ones = (byte & (mask - 1)) == mask - 1
+    rest = f.read(length - 1)
+    if len(rest) < length - 1:
+        raise ValueError("Unexpected end of file")
+    for b in rest:
+        value = (value << 8) | b
+        all_ones = all_ones and b == 0xFF
+    if not keep_marker and all_ones:
+        return None, length
+    return value, length
+
+
+def iter_ebml_elements(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[int, int, int]]:
+    """Yield (element_id, data_start, data_end) for each element in a range."""
+    offset = start
+    while offset < end:
+        f.seek(offset)
+        try:
+            element_id, id_len = _read_vint(f, keep_marker=True)
+            size, size_len = _read_vint(f, keep_marker=False)
+        except ValueError:
+            return
+        data_start = offset + id_len + size_len
+        data_end = end if size is None else min(data_start + size, end)
+        yield element_id, data_start, data_end
+        if size is None:
+            return
+        offset = data_end
+
+
+def _ebml_uint(data: bytes) -> int:
+    return int.from_bytes(data, "big") if data else 0
+
+
+def _ebml_float(data: bytes) -> float:
+    if len(data) == 4:
+        return struct.unpack(">f", data)[0]
+    if len(data) == 8:
+        return struct.unpack(">d", data)[0]
+    return 0.0
+
+
+def _find_mkv_segment(f: BinaryIO) -> Optional[Tuple[int, int]]:
+    """Return the data range of the Segment of a Matroska/WebM file."""
+    file_size = _file_size(f)
+    for element_id, start, end in iter_ebml_elements(f, 0, file_size):
+        if element_id == EBML_HEADER:
+            doc_type = None
+            for child_id, child_start, child_end in iter_ebml_elements(f, start, end):
+                if child_id == EBML_DOCTYPE:
+                    doc_type = _read_payload(f, child_start, child_end, 16).rstrip(b"\x00")
+            if doc_type not in (b"matroska", b"webm"):
+                return None
+        elif element_id == MKV_SEGMENT:
+            return start, end
+    return None
+
+
+def _mkv_cluster_ranges(f: BinaryIO) -> List[Tuple[int, int]]:
+    segment = _find_mkv_segment(f)
+    if segment is None:
+        return []
+    return [
+        (start, end)
+        for element_id, start, end in iter_ebml_elements(f, *segment)
+        if element_id == MKV_CLUSTER
+    ]
+
+
+def _read_mkv_metadata(f: BinaryIO) -> Optional[Dict[str, Any]]:
+    segment = _find_mkv_segment(f)
+    if segment is None:
+        return None
+
+    meta: Dict[str, Any] = {
+        "container": "mkv", "duration": 0.0, "tracks": 0,
+        "width": 0, "height": 0, "codec": None,
+    }
+    seek_positions: Dict[int, int] = {}
+    found = set()
+    seg_start, seg_end = segment
+
+    for element_id, start, end in iter_ebml_elements(f, seg_start, seg_end):
+        if element_id == MKV_SEEKHEAD:
+            seek_positions.update(_parse_seekhead(f, start, end))
+        elif element_id == MKV_INFO:
+            _parse_info(f, start, end, meta)
+            found.add(MKV_INFO)
+        elif element_id == MKV_TRACKS:
+            _parse_tracks(f, start, end, meta)
+            found.add(MKV_TRACKS)
+        elif element_id == MKV_CLUSTER:
+            break
+        if found == {MKV_INFO, MKV_TRACKS}:
+            return meta
+
+    # Info or Tracks stored after the media data: follow the SeekHead
+    for wanted in {MKV_INFO, MKV_TRACKS} - found:
+        if wanted not in seek_positions:
+            continue
+        for element_id, start, end in iter_ebml_elements(f, seg_start + seek_positions[wanted], seg_end):
+            if element_id == MKV_INFO:
+                _parse_info(f, start, end, meta)
+            elif element_id == MKV_TRACKS:
+                _parse_tracks(f, start, end, meta)
+            break
+    return meta
+
+
+def _parse_seekhead(f: BinaryIO, start: int, end: int) -> Dict[int, int]:
+    positions = {}
+    for element_id, seek_start, seek_end in iter_ebml_elements(f, start, end):
+        if element_id != MKV_SEEK:
+            continue
+        seek_id = position = None
+        for child_id, child_start, child_end in iter_ebml_elements(f, seek_start, seek_end):
+            data = _read_payload(f, child_start, child_end, 8)
+            if child_id == MKV_SEEK_ID:
+                seek_id = _ebml_uint(data)
+            elif child_id == MKV_SEEK_POSITION:
+                position = _ebml_uint(data)
+        if seek_id is not None and position is not None:
+            positions[seek_id] = position
+    return positions
+
+
+def _parse_info(f: BinaryIO, start: int, end: int, meta: Dict[str, Any]) -> None:
+    timecode_scale = 1000000
+    duration = 0.0
+    for element_id, child_start, child_end in iter_ebml_elements(f, start, end):
+        if element_id == MKV_TIMECODE_SCALE:
+            timecode_scale = _ebml_uint(_read_payload(f, child_start, child_end, 8)) or timecode_scale
+        elif element_id == MKV_DURATION:
+            duration = _ebml_float(_read_payload(f, child_start, child_end, 8))
+    meta["duration"] = duration * timecode_scale / 1e9
+
+
+def _parse_tracks(f: BinaryIO, start: int, end: int, meta: Dict[str, Any]) -> None:
+    for element_id, entry_start, entry_end in iter_ebml_elements(f, start, end):
+        if element_id != MKV_TRACK_ENTRY:
+            continue
+        meta["tracks"] += 1
+        track_type = None
+        codec = None
+        width = height = 0
+        for child_id, child_start, child_end in iter_ebml_elements(f, entry_start, entry_end):
+            if child_id == MKV_TRACK_TYPE:
+                track_type = _ebml_uint(_read_payload(f, child_start, child_end, 8))
+            elif child_id == MKV_CODEC_ID:
+                codec = _read_payload(f, child_start, child_end, 64).decode("ascii", "replace").rstrip("\x00")
+            elif child_id == MKV_VIDEO:
+                for video_id, video_start, video_end in iter_ebml_elements(f, child_start, child_end):
+                    if video_id == MKV_PIXEL_WIDTH:
+                        width = _ebml_uint(_read_payload(f, video_start, video_end, 8))
+                    elif video_id == MKV_PIXEL_HEIGHT:
+                        height = _ebml_uint(_read_payload(f, video_start, video_end, 8))
+        if track_type == 1 and not meta["codec"]:
+            meta["codec"] = CODEC_ALIASES.get(codec, codec)
+            meta["width"] = width
+            meta["height"] = height
@@ -0,0 +1,46 @@
+"""Writing scan results in formats for scripts and other tools."""
+
+import csv
+import json
+from typing import Any, Dict, IO, Iterable, List, Optional, Tuple
+
+EXPORT_FORMATS = ("json", "ndjson", "csv")
+
+
+def write_results(
+    stream: IO[str],
+    fmt: str,
+    duplicates: Iterable[Tuple[str, List[str]]],
+    trees: Optional[List[Dict[str, Any]]] = None,
+    extra: Optional[Dict[str, Any]] = None,
+) -> None:
+    """Write duplicate sets to ``stream`` as JSON, NDJSON or CSV.
+
+    JSON is a single document with the sets, the duplicated trees and any
+    ``extra`` results. NDJSON has one set per line and CSV one file per row,
+    so both can be processed as they are read and leave the rest out. Sets
+    are ``(name, paths)`` pairs and are written as they are read, so they
+    never have to be held in memory all at once.
+    """
+    sets = ({"name": name, "count": len(paths), "paths": paths} for name, paths in duplicates)
+    if fmt == "json":
+        # Same layout as json.dump with indent=2, with the sets streamed
+        stream.write('{\n  "duplicates": [')
+        separator = "\n    "
+        for entry in sets:
+            stream.write(separator + json.dumps(entry, indent=2).replace("\n", "\n    "))
+            separator = ",\n    "
+        stream.write("\n  ]" if separator != "\n    " else "]")
+        rest = json.dumps({"trees": trees or [], **(extra or {})}, indent=2)
+        stream.write(",\n" + rest[2:] + "\n")
+    elif fmt == "ndjson":
+        for entry in sets:
+            stream.write(json.dumps(entry, separators=(",", ":")) + "\n")
+    elif fmt == "csv":
+        writer = csv.writer(stream)
+        writer.writerow(["set", "count", "path"])
+        for entry in sets:
+            for path in entry["paths"]:
+                writer.writerow([entry["name"], entry["count"], path])
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
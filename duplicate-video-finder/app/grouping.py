@@ -0,0 +1,236 @@
+"""Grouping of scanned files by key that spills to disk past a memory budget."""
+
+import heapq
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+from operator import itemgetter
+from typing import Any, Dict, Hashable, IO, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("duplicate_video_finder")
+
+# Rough number of bytes a buffered record costs beyond its strings
+RECORD_OVERHEAD = 200
+
+# Maximum number of runs merged at once; more are first merged into larger runs
+MERGE_FAN_IN = 64
+
+
+def _read_run(f: IO[str]) -> Iterator[Tuple[str, Any]]:
+    for line in f:
+        key, value = json.loads(line)
+        yield key, value
+
+
+class ExternalGrouper:
+    """Group ``(key, value)`` records, spilling sorted runs to disk when large.
+
+    Records are grouped in a dict as long as their estimated size stays
+    within ``memory_budget`` bytes. Past that the buffer is sorted by key and
+    written to a run file, and ``groups`` merges all runs so that only one
+    group has to be held at a time. Small libraries therefore never touch the
+    disk, while peak memory for large ones is bounded by the budget.
+
+    The run files and the number of spilled records live in ``state``, which
+    callers may persist to resume grouping after a restart. Runs hold the
+    records in the order they were added, so a resumed grouper only needs
+    the records added after the first ``spilled_records`` again. The buffer
+    itself is never part of the state.
+    """
+
+    def __init__(self, spill_dir: str, memory_budget: int, state: Optional[Dict[str, Any]] = None):
+        """Initialize the grouper, continuing from the runs in ``state`` if given."""
+        self.spill_dir = spill_dir
+        self.memory_budget = memory_budget
+        self.state = state if state is not None else {}
+        self.buffer: Dict[str, List[Any]] = {}
+        self.runs: List[str] = self.state.setdefault("runs", [])
+        self.state.setdefault("spilled_records", 0)
+        self._buffered = 0
+        self._buffer_bytes = 0
+
+    @property
+    def spilled(self) -> bool:
+        """Return True once records have been written to disk."""
+        return bool(self.runs)
+
+    def __len__(self) -> int:
+        return self.state["spilled_records"] + self._buffered
+
+    def _account(self, key: str, value: Any) -> None:
+        self._buffered += 1
+        self._buffer_bytes += RECORD_OVERHEAD + len(key) + len(str(value))
+
+    def add(self, key: str, value: Any) -> None:
+        """Add a record, spilling the buffer if it outgrew the budget."""
+        self.buffer.setdefault(key, []).append(value)
+        self._account(key, value)
+        if self._buffer_bytes > self.memory_budget:
+            self.spill()
+
+    def _new_run(self) -> Tuple[IO[str], str]:
+        os.makedirs(self.spill_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix="run-", suffix=".jsonl", dir=self.spill_dir)
+        return os.fdopen(fd, "w"), path
+
+    def spill(self) -> None:
+        """Write the buffered records to a new sorted run."""
+        if not self.buffer:
+            return
+        f, path = self._new_run()
+        with f:
+            for key in sorted(self.buffer):
+                for value in self.buffer[key]:
+                    f.write(json.dumps([key, value]) + "\n")
+        if not self.runs:
+            logger.info(f"Grouping exceeds the memory budget, spilling to {self.spill_dir}")
+        self.runs.append(path)
+        self.state["spilled_records"] += self._buffered
+        self.buffer.clear()
+        self._buffered = 0
+        self._buffer_bytes = 0
+
+    def _merge(self, runs: List[str]) -> Iterator[Tuple[str, Any]]:
+        files = [open(path, "r") for path in runs]
+        try:
+            yield from heapq.merge(*(_read_run(f) for f in files), key=itemgetter(0))
+        finally:
+            for f in files:
+                f.close()
+
+    def _compact(self) -> None:
+        """Merge runs in batches until all of them can be opened at once."""
+        while len(self.runs) > MERGE_FAN_IN:
+            batch = self.runs[:MERGE_FAN_IN]
+            f, path = self._new_run()
+            with f:
+                for key, value in self._merge(batch):
+                    f.write(json.dumps([key, value]) + "\n")
+            self.runs[:MERGE_FAN_IN] = [path]
+            for run in batch:
+                os.remove(run)
+
+    def groups(self) -> Iterator[Tuple[str, List[Any]]]:
+        """Yield every key that has more than one value, with its values."""
+        if not self.runs:
+            for key, values in self.buffer.items():
+                if len(values) > 1:
+                    yield key, list(values)
+            return
+
+        self.spill()
+        self._compact()
+        for key, records in itertools.groupby(self._merge(self.runs), key=itemgetter(0)):
+            values = [value for _, value in records]
+            if len(values) > 1:
+                yield key, values
+
+    def close(self) -> None:
+        """Remove the run files."""
+        self.buffer.clear()
+        for path in self.runs:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.runs.clear()
+
+
+def spill_groups(spill_dir: str, groups: Iterable[Tuple[str, List[Any]]]) -> str:
+    """Write groups to a new file in ``spill_dir`` and return its path."""
+    os.makedirs(spill_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix="groups-", suffix=".jsonl", dir=spill_dir)
+    with os.fdopen(fd, "w") as f:
+        for key, values in groups:
+            f.write(json.dumps([key, values]) + "\n")
+    return path
+
+
+def read_groups(path: str) -> Iterator[Tuple[str, List[Any]]]:
+    """Yield the groups written by ``spill_groups``."""
+    with open(path, "r") as f:
+        yield from _read_run(f)
+
+
+class CollisionCounter:
+    """Count files per key, holding back the first file of each key.
+
+    Streaming scans forward a file once another file shares its key, so the
+    first file of every key has to be kept until a second one shows up. The
+    first paths and counts are kept in a dict as long as their estimated
+    size stays within ``memory_budget`` bytes, and are moved to a SQLite
+    database in ``spill_dir`` past that. Without a ``spill_dir`` everything
+    stays in memory. Safe to use from several threads.
+    """
+
+    def __init__(self, spill_dir: Optional[str] = None, memory_budget: int = 0):
+        """Initialize an empty counter."""
+        self.spill_dir = spill_dir
+        self.memory_budget = memory_budget
+        # key -> [count, first path]; the path is dropped once forwarded
+        self._groups: Dict[Hashable, List[Any]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_path: Optional[str] = None
+
+    def add(self, key: Hashable, path: str) -> Tuple[int, Optional[str]]:
+        """Count a file under ``key``.
+
+        Returns the number of files seen for the key so far and, when this
+        file is the second one, the path of the held back first file.
+        """
+        with self._lock:
+            if self._conn is not None:
+                return self._add_spilled(json.dumps(key), path)
+            group = self._groups.get(key)
+            if group is None:
+                self._groups[key] = [1, path]
+                self._bytes += RECORD_OVERHEAD + len(path)
+                if self.spill_dir is not None and self._bytes > self.memory_budget:
+                    self._spill()
+                return 1, None
+            group[0] += 1
+            first, group[1] = group[1], None
+            return group[0], first
+
+    def _spill(self) -> None:
+        os.makedirs(self.spill_dir, exist_ok=True)
+        fd, self._db_path = tempfile.mkstemp(prefix="collisions-", suffix=".db", dir=self.spill_dir)
+        os.close(fd)
+        logger.info(f"Collision counts exceed the memory budget, spilling to {self.spill_dir}")
+        self._conn = sqlite3.connect(self._db_path, check_same_thread=False)
+        # Nothing survives a crash anyway, so skip the journal
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute("CREATE TABLE groups (key TEXT PRIMARY KEY, count INTEGER, path TEXT)")
+        self._conn.executemany(
+            "INSERT INTO groups (key, count, path) VALUES (?, ?, ?)",
+            ((json.dumps(key), count, path) for key, (count, path) in self._groups.items()),
+        )
+        self._groups.clear()
+        self._bytes = 0
+
+    def _add_spilled(self, key: str, path: str) -> Tuple[int, Optional[str]]:
+        row = self._conn.execute("SELECT count, path FROM groups WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._conn.execute("INSERT INTO groups (key, count, path) VALUES (?, 1, ?)", (key, path))
+            return 1, None
+        self._conn.execute("UPDATE groups SET count = ?, path = NULL WHERE key = ?", (row[0] + 1, key))
+        return row[0] + 1, row[1]
+
+    def close(self) -> None:
+        """Drop the counts and remove the database."""
+        with self._lock:
+            self._groups.clear()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                try:
+                    os.remove(self._db_path)
+                except OSError:
+                    pass
@@ -0,0 +1,211 @@
+"""Content digests for duplicate detection, cached in the file index."""
+
+import hashlib
+import logging
+import os
+from contextlib import ExitStack
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from container import payload_ranges
+from index import FileIndex
+
+logger = logging.getLogger("duplicate_video_finder")
+
+# Content hash modes: whole file, or only the media payload of MP4/MKV files
+HASH_MODES = {"full", "payload"}
+
+# Number of leading bytes covered by the partial digest
+PARTIAL_HASH_SIZE = 1024 * 1024
+
+# Largest group of same-size candidates that is compared in lockstep instead
+# of being hashed file by file
+LOCKSTEP_MAX_FILES = 3
+
+# Index columns holding the digests of each hash mode
+FULL_COLUMNS = {"full": "full_hash", "payload": "payload_hash"}
+PARTIAL_COLUMNS = {"full": "partial_hash", "payload": "payload_partial_hash"}
+
+
+def _hash_ranges(f: BinaryIO, ranges: List[Tuple[int, int]], chunk_size: int, limit: Optional[int] = None) -> str:
+    """MD5 the given byte ranges of an open file, stopping after ``limit`` bytes."""
+    hash_md5 = hashlib.md5()
+    budget = limit
+    for start, end in ranges:
+        f.seek(start)
+        remaining = end - start
+        if budget is not None:
+            remaining = min(remaining, budget)
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            hash_md5.update(chunk)
+            remaining -= len(chunk)
+            if budget is not None:
+                budget -= len(chunk)
+        if budget is not None and budget <= 0:
+            break
+    return hash_md5.hexdigest()
+
+
+def calculate_file_hash(file_path: str, chunk_size: int = 8192) -> str:
+    """Calculate MD5 hash of a file for content-based duplicate detection."""
+    hash_md5 = hashlib.md5()
+    try:
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                hash_md5.update(chunk)
+        return hash_md5.hexdigest()
+    except Exception as e:
+        logger.error(f"Error hashing file {file_path}: {e}")
+        return "error"
+
+
+def calculate_payload_hash(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Calculate MD5 hash of only the media payload of a video.
+
+    MP4 ``mdat`` boxes and Matroska Clusters are hashed while tags, chapters
+    and other container metadata are skipped by seeking past them, so copies
+    that were only re-tagged produce the same digest. Files without a
+    recognised container fall back to a full file hash.
+    """
+    ranges = payload_ranges(file_path)
+    if not ranges:
+        return calculate_file_hash(file_path, chunk_size)
+
+    try:
+        with open(file_path, "rb") as f:
+            return _hash_ranges(f, ranges, chunk_size)
+    except Exception as e:
+        logger.error(f"Error hashing payload of {file_path}: {e}")
+        return "error"
+
+
+def calculate_partial_hash(file_path: str, hash_mode: str = "full", size: int = PARTIAL_HASH_SIZE) -> str:
+    """Calculate MD5 hash of the first ``size`` bytes of a file or its payload."""
+    ranges = payload_ranges(file_path) if hash_mode == "payload" else None
+    try:
+        with open(file_path, "rb") as f:
+            return _hash_ranges(f, ranges or [(0, size)], size, limit=size)
+    except Exception as e:
+        logger.error(f"Error hashing start of {file_path}: {e}")
+        return "error"
+
+
+def calculate_prefix_hashes(file_path: str, lengths: List[int], chunk_size: int = 1024 * 1024) -> Dict[int, str]:
+    """MD5 the first ``length`` bytes of a file for several lengths in one pass.
+
+    The digest is taken from the running hash state whenever a length is
+    reached, and the state then keeps going to the next length. Lengths past
+    the end of the file are left out. Raises OSError if the file cannot be read.
+    """
+    hash_md5 = hashlib.md5()
+    digests = {}
+    position = 0
+    with open(file_path, "rb") as f:
+        for length in sorted(set(lengths)):
+            while position < length:
+                chunk = f.read(min(chunk_size, length - position))
+                if not chunk:
+                    return digests
+                hash_md5.update(chunk)
+                position += len(chunk)
+            digests[length] = hash_md5.hexdigest()
+    return digests
+
+
+def compare_files(file_paths: List[str], chunk_size: int = 1024 * 1024) -> List[Tuple[str, List[str]]]:
+    """Find identical files among a few same-size files by reading them in lockstep.
+
+    All files are read block by block side by side, and a class of files is
+    split as soon as one of its blocks differs, so files that differ early
+    are barely read. Only one copy of every class is hashed, which yields
+    the digest ``calculate_file_hash`` would return for each member.
+
+    Returns ``(digest, paths)`` for every class of at least two identical
+    files. Raises OSError if a file cannot be read.
+    """
+    with ExitStack() as stack:
+        files = [stack.enter_context(open(path, "rb")) for path in file_paths]
+        classes = [(hashlib.md5(), list(range(len(files))))]
+        identical = []
+        while classes:
+            next_classes = []
+            for hasher, members in classes:
+                blocks: List[Tuple[bytes, List[int]]] = []
+                for member in members:
+                    block = files[member].read(chunk_size)
+                    for seen, same in blocks:
+                        if seen == block:
+                            same.append(member)
+                            break
+                    else:
+                        blocks.append((block, [member]))
+                survivors = [(block, same) for block, same in blocks if len(same) > 1]
+                for block, same in survivors:
+                    # Files of a class that splits share everything read so far
+                    class_hasher = hasher.copy() if len(survivors) > 1 else hasher
+                    if not block:
+                        identical.append((class_hasher.hexdigest(), [file_paths[member] for member in same]))
+                    else:
+                        class_hasher.update(block)
+                        next_classes.append((class_hasher, same))
+            classes = next_classes
+        return identical
+
+
+def get_group_hashes(
+    index: FileIndex, files: List[Tuple[str, os.stat_result]], chunk_size: int = 1024 * 1024
+) -> Dict[str, str]:
+    """Get full content hashes of a small group of same-size files.
+
+    Digests come from the index when all members have one. Otherwise the
+    files are compared in lockstep, and the digests of identical files are
+    stored in the index. Files without a copy in the group are left out.
+    """
+    cached = {}
+    for path, st in files:
+        entry = index.get(path, st)
+        if entry is None or entry["full_hash"] is None:
+            break
+        cached[path] = entry["full_hash"]
+    else:
+        return cached
+
+    try:
+        identical = compare_files([path for path, _ in files], chunk_size)
+    except OSError as e:
+        logger.error(f"Error comparing {', '.join(path for path, _ in files)}: {e}")
+        return {}
+    stats = dict(files)
+    digests = {}
+    for digest, paths in identical:
+        for path in paths:
+            index.put(path, stats[path], full_hash=digest)
+            digests[path] = digest
+    return digests
+
+
+def _cacheable(digest: str) -> Optional[str]:
+    return None if digest == "error" else digest
+
+
+def get_file_hash(
+    index: FileIndex, file_path: str, st: os.stat_result, hash_mode: str = "full", chunk_size: int = 1024 * 1024
+) -> Optional[str]:
+    """Get the full content hash of a file, using the index when it is current."""
+    if hash_mode == "payload":
+        compute = calculate_payload_hash
+    else:
+        compute = calculate_file_hash
+    return index.get_or_compute(
+        file_path, st, FULL_COLUMNS[hash_mode], lambda: _cacheable(compute(file_path, chunk_size))
+    )
+
+
+def get_partial_hash(index: FileIndex, file_path: str, st: os.stat_result, hash_mode: str = "full") -> Optional[str]:
+    """Get the partial hash of a file, using the index when it is current."""
+    return index.get_or_compute(
+        file_path, st, PARTIAL_COLUMNS[hash_mode],
+        lambda: _cacheable(calculate_partial_hash(file_path, hash_mode)),
+    )
@@ -0,0 +1,121 @@
+"""Conditional GET and compression for the JSON API."""
+
+import asyncio
+import gzip
+import hashlib
+import json
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, gzip is always available
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_SIZE = 1024
+
+# Bodies at least this large are compressed in a worker thread, so the event
+# loop keeps serving other requests meanwhile
+EXECUTOR_COMPRESS_SIZE = 64 * 1024
+
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def _weights(accept_encoding: str) -> Dict[str, float]:
+    """Map the codings of an Accept-Encoding header to their q-values."""
+    weights = {}
+    for entry in accept_encoding.split(","):
+        coding, *params = entry.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+    return weights
+
+
+def _encode(request: Request, body: bytes) -> Optional[str]:
+    """Pick the content encoding to use from the client's Accept-Encoding.
+
+    Codings with ``q=0`` are refused; otherwise the highest q-value wins and
+    brotli is preferred on a tie.
+    """
+    if len(body) < MIN_COMPRESS_SIZE:
+        return None
+    weights = _weights(request.headers.get("accept-encoding", ""))
+    default = weights.get("*", 0.0)
+    codings = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best = max(codings, key=lambda coding: weights.get(coding, default))
+    return best if weights.get(best, default) > 0 else None
+
+
+def _serialize(payload: Callable[[], Any]) -> bytes:
+    return json.dumps(payload(), separators=(",", ":")).encode()
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+async def cached_json(
+    request: Request,
+    payload: Callable[[], Any],
+    version: Optional[str] = None,
+) -> Response:
+    """Build a JSON response that supports If-None-Match and compression.
+
+    ``payload`` is only called when a body has to be sent, in a worker
+    thread along with the serialization, so it may query the state store.
+    With a ``version`` the ETag is derived from it, so unchanged data is
+    answered with 304 without serializing anything; otherwise the ETag is a
+    digest of the serialized body. Large bodies are compressed in a worker
+    thread.
+    """
+    loop = asyncio.get_running_loop()
+    body = None
+    if version is None:
+        body = await loop.run_in_executor(None, _serialize, payload)
+        version = hashlib.sha1(body).hexdigest()[:16]
+    # Weak, because the same entity may be sent with different encodings
+    etag = f'W/"{version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+
+    if _matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    if body is None:
+        body = await loop.run_in_executor(None, _serialize, payload)
+    encoding = _encode(request, body)
+    if encoding is not None:
+        if len(body) >= EXECUTOR_COMPRESS_SIZE:
+            body = await loop.run_in_executor(None, _compress, body, encoding)
+        else:
+            body = _compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
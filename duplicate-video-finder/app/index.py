@@ -0,0 +1,203 @@
+"""Persistent per-file index of container metadata and digests."""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger("duplicate_video_finder")
+
+# Cached columns beyond the file identity (path, size, mtime_ns, inode).
+# New columns are added to existing databases on open.
+COLUMNS = {
+    "meta": "TEXT",
+    "full_hash": "TEXT",
+    "payload_hash": "TEXT",
+    "partial_hash": "TEXT",
+    "payload_partial_hash": "TEXT",
+}
+
+# Columns stored as JSON text
+JSON_COLUMNS = {"meta"}
+
+# Number of writes buffered before an automatic commit
+COMMIT_INTERVAL = 500
+
+# Maximum number of seconds a buffered write waits for a commit, so slow
+# hashing does not lose completed digests if the add-on is stopped
+COMMIT_SECONDS = 30.0
+
+
+class FileIndex:
+    """SQLite backed cache keyed by path and validated by size, mtime and inode.
+
+    Entries are only returned while the file identity still matches, so a
+    modified or replaced file is transparently re-processed. A ``read_only``
+    index opens an existing database read-only and stores nothing, so API
+    workers never hold the write lock the scanner process needs.
+    """
+
+    def __init__(self, db_path: str, read_only: bool = False):
+        """Open (and create if needed) the index database."""
+        self.db_path = db_path
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last_commit = time.monotonic()
+        try:
+            if read_only:
+                uri = f"file:{urllib.parse.quote(os.path.abspath(db_path))}?mode=ro"
+                self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+                self._conn.execute("SELECT 1 FROM files LIMIT 1")
+                return
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            # Lets API workers look files up while the scanner writes
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Could not open index at {db_path}, using in-memory index: {e}")
+            self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self._ensure_schema()
+
+    def _ensure_schema(self) -> None:
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER)"
+            )
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(files)")}
+            for column, column_type in COLUMNS.items():
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE files ADD COLUMN {column} {column_type}")
+            # Lookups of single files go by size
+            self._conn.execute("CREATE INDEX IF NOT EXISTS files_size ON files (size)")
+            self._conn.commit()
+
+    def get(self, path: str, st: os.stat_result) -> Optional[Dict[str, Any]]:
+        """Return the cached fields for a file if its identity is unchanged."""
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT size, mtime_ns, inode, {', '.join(COLUMNS)} FROM files WHERE path = ?",
+                (path,),
+            )
+            row = cursor.fetchone()
+        if row is None or tuple(row[:3]) != (st.st_size, st.st_mtime_ns, st.st_ino):
+            return None
+        entry = {}
+        for column, value in zip(COLUMNS, row[3:]):
+            if value is not None and column in JSON_COLUMNS:
+                value = json.loads(value)
+            entry[column] = value
+        return entry
+
+    def put(self, path: str, st: os.stat_result, **fields: Any) -> None:
+        """Store fields for a file, discarding stale fields of an older identity."""
+        unknown = set(fields) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown index columns: {sorted(unknown)}")
+        if self.read_only:
+            return
+        values = {
+            column: json.dumps(value) if column in JSON_COLUMNS and value is not None else value
+            for column, value in fields.items()
+        }
+        identity = (st.st_size, st.st_mtime_ns, st.st_ino)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, inode FROM files WHERE path = ?", (path,)
+            ).fetchone()
+            if row is not None and tuple(row) == identity:
+                if values:
+                    assignments = ", ".join(f"{column} = ?" for column in values)
+                    self._conn.execute(
+                        f"UPDATE files SET {assignments} WHERE path = ?",
+                        (*values.values(), path),
+                    )
+            else:
+                columns = ["path", "size", "mtime_ns", "inode", *values]
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO files ({', '.join(columns)}) "
+                    f"VALUES ({', '.join('?' for _ in columns)})",
+                    (path, *identity, *values.values()),
+                )
+            self._pending += 1
+            if self._pending >= COMMIT_INTERVAL or time.monotonic() - self._last_commit >= COMMIT_SECONDS:
+                self._commit_locked()
+
+    def find_by_size(self, size: int) -> List[Dict[str, Any]]:
+        """Return every indexed file of a size with its identity and cached fields.
+
+        Entries are not validated; callers stat the files they want to use.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT path, mtime_ns, inode, {', '.join(COLUMNS)} FROM files WHERE size = ?",
+                (size,),
+            ).fetchall()
+        entries = []
+        for row in rows:
+            entry = {"path": row[0], "size": size, "mtime_ns": row[1], "inode": row[2]}
+            for column, value in zip(COLUMNS, row[3:]):
+                if value is not None and column in JSON_COLUMNS:
+                    value = json.loads(value)
+                entry[column] = value
+            entries.append(entry)
+        return entries
+
+    def get_or_compute(self, path: str, st: os.stat_result, column: str, compute: Callable[[], Any]) -> Any:
+        """Return a cached field, computing and storing it on a miss.
+
+        ``compute`` may return None to signal a failure that is not cached.
+        """
+        cached = self.get(path, st)
+        if cached is not None and cached[column] is not None:
+            return cached[column]
+        value = compute()
+        if value is not None:
+            self.put(path, st, **{column: value})
+        return value
+
+    def prune(self, roots: List[str], paths: Iterable[str]) -> int:
+        """Remove the rows under ``roots`` whose path is not in ``paths``.
+
+        ``paths`` are the files a completed walk of the roots found; rows of
+        files deleted or moved since are dropped so the index does not grow
+        without bound. Returns the number of rows removed.
+        """
+        if self.read_only:
+            return 0
+        removed = 0
+        with self._lock:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS seen (path TEXT PRIMARY KEY)")
+            self._conn.execute("DELETE FROM seen")
+            self._conn.executemany("INSERT OR IGNORE INTO seen (path) VALUES (?)", ((path,) for path in paths))
+            for root in roots:
+                prefix = root.rstrip(os.sep) + os.sep
+                removed += self._conn.execute(
+                    "DELETE FROM files WHERE substr(path, 1, ?) = ? AND path NOT IN (SELECT path FROM seen)",
+                    (len(prefix), prefix),
+                ).rowcount
+            self._conn.execute("DELETE FROM seen")
+            self._commit_locked()
+        if removed:
+            logger.info(f"Removed {removed} files that no longer exist from the index")
+        return removed
+
+    def commit(self) -> None:
+        """Flush buffered writes to disk."""
+        with self._lock:
+            self._commit_locked()
+
+    def _commit_locked(self) -> None:
+        self._conn.commit()
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def close(self) -> None:
+        """Commit and close the database."""
+        self.commit()
+        self._conn.close()
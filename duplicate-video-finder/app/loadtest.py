@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""Load test of the add-on API with large synthetic results.
+
+Starts the add-on with a temporary data directory whose state store is
+preloaded with synthetic duplicate sets, drives concurrent clients against
+the status, results, scan and delete endpoints, and reports latency
+percentiles, throughput and the peak memory of the server processes.
+Results can be saved as a baseline, and later runs are compared against it.
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from state_store import StateStore
+
+logger = logging.getLogger("duplicate_video_finder")
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Default file that baselines are saved to and compared against
+BASELINE_PATH = os.path.join(APP_DIR, "loadtest_baseline.json")
+
+# Relative change beyond which a metric counts as a regression
+DEFAULT_TOLERANCE = 0.25
+
+# Latency increases below this many milliseconds are treated as noise
+LATENCY_NOISE_MS = 5.0
+
+# Seconds to wait for the server to answer after starting it
+STARTUP_TIMEOUT = 60
+
+# Seconds between two memory samples of the server processes
+RSS_INTERVAL = 0.2
+
+# Page size the UI requests
+PAGE_SIZE = 200
+
+# Seconds between two status polls while waiting for the queued scan to run
+SCAN_POLL_INTERVAL = 0.05
+
+
+def synthetic_results(sets: int, seed: int = 0) -> Dict[str, List[str]]:
+    """Build ``sets`` duplicate sets with library-like names and 2 to 4 paths."""
+    rng = random.Random(seed)
+    results = {}
+    for i in range(sets):
+        name = f"Show {i % 997:03d} - S{i % 12 + 1:02d}E{i % 24 + 1:02d} - episode {i}.mkv"
+        paths = [f"/media/library{copy}/Show {i % 997:03d}/Season {i % 12 + 1}/{name}" for copy in range(rng.randint(2, 4))]
+        results[f"{name}_{rng.getrandbits(32):08x}"] = paths
+    return results
+
+
+def deletable_results(directory: str, sets: int) -> Dict[str, List[str]]:
+    """Create small real files in ``directory``, as sets of three copies."""
+    results = {}
+    for i in range(sets):
+        paths = []
+        for copy in range(3):
+            path = os.path.join(directory, f"copy{copy}", f"delete{i}.mp4")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(b"\0" * 1024)
+            paths.append(path)
+        results[f"delete{i}.mp4_{i:08x}"] = paths
+    return results
+
+
+def scan_library(directory: str, files: int) -> None:
+    """Create ``files`` small files in ``directory`` for the scan scenario to hash."""
+    for i in range(files):
+        path = os.path.join(directory, f"scan{i % 50}", f"scan{i // 2}.mkv")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(str(i // 2).encode() * 1024)
+
+
+def _children(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def tree_rss(pid: int) -> int:
+    """Return the resident memory in bytes of a process and its descendants."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(_children(current))
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return total
+
+
+class RssSampler(threading.Thread):
+    """Track the peak resident memory of the server process tree."""
+
+    def __init__(self, pid: int):
+        super().__init__(name="rss-sampler", daemon=True)
+        self.pid = pid
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(RSS_INTERVAL):
+            self.peak = max(self.peak, tree_rss(self.pid))
+
+    def reset(self) -> int:
+        """Return the peak since the last reset and start over."""
+        peak = max(self.peak, tree_rss(self.pid))
+        self.peak = 0
+        return peak
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+class Server:
+    """The add-on started as a subprocess on a free local port."""
+
+    def __init__(self, data_dir: str, scan_path: str, api_workers: int):
+        self.data_dir = data_dir
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        with open(os.path.join(data_dir, "options.json"), "w") as f:
+            json.dump({"scan_paths": [scan_path], "exclude_paths": [], "api_workers": api_workers,
+                       "log_level": "warning"}, f)
+        self.log = open(os.path.join(data_dir, "server.log"), "w")
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(APP_DIR, "run.py"), "--port", str(self.port)],
+            cwd=APP_DIR,
+            env={**os.environ, "DATA_DIR": data_dir},
+            stdout=self.log,
+            stderr=subprocess.STDOUT,
+        )
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def wait_ready(self) -> None:
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited with {self.process.returncode}, see {self.log.name}")
+            try:
+                request(self.url, "GET", "/api/status")
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError("Server did not start in time")
+
+    def stop(self) -> None:
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+
+
+def request(base_url: str, method: str, path: str, data: Optional[Dict[str, Any]] = None) -> Tuple[int, bytes]:
+    """Send one request and return the status code and body."""
+    body = json.dumps(data).encode() if data is not None else None
+    req = urllib.request.Request(
+        base_url + path, data=body, method=method,
+        headers={"Content-Type": "application/json", "Accept-Encoding": "gzip"},
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=60) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def get_status(base_url: str) -> Dict[str, Any]:
+    """Return the scan status the server reports."""
+    _, body = request(base_url, "GET", "/api/status")
+    if body[:2] == b"\x1f\x8b":
+        body = gzip.decompress(body)
+    return json.loads(body)
+
+
+def wait_for_scan(base_url: str, previous_scan: Optional[str]) -> bool:
+    """Wait until the scanner runs the queued scan.
+
+    ``POST /api/scan`` only queues the scan. Returns False if the scan
+    finished before it was seen running.
+    """
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        status = get_status(base_url)
+        if status.get("status") == "scanning":
+            return True
+        if status.get("last_scan") != previous_scan:
+            return False
+        time.sleep(SCAN_POLL_INTERVAL)
+    raise RuntimeError("The queued scan did not start in time")
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Return the value below which ``fraction`` of the sorted ``values`` lie."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_scenario(
+    name: str,
+    make_request: Callable[[int], Tuple[str, str, Optional[Dict[str, Any]]]],
+    base_url: str,
+    clients: int,
+    requests: int,
+    sampler: RssSampler,
+) -> Dict[str, Any]:
+    """Send ``requests`` requests from ``clients`` threads and summarize them."""
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def send(i: int) -> None:
+        nonlocal errors
+        method, path, data = make_request(i)
+        started = time.perf_counter()
+        try:
+            status, _ = request(base_url, method, path, data)
+        except OSError:
+            status = 0
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed * 1000)
+            if status >= 400 or status == 0:
+                errors += 1
+
+    sampler.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(send, range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    result = {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 0.5), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "rss_mb": round(sampler.reset() / 1024 / 1024, 1),
+    }
+    logger.info(
+        f"{name}: p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms, "
+        f"{result['throughput_rps']} req/s, {errors} errors, {result['rss_mb']} MB RSS"
+    )
+    return result
+
+
+def run_load_test(args: argparse.Namespace) -> Dict[str, Any]:
+    """Preload the results, start the server and run every scenario."""
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory(prefix="dvf-loadtest-") as data_dir:
+        library = os.path.join(data_dir, "library")
+        results = synthetic_results(args.sets, args.seed)
+        deletable = deletable_results(library, args.deletes)
+        scan_library(library, args.scan_files)
+        # Deletable sets go first, so they are also part of the browsed pages
+        store = StateStore(os.path.join(data_dir, "state.db"))
+        store.publish({**deletable, **results}.items(), {"trees": []})
+        store.close()
+        names = list(results)
+        delete_paths = [paths[0] for paths in deletable.values()]
+        total = len(deletable) + len(results)
+        logger.info(f"Preloaded {total} duplicate sets")
+
+        server = Server(data_dir, library, args.workers)
+        try:
+            server.wait_ready()
+            sampler = RssSampler(server.process.pid)
+            sampler.start()
+            idle_rss = tree_rss(server.process.pid)
+
+            def page(_: int) -> Tuple[str, str, None]:
+                offset = rng.randrange(0, max(1, total - PAGE_SIZE))
+                return "GET", f"/api/results?offset={offset}&limit={PAGE_SIZE}&paths=false", None
+
+            def result_set(_: int) -> Tuple[str, str, None]:
+                name = urllib.parse.quote(rng.choice(names))
+                return "GET", f"/api/results/set?name={name}", None
+
+            scenarios = [
+                ("status", lambda _: ("GET", "/api/status", None), args.requests),
+                ("results_page", page, args.requests),
+                ("result_set", result_set, args.requests),
+                # Full results are heavy; fewer requests keep the run short
+                ("results_full", lambda _: ("GET", "/api/results", None), max(args.clients, args.requests // 20)),
+                ("delete", lambda i: ("POST", "/api/delete", {"file_path": delete_paths[i]}), len(delete_paths)),
+            ]
+            report: Dict[str, Any] = {
+                "sets": total,
+                "clients": args.clients,
+                "api_workers": args.workers,
+                "idle_rss_mb": round(idle_rss / 1024 / 1024, 1),
+                "scenarios": {},
+            }
+            for name, make_request, count in scenarios:
+                report["scenarios"][name] = run_scenario(
+                    name, make_request, server.url, args.clients, count, sampler
+                )
+
+            # A scan replaces the preloaded results, so it runs last; pages
+            # are browsed once the scanner has picked it up
+            previous_scan = get_status(server.url).get("last_scan")
+            report["scenarios"]["scan"] = run_scenario(
+                "scan", lambda _: ("POST", "/api/scan", {"paths": [library], "scan_by_content": True}),
+                server.url, 1, 1, sampler,
+            )
+            report["scan_running"] = wait_for_scan(server.url, previous_scan)
+            if not report["scan_running"]:
+                logger.warning("The scan finished before results pages were browsed, raise --scan-files")
+            report["scenarios"]["results_page_during_scan"] = run_scenario(
+                "results_page_during_scan", page, server.url, args.clients, args.requests, sampler
+            )
+            sampler.stop()
+        finally:
+            server.stop()
+    return report
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return a description of every metric that regressed against ``baseline``."""
+    regressions = []
+    for name, result in report["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            limit = base[metric] * (1 + tolerance)
+            if result[metric] > limit and result[metric] - base[metric] > LATENCY_NOISE_MS:
+                regressions.append(f"{name} {metric}: {result[metric]} ms, baseline {base[metric]} ms")
+        # A single scan request has no meaningful throughput
+        if result["requests"] > 1 and result["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name} throughput: {result['throughput_rps']} req/s, baseline {base['throughput_rps']} req/s"
+            )
+        if result["rss_mb"] > base["rss_mb"] * (1 + tolerance):
+            regressions.append(f"{name} RSS: {result['rss_mb']} MB, baseline {base['rss_mb']} MB")
+        if result["errors"] > base["errors"]:
+            regressions.append(f"{name} errors: {result['errors']}, baseline {base['errors']}")
+    return regressions
+
+
+def main() -> None:
+    """Run the load test and compare it against the baseline."""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s", datefmt="%H:%M:%S")
+    parser = argparse.ArgumentParser(description="Load test of the Duplicate Video Finder API")
+    parser.add_argument("--sets", type=int, default=10000, help="Number of synthetic duplicate sets")
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per scenario")
+    parser.add_argument("--deletes", type=int, default=200, help="Files deleted through /api/delete")
+    parser.add_argument("--scan-files", type=int, default=5000, help="Files hashed by the scan scenario")
+    parser.add_argument("--workers", type=int, default=1, help="API workers of the server")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic results and requests")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Save this run as the baseline")
+    parser.add_argument(
+        "--tolerance", type=float, default=DEFAULT_TOLERANCE,
+        help="Relative change that counts as a regression (default: 0.25)",
+    )
+    parser.add_argument("--report", help="File the JSON report is written to")
+    args = parser.parse_args()
+
+    report = run_load_test(args)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Saved baseline to {args.baseline}")
+        return
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        logger.info(f"No baseline at {args.baseline}, run with --save-baseline to create one")
+        return
+    if (baseline.get("sets"), baseline.get("clients"), baseline.get("api_workers")) != (
+        report["sets"], report["clients"], report["api_workers"]
+    ):
+        logger.warning("Baseline was recorded with other --sets, --clients or --workers")
+    regressions = compare(report, baseline, args.tolerance)
+    for regression in regressions:
+        logger.error(f"Regression: {regression}")
+    if regressions:
+        sys.exit(1)
+    logger.info("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Check a single file against the library without scanning it."""
+
+import os
+from typing import Any, Dict, Optional
+
+from hashing import PARTIAL_HASH_SIZE, calculate_file_hash, calculate_partial_hash, get_file_hash, get_partial_hash
+from index import FileIndex
+
+
+def find_copies(index: FileIndex, path: str, verify: bool = False) -> Dict[str, Any]:
+    """Find indexed files with the same content as ``path``.
+
+    Candidates come from the size index and are compared by partial digest,
+    so only the first MiB of the new file is read. Digests of library files
+    are taken from the index when current. Files larger than the partial
+    window only count as confirmed duplicates with ``verify``, which hashes
+    the whole file.
+
+    Raises OSError if ``path`` cannot be read.
+    """
+    st = os.stat(path)
+    result: Dict[str, Any] = {
+        "path": path,
+        "size": st.st_size,
+        "duplicate": False,
+        "confirmed": False,
+        "matches": [],
+    }
+    if st.st_size == 0:
+        return result
+
+    candidates = [entry for entry in index.find_by_size(st.st_size) if entry["path"] != path]
+    if not candidates:
+        return result
+
+    partial = calculate_partial_hash(path)
+    if partial == "error":
+        raise OSError(f"Could not read {path}")
+    full: Optional[str] = None
+    for entry in candidates:
+        try:
+            candidate_st = os.stat(entry["path"])
+        except OSError:
+            continue
+        # Skip removed or replaced files and hard links to the file itself
+        if candidate_st.st_size != st.st_size:
+            continue
+        if (candidate_st.st_dev, candidate_st.st_ino) == (st.st_dev, st.st_ino):
+            continue
+        if get_partial_hash(index, entry["path"], candidate_st) != partial:
+            continue
+        if verify and st.st_size > PARTIAL_HASH_SIZE:
+            if full is None:
+                full = calculate_file_hash(path, 1024 * 1024)
+            if get_file_hash(index, entry["path"], candidate_st) != full:
+                continue
+        result["matches"].append(entry["path"])
+
+    result["duplicate"] = bool(result["matches"])
+    result["confirmed"] = result["duplicate"] and (verify or st.st_size <= PARTIAL_HASH_SIZE)
+    return result
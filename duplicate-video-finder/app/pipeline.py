@@ -0,0 +1,609 @@
+"""Streaming content scan built from asyncio stages and bounded queues.
+
+    walker -> stat/prefilter -> partial hash -> full hash
+
+Each stage consumes items as soon as the previous stage produces them, so
+hashing starts on the first size collision while the walk is still running.
+Hash stages take the candidates with the most reclaimable bytes first, and
+confirmed sets are available from ``results()`` before the scan finishes.
+Blocking filesystem calls run in the default thread pool; all grouping state
+is only touched from the event loop. Files on rotational disks are hashed by
+one reader per disk in on-disk order instead of by the worker pools, with
+a bounded number of jobs queued per disk so the queues keep backpressure.
+
+Groups of up to ``LOCKSTEP_MAX_FILES`` partial matches are not hashed one by
+one. Once every file of their size has its partial digest, they are read
+side by side by the full hash stage, stopping at the first differing block;
+larger groups are hashed.
+"""
+
+import asyncio
+import functools
+import heapq
+import itertools
+import logging
+import math
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from checkpoint import ScanCheckpoint
+from container import metadata_signature, read_metadata
+from grouping import CollisionCounter
+from hashing import (
+    FULL_COLUMNS,
+    LOCKSTEP_MAX_FILES,
+    PARTIAL_COLUMNS,
+    PARTIAL_HASH_SIZE,
+    get_file_hash,
+    get_group_hashes,
+    get_partial_hash,
+)
+from index import FileIndex
+from profiling import ScanProfiler
+from spindle import SpindleScheduler
+from storage import StorageMap, physical_offset
+from walker import initial_frontier, list_directory
+
+logger = logging.getLogger("duplicate_video_finder")
+
+# Maximum number of items waiting between two stages
+QUEUE_SIZE = 1000
+
+# Maximum number of hash jobs a stage queues on one rotational disk
+SPINDLE_QUEUE_SIZE = 256
+
+# Default number of concurrent workers per stage
+STAT_WORKERS = 8
+PARTIAL_HASH_WORKERS = 4
+FULL_HASH_WORKERS = 2
+
+# Queue sentinel telling a worker that its input is exhausted
+_DONE = None
+
+
+class _PriorityQueue(asyncio.Queue):
+    """Bounded queue handing out the most valuable item first.
+
+    Items are put as ``(value, item)``; the end-of-input sentinel sorts last.
+    """
+
+    def _init(self, maxsize: int) -> None:
+        self._queue: List[Tuple[float, int, Any]] = []
+        self._seq = itertools.count()
+
+    def _put(self, entry: Any) -> None:
+        if entry is _DONE:
+            heapq.heappush(self._queue, (math.inf, next(self._seq), _DONE))
+        else:
+            value, item = entry
+            heapq.heappush(self._queue, (-value, next(self._seq), item))
+
+    def _get(self) -> Any:
+        return heapq.heappop(self._queue)[2]
+
+
+class ScanPipeline:
+    """Find files with identical content under a set of paths."""
+
+    def __init__(
+        self,
+        index: FileIndex,
+        params: Dict[str, Any],
+        state: Dict[str, Any],
+        status: Dict[str, Any],
+        checkpoint: Optional[ScanCheckpoint] = None,
+        hash_workers: Optional[int] = None,
+        profiler: Optional[ScanProfiler] = None,
+        spill_dir: Optional[str] = None,
+        memory_budget: int = 0,
+    ):
+        """Initialize the pipeline.
+
+        Args:
+            index: Cache of metadata and digests
+            params: Scan parameters (paths, exclude_paths, hash_mode,
+                scan_by_metadata, io_profile)
+            state: Walker frontier and number of discovered files; updated
+                in place and saved to ``checkpoint`` so an interrupted scan
+                can resume
+            status: Progress dict updated while the scan runs
+            checkpoint: Periodically saved state and list of discovered files
+            hash_workers: Number of concurrent full hash workers
+            profiler: Records listing latencies and hash throughput
+            spill_dir: Directory the size groups move to once they outgrow
+                ``memory_budget`` bytes; they stay in memory without one
+            memory_budget: Bytes the size groups may use in memory
+        """
+        self.index = index
+        self.params = params
+        self.state = state
+        self.status = status
+        self.checkpoint = checkpoint
+        self.profiler = profiler
+        self.hash_mode = params.get("hash_mode", "full")
+        self.use_metadata = params.get("scan_by_metadata", False)
+        self.full_workers = hash_workers or FULL_HASH_WORKERS
+        self.partial_workers = max(self.full_workers, PARTIAL_HASH_WORKERS)
+        self.storage = StorageMap(params["paths"], params.get("io_profile", "auto"))
+        self.spindles = SpindleScheduler()
+        # Hash jobs queued on rotational disks, per stage, and the free
+        # queue slots of each stage and disk
+        self._scheduled: Dict[str, Set[asyncio.Task]] = {"partial": set(), "full": set()}
+        self._slots: Dict[Tuple[str, str], asyncio.Semaphore] = {}
+        self._offsets: Dict[str, int] = {}
+        # Files found since the last checkpoint
+        self._unsaved: List[str] = []
+
+        # Files per size; every file is counted here, so only the first
+        # path of each size is kept, on disk past the memory budget
+        self._by_size = CollisionCounter(spill_dir, memory_budget)
+        # key -> paths for each later stage; a group is forwarded once it collides
+        self._by_partial: Dict[Hashable, List[Tuple[str, os.stat_result]]] = {}
+        self._by_digest: Dict[Hashable, List[str]] = {}
+        # Partial matches held back for a lockstep comparison; None once a
+        # group grew too large and is hashed instead
+        self._lockstep: Dict[Hashable, Optional[List[Tuple[str, os.stat_result]]]] = {}
+        # Lockstep groups of each size key, and the files of a size key still
+        # in the partial stage; a size key's groups are compared once no
+        # file of it can be added any more
+        self._lockstep_keys: Dict[Hashable, List[Hashable]] = {}
+        self._partial_pending: Dict[Hashable, int] = {}
+        self._stat_done = False
+        self._digest_sizes: Dict[Hashable, int] = {}
+        # Bumped whenever a confirmed set is found or gains a file
+        self.version = 0
+
+    async def run(self) -> Dict[str, List[str]]:
+        """Run all stages to completion and return the duplicate sets."""
+        stat_queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        partial_queue: asyncio.Queue = _PriorityQueue(maxsize=QUEUE_SIZE)
+        full_queue: asyncio.Queue = _PriorityQueue(maxsize=QUEUE_SIZE)
+
+        self.status.update({
+            "stage": "walking",
+            "total_files": 0,
+            "processed_files": 0,
+            "hashed_files": 0,
+            "duplicate_sets": 0,
+        })
+
+        walker = asyncio.create_task(self._walk(stat_queue))
+        stat_tasks = [
+            asyncio.create_task(self._stat_worker(stat_queue, partial_queue))
+            for _ in range(STAT_WORKERS)
+        ]
+        partial_tasks = [
+            asyncio.create_task(self._partial_worker(partial_queue, full_queue))
+            for _ in range(self.partial_workers)
+        ]
+        full_tasks = [
+            asyncio.create_task(self._full_worker(full_queue))
+            for _ in range(self.full_workers)
+        ]
+
+        try:
+            await walker
+            self.status["stage"] = "hashing"
+            await self._finish(stat_queue, stat_tasks)
+            # No file joins a size key any more; compare the lockstep groups
+            # of the size keys whose partial hashes are all done
+            self._stat_done = True
+            for size_key in list(self._lockstep_keys):
+                if not self._partial_pending.get(size_key):
+                    await self._release_lockstep(size_key, full_queue)
+            await self._finish(partial_queue, partial_tasks, self._scheduled["partial"])
+            await self._finish(full_queue, full_tasks, self._scheduled["full"])
+            await self.spindles.close()
+        except BaseException:
+            scheduled = [*self._scheduled["partial"], *self._scheduled["full"]]
+            for task in [walker, *stat_tasks, *partial_tasks, *full_tasks, *scheduled]:
+                task.cancel()
+            await self.spindles.close(cancel=True)
+            raise
+        finally:
+            await asyncio.get_running_loop().run_in_executor(None, self._by_size.close)
+
+        results = self.results()
+        self.status["duplicate_sets"] = len(results)
+        return results
+
+    def results(self) -> Dict[str, List[str]]:
+        """Return the duplicate sets confirmed so far, most reclaimable first.
+
+        Safe to call while the scan is running; sets found later are missing
+        and sets may still gain members. Sets are named after their digest
+        and first path in sorted order, so names stay stable across scans.
+        """
+        confirmed = [(key, paths) for key, paths in self._by_digest.items() if len(paths) > 1]
+        confirmed.sort(key=lambda entry: self._digest_sizes[entry[0]] * (len(entry[1]) - 1), reverse=True)
+        return {
+            f"{os.path.basename(min(paths))}_{key[-1][:8]}": list(paths)
+            for key, paths in confirmed
+        }
+
+    def _add_digest(self, key: Hashable, path: str, st: os.stat_result) -> None:
+        """Record a fully hashed file in the set of files sharing its digest."""
+        group = self._by_digest.setdefault(key, [])
+        group.append(path)
+        self._digest_sizes[key] = st.st_size
+        if len(group) == 2:
+            self.status["duplicate_sets"] += 1
+        if len(group) >= 2:
+            self.version += 1
+
+    @staticmethod
+    async def _finish(
+        queue: asyncio.Queue, workers: List[asyncio.Task], scheduled: Optional[Set[asyncio.Task]] = None
+    ) -> None:
+        """Signal the end of input to a stage and wait for its workers."""
+        for _ in workers:
+            await queue.put(_DONE)
+        await asyncio.gather(*workers)
+        if scheduled:
+            await asyncio.gather(*scheduled)
+
+    async def _walk(self, out: asyncio.Queue) -> None:
+        """Walk the scan paths and feed every video file into the pipeline."""
+        loop = asyncio.get_running_loop()
+        if "frontier" not in self.state:
+            self.state["frontier"] = initial_frontier(self.params["paths"])
+            self.state["listed_files"] = 0
+            if self.checkpoint is not None:
+                await loop.run_in_executor(None, self.checkpoint.clear)
+        frontier: List[str] = self.state["frontier"]
+
+        # Files found before an interruption go through the pipeline again;
+        # their digests come from the index
+        if self.checkpoint is not None and self.state["listed_files"]:
+            batches = self.checkpoint.read_files()
+            while True:
+                paths = await loop.run_in_executor(None, next, batches, None)
+                if paths is None:
+                    break
+                for path in paths:
+                    self.status["total_files"] += 1
+                    await out.put((path, None))
+
+        # List several directories at once; on network mounts this hides the
+        # round-trip latency of each listing behind the others
+        pending: Dict[asyncio.Future, str] = {}
+        saving: Optional[asyncio.Future] = None
+        try:
+            while frontier or pending:
+                while frontier and len(pending) < self.storage.walk_concurrency:
+                    directory = frontier.pop()
+                    future = loop.run_in_executor(None, self._list_directory, directory)
+                    pending[future] = directory
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    del pending[future]
+                    subdirs, video_files = future.result()
+                    frontier.extend(subdirs)
+                    for path, st in video_files:
+                        self._unsaved.append(path)
+                        self.status["total_files"] += 1
+                        await out.put((path, st))
+                if self.checkpoint is not None and (saving is None or saving.done()) and self.checkpoint.is_due():
+                    if saving is not None:
+                        saving.result()
+                    # Directories still being listed must be listed again on resume
+                    saving = self._save_checkpoint(frontier + list(pending.values()))
+            if self.checkpoint is not None:
+                # The complete file list is read back for the folder and
+                # overlap analyses
+                if saving is not None:
+                    await saving
+                await self._save_checkpoint([])
+        finally:
+            for future in pending:
+                future.cancel()
+
+        logger.info(f"Walk finished, found {self.status['total_files']} video files")
+
+    def _save_checkpoint(self, frontier: List[str]) -> asyncio.Future:
+        """Write a checkpoint in a worker thread.
+
+        The state is copied on the event loop, so the walk can go on while
+        it is written.
+        """
+        files, self._unsaved = self._unsaved, []
+        self.state["listed_files"] += len(files)
+        state = {**self.state, "frontier": frontier}
+        return asyncio.get_running_loop().run_in_executor(None, self._write_checkpoint, files, state)
+
+    def _write_checkpoint(self, files: List[str], state: Dict[str, Any]) -> None:
+        """Commit completed digests, then append new files and save the state."""
+        self.index.commit()
+        self.checkpoint.add_files(files)
+        self.checkpoint.save(state)
+
+    def _list_directory(self, directory: str) -> Tuple[List[str], List[Tuple[str, Optional[os.stat_result]]]]:
+        """List a directory, taking the stats of its files from the listing on network mounts."""
+        start = time.perf_counter()
+        subdirs, stats = list_directory(
+            directory, self.params["exclude_paths"], self.storage.profile_for(directory).stat_on_list
+        )
+        if self.profiler is not None:
+            self.profiler.record_listing(directory, time.perf_counter() - start, len(subdirs) + len(stats))
+        return subdirs, stats
+
+    async def _stat_worker(self, queue: asyncio.Queue, out: asyncio.Queue) -> None:
+        """Stat files and forward those whose size collides with another file."""
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            path, st = item
+            try:
+                st = await loop.run_in_executor(None, self._stat, path, st)
+                self.status["processed_files"] += 1
+                # Empty files are never reported as duplicates
+                if st.st_size == 0:
+                    continue
+                key = await self._prefilter_key(path, st)
+                count, first = await loop.run_in_executor(None, self._by_size.add, key, path)
+            except Exception as e:
+                logger.error(f"Error reading {path}: {e}")
+                continue
+            value = st.st_size * (count - 1)
+            if first is not None:
+                # The first file was held back until it had company
+                try:
+                    first_st = await loop.run_in_executor(None, os.stat, first)
+                except OSError as e:
+                    logger.error(f"Error reading {first}: {e}")
+                else:
+                    self._partial_pending[key] = self._partial_pending.get(key, 0) + 1
+                    await out.put((value, (key, (first, first_st))))
+            if count > 1:
+                self._partial_pending[key] = self._partial_pending.get(key, 0) + 1
+                await out.put((value, (key, (path, st))))
+
+    def _stat(self, path: str, st: Optional[os.stat_result]) -> os.stat_result:
+        """Stat a file if needed and record it in the index.
+
+        Every file is recorded, not only colliding ones, so single-file
+        lookups find files whose size was unique during the scan.
+        """
+        if st is None:
+            st = os.stat(path)
+        self.index.put(path, st)
+        return st
+
+    async def _prefilter_key(self, path: str, st: os.stat_result) -> Hashable:
+        """Key that identical files are guaranteed to share.
+
+        Payload hashing ignores metadata, so re-tagged copies can differ in
+        size; they are keyed by container metadata instead when available.
+        """
+        if self.hash_mode == "payload":
+            meta = await asyncio.get_running_loop().run_in_executor(None, self._metadata, path, st)
+            if meta:
+                return ("meta", metadata_signature(meta))
+        return ("size", st.st_size)
+
+    def _metadata(self, path: str, st: os.stat_result) -> Optional[Dict[str, Any]]:
+        return self.index.get_or_compute(path, st, "meta", lambda: read_metadata(path) or {}) or None
+
+    @staticmethod
+    async def _collide(
+        groups: Dict[Hashable, List[Tuple[str, os.stat_result]]],
+        key: Hashable,
+        item: Tuple[str, os.stat_result],
+        out: asyncio.Queue,
+    ) -> None:
+        """Add a file to its group and forward it once the group has a peer.
+
+        Forwarded files are valued by the bytes their group could reclaim.
+        """
+        group = groups.setdefault(key, [])
+        group.append(item)
+        value = item[1].st_size * (len(group) - 1)
+        if len(group) == 2:
+            # The first member was held back until it had company
+            await out.put((value, (key, group[0])))
+            await out.put((value, (key, item)))
+        elif len(group) > 2:
+            await out.put((value, (key, item)))
+
+    async def _dispatch(
+        self,
+        stage: str,
+        path: str,
+        st: os.stat_result,
+        read: Callable[[], Awaitable[Any]],
+        done: Callable[[Any], Awaitable[None]],
+    ) -> None:
+        """Run a hash job now, or queue it in disk order on a rotational disk.
+
+        Only ``read`` waits in the disk's queue; ``done`` is handed its
+        result outside of it, so forwarding results to a full queue never
+        holds up the disk. Once a stage has ``SPINDLE_QUEUE_SIZE`` jobs
+        queued on a disk, its workers wait for one of them to finish.
+        """
+        spindle = self.storage.spindle_for(st)
+        if spindle is None:
+            await done(await read())
+            return
+        offset = self._offsets.get(path)
+        if offset is None:
+            offset = await asyncio.get_running_loop().run_in_executor(None, physical_offset, path, st)
+            self._offsets[path] = offset
+        slots = self._slots.get((stage, spindle))
+        if slots is None:
+            slots = self._slots[(stage, spindle)] = asyncio.Semaphore(SPINDLE_QUEUE_SIZE)
+        await slots.acquire()
+        task = asyncio.create_task(self._complete(self.spindles.submit(spindle, offset, read), done, slots))
+        self._scheduled[stage].add(task)
+        task.add_done_callback(self._scheduled[stage].discard)
+
+    @staticmethod
+    async def _complete(
+        future: asyncio.Future, done: Callable[[Any], Awaitable[None]], slots: asyncio.Semaphore
+    ) -> None:
+        """Hand the result of a queued job on and free its queue slot."""
+        try:
+            await done(await future)
+        finally:
+            slots.release()
+
+    async def _partial_worker(self, queue: asyncio.Queue, out: asyncio.Queue) -> None:
+        """Hash the start of size-colliding files and forward partial matches."""
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            key, (path, st) = item
+            await self._dispatch(
+                "partial", path, st,
+                functools.partial(self._partial_hash, key, path, st),
+                functools.partial(self._partial_done, key, path, st, out),
+            )
+
+    async def _partial_hash(self, key: Hashable, path: str, st: os.stat_result) -> Optional[Hashable]:
+        """Return the key of a file extended by its partial digest."""
+        loop = asyncio.get_running_loop()
+        try:
+            if self.use_metadata and self.hash_mode != "payload":
+                meta = await loop.run_in_executor(None, self._metadata, path, st)
+                key = (*key, metadata_signature(meta))
+            digest = await loop.run_in_executor(
+                None, self._timed_hash, "partial", PARTIAL_COLUMNS[self.hash_mode],
+                min(st.st_size, PARTIAL_HASH_SIZE), get_partial_hash, path, st, self.hash_mode,
+            )
+        except Exception as e:
+            logger.error(f"Error hashing {path}: {e}")
+            return None
+        return None if digest is None else (*key, digest)
+
+    async def _partial_done(
+        self, size_key: Hashable, path: str, st: os.stat_result, out: asyncio.Queue, key: Optional[Hashable]
+    ) -> None:
+        """Forward a file whose partial digest matches another file's."""
+        try:
+            if key is None:
+                return
+            if self.hash_mode != "full":
+                await self._collide(self._by_partial, key, (path, st), out)
+            elif st.st_size <= PARTIAL_HASH_SIZE:
+                # Files no larger than the partial window are already fully hashed
+                self._add_digest(key, path, st)
+            else:
+                await self._hold_for_lockstep(size_key, key, path, st, out)
+        finally:
+            self._partial_pending[size_key] -= 1
+            if not self._partial_pending[size_key]:
+                del self._partial_pending[size_key]
+                if self._stat_done:
+                    await self._release_lockstep(size_key, out)
+
+    async def _hold_for_lockstep(
+        self, size_key: Hashable, key: Hashable, path: str, st: os.stat_result, out: asyncio.Queue
+    ) -> None:
+        """Hold a partial match back for a lockstep comparison.
+
+        Groups that grow too large to read side by side are hashed instead.
+        """
+        group = self._lockstep.setdefault(key, [])
+        if group is None:
+            await out.put((st.st_size, (key, (path, st))))
+            return
+        group.append((path, st))
+        if len(group) == 1:
+            self._lockstep_keys.setdefault(size_key, []).append(key)
+        elif len(group) > LOCKSTEP_MAX_FILES:
+            self._lockstep[key] = None
+            value = st.st_size * (len(group) - 1)
+            for item in group:
+                await out.put((value, (key, item)))
+
+    async def _release_lockstep(self, size_key: Hashable, out: asyncio.Queue) -> None:
+        """Forward the lockstep groups of a size key no file can join any more."""
+        for key in self._lockstep_keys.pop(size_key, []):
+            group = self._lockstep.pop(key)
+            if group is not None and len(group) > 1:
+                await out.put((group[0][1].st_size * (len(group) - 1), (key, group)))
+
+    async def _full_worker(self, queue: asyncio.Queue) -> None:
+        """Fully hash or compare files whose partial hashes match and group by digest."""
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            key, members = item
+            if isinstance(members, list):
+                path, st = members[0]
+                await self._dispatch(
+                    "full", path, st,
+                    functools.partial(self._compare, members),
+                    functools.partial(self._compare_done, key, members),
+                )
+            else:
+                await self._dispatch_full_hash(key, *members)
+
+    async def _dispatch_full_hash(self, key: Hashable, path: str, st: os.stat_result) -> None:
+        await self._dispatch(
+            "full", path, st,
+            functools.partial(self._full_hash, path, st),
+            functools.partial(self._full_done, key, path, st),
+        )
+
+    async def _full_hash(self, path: str, st: os.stat_result) -> Optional[str]:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self._timed_hash, "full", FULL_COLUMNS[self.hash_mode],
+                st.st_size, get_file_hash, path, st, self.hash_mode,
+                self.storage.profile_for(path).read_size,
+            )
+        except Exception as e:
+            logger.error(f"Error hashing {path}: {e}")
+            return None
+
+    async def _full_done(self, key: Hashable, path: str, st: os.stat_result, digest: Optional[str]) -> None:
+        self.status["hashed_files"] += 1
+        if digest is not None:
+            self._add_digest((*key, digest), path, st)
+
+    async def _compare(self, group: List[Tuple[str, os.stat_result]]) -> Dict[str, str]:
+        read_size = max(self.storage.profile_for(path).read_size for path, _ in group)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, self._timed_compare, group, read_size)
+        except Exception as e:
+            logger.error(f"Error comparing {', '.join(path for path, _ in group)}: {e}")
+            return {}
+
+    async def _compare_done(
+        self, key: Hashable, group: List[Tuple[str, os.stat_result]], digests: Dict[str, str]
+    ) -> None:
+        self.status["hashed_files"] += len(group)
+        for path, st in group:
+            if path in digests:
+                self._add_digest((*key, digests[path]), path, st)
+
+    def _timed_compare(self, group: List[Tuple[str, os.stat_result]], read_size: int) -> Dict[str, str]:
+        """Compare a group in lockstep, reporting its duration to the profiler."""
+        start = time.perf_counter()
+        digests = get_group_hashes(self.index, group, read_size)
+        if self.profiler is not None:
+            size = sum(st.st_size for _, st in group)
+            self.profiler.record_hash(", ".join(path for path, _ in group), "lockstep", size, time.perf_counter() - start)
+        return digests
+
+    def _timed_hash(
+        self, kind: str, column: str, size: int, compute: Callable[..., Optional[str]],
+        path: str, st: os.stat_result, *args: Any,
+    ) -> Optional[str]:
+        """Get a digest, reporting its throughput to the profiler.
+
+        Digests served from the index are not reported, they read nothing.
+        """
+        if self.profiler is None:
+            return compute(self.index, path, st, *args)
+        cached = self.index.get(path, st)
+        start = time.perf_counter()
+        digest = compute(self.index, path, st, *args)
+        if digest is not None and (cached is None or cached[column] is None):
+            self.profiler.record_hash(path, kind, size, time.perf_counter() - start)
+        return digest
@@ -0,0 +1,249 @@
+"""Optional flight recorder for scans, written as a JSON and HTML report."""
+
+import heapq
+import html
+import json
+import logging
+import os
+import sys
+import sysconfig
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("duplicate_video_finder")
+
+# Seconds between two stack samples
+SAMPLE_INTERVAL = 0.01
+
+# Number of entries kept for every "slowest" and "top" list
+TOP_N = 25
+
+# Frames tracemalloc keeps per allocation
+TRACEMALLOC_FRAMES = 10
+
+_STDLIB = sysconfig.get_paths()["stdlib"]
+
+# Functions a thread blocks in while it has nothing to do
+_IDLE_FUNCTIONS = {"wait", "select", "poll", "get", "acquire", "_worker", "run_forever", "_run_once"}
+
+
+class _StackSampler(threading.Thread):
+    """Sample the stacks of all threads, which unlike cProfile covers the
+    thread pool that does the hashing."""
+
+    def __init__(self):
+        super().__init__(name="scan-profiler", daemon=True)
+        self.samples = 0
+        self.self_counts: Dict[Tuple[str, int, str], int] = {}
+        self.total_counts: Dict[Tuple[str, str], int] = {}
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(SAMPLE_INTERVAL):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                if code.co_name in _IDLE_FUNCTIONS and code.co_filename.startswith(_STDLIB):
+                    continue
+                self.samples += 1
+                key = (code.co_filename, frame.f_lineno, code.co_name)
+                self.self_counts[key] = self.self_counts.get(key, 0) + 1
+                seen = set()
+                while frame is not None:
+                    function = (frame.f_code.co_filename, frame.f_code.co_name)
+                    if function not in seen:
+                        seen.add(function)
+                        self.total_counts[function] = self.total_counts.get(function, 0) + 1
+                    frame = frame.f_back
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+class ScanProfiler:
+    """Record where a scan spends its time and memory.
+
+    Collects directory listing latencies, per-file hash throughput, a
+    sampled CPU profile of all threads and tracemalloc allocation peaks.
+    """
+
+    def __init__(self, report_dir: str):
+        """Initialize the profiler; nothing is recorded before ``start``."""
+        self.report_dir = report_dir
+        self._lock = threading.Lock()
+        self._slow_dirs: List[Tuple[float, str, int]] = []
+        self._slow_files: List[Tuple[float, str, str, int]] = []
+        self._listing = {"count": 0, "seconds": 0.0, "entries": 0}
+        self._hashing: Dict[str, Dict[str, float]] = {}
+        self._sampler: Optional[_StackSampler] = None
+        self._started = 0.0
+        self._started_at = ""
+
+    def start(self) -> None:
+        """Start sampling stacks and tracing allocations."""
+        self._started = time.monotonic()
+        self._started_at = time.strftime("%Y-%m-%d %H:%M:%S")
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._sampler = _StackSampler()
+        self._sampler.start()
+
+    @staticmethod
+    def _keep_top(heap: List[Tuple], item: Tuple) -> None:
+        if len(heap) < TOP_N:
+            heapq.heappush(heap, item)
+        else:
+            heapq.heappushpop(heap, item)
+
+    def record_listing(self, directory: str, seconds: float, entries: int) -> None:
+        """Record how long listing one directory took."""
+        with self._lock:
+            self._listing["count"] += 1
+            self._listing["seconds"] += seconds
+            self._listing["entries"] += entries
+            self._keep_top(self._slow_dirs, (seconds, directory, entries))
+
+    def record_hash(self, path: str, kind: str, size: int, seconds: float) -> None:
+        """Record one digest computation of ``size`` bytes."""
+        with self._lock:
+            totals = self._hashing.setdefault(kind, {"files": 0, "bytes": 0, "seconds": 0.0})
+            totals["files"] += 1
+            totals["bytes"] += size
+            totals["seconds"] += seconds
+            self._keep_top(self._slow_files, (seconds, path, kind, size))
+
+    def stop(self, status: Dict[str, Any]) -> Optional[str]:
+        """Stop recording and write the report.
+
+        Returns the report's base name, or None if it could not be written.
+        """
+        if self._sampler is not None:
+            self._sampler.stop()
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        tracemalloc.stop()
+
+        report = self._build(status, current, peak, snapshot)
+        now = time.time()
+        name = time.strftime("scan-%Y%m%d-%H%M%S", time.localtime(now)) + f"-{int(now * 1000) % 1000:03d}"
+        try:
+            os.makedirs(self.report_dir, exist_ok=True)
+            with open(os.path.join(self.report_dir, f"{name}.json"), "w") as f:
+                json.dump(report, f, indent=2)
+            with open(os.path.join(self.report_dir, f"{name}.html"), "w") as f:
+                f.write(_render_html(report))
+        except OSError as e:
+            logger.error(f"Could not write scan report to {self.report_dir}: {e}")
+            return None
+        logger.info(f"Wrote scan profile to {os.path.join(self.report_dir, name)}.json/.html")
+        return name
+
+    def _build(self, status: Dict[str, Any], current: int, peak: int, snapshot: tracemalloc.Snapshot) -> Dict[str, Any]:
+        sampler = self._sampler
+        samples = max(sampler.samples if sampler else 0, 1)
+        listing = dict(self._listing)
+        listing["average_ms"] = round(1000 * listing["seconds"] / listing["count"], 3) if listing["count"] else None
+        hashing = {}
+        for kind, totals in self._hashing.items():
+            hashing[kind] = {
+                **totals,
+                "mib_per_second": round(totals["bytes"] / totals["seconds"] / 2 ** 20, 2) if totals["seconds"] else None,
+            }
+
+        return {
+            "started": self._started_at,
+            "duration_seconds": round(time.monotonic() - self._started, 3),
+            "status": {k: v for k, v in status.items() if isinstance(v, (int, float, str)) or v is None},
+            "listing": listing,
+            "slowest_directories": [
+                {"path": path, "seconds": round(seconds, 4), "entries": entries}
+                for seconds, path, entries in sorted(self._slow_dirs, reverse=True)
+            ],
+            "hashing": hashing,
+            "slowest_files": [
+                {
+                    "path": path,
+                    "kind": kind,
+                    "bytes": size,
+                    "seconds": round(seconds, 4),
+                    "mib_per_second": round(size / seconds / 2 ** 20, 2) if seconds else None,
+                }
+                for seconds, path, kind, size in sorted(self._slow_files, reverse=True)
+            ],
+            "cpu": {
+                "samples": samples if sampler else 0,
+                "interval_ms": SAMPLE_INTERVAL * 1000,
+                "self": [
+                    {"function": f"{func} ({filename}:{lineno})", "share": round(count / samples, 4)}
+                    for (filename, lineno, func), count in heapq.nlargest(
+                        TOP_N, sampler.self_counts.items(), key=lambda item: item[1]
+                    )
+                ] if sampler else [],
+                "cumulative": [
+                    {"function": f"{func} ({filename})", "share": round(count / samples, 4)}
+                    for (filename, func), count in heapq.nlargest(
+                        TOP_N, sampler.total_counts.items(), key=lambda item: item[1]
+                    )
+                ] if sampler else [],
+            },
+            "memory": {
+                "current_bytes": current,
+                "peak_bytes": peak,
+                "top_allocations": [
+                    {
+                        "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                        "bytes": stat.size,
+                        "blocks": stat.count,
+                    }
+                    for stat in snapshot.statistics("lineno")[:TOP_N]
+                ],
+            },
+        }
+
+
+def _table(title: str, rows: List[Dict[str, Any]]) -> str:
+    if not rows:
+        return f"<h2>{html.escape(title)}</h2><p>Nothing recorded.</p>"
+    head = "".join(f"<th>{html.escape(str(key))}</th>" for key in rows[0])
+    body = "".join(
+        "<tr>" + "".join(f"<td>{html.escape(str(value))}</td>" for value in row.values()) + "</tr>"
+        for row in rows
+    )
+    return f"<h2>{html.escape(title)}</h2><table><tr>{head}</tr>{body}</table>"
+
+
+def _render_html(report: Dict[str, Any]) -> str:
+    """Render a report as a standalone HTML page."""
+    summary = [
+        {"metric": "Started", "value": report["started"]},
+        {"metric": "Duration (s)", "value": report["duration_seconds"]},
+        {"metric": "Directories listed", "value": report["listing"]["count"]},
+        {"metric": "Average listing (ms)", "value": report["listing"]["average_ms"]},
+        {"metric": "Peak traced memory (MiB)", "value": round(report["memory"]["peak_bytes"] / 2 ** 20, 2)},
+        {"metric": "CPU samples", "value": report["cpu"]["samples"]},
+    ]
+    for kind, totals in report["hashing"].items():
+        summary.append({"metric": f"{kind} hashing (MiB/s)", "value": totals["mib_per_second"]})
+    sections = [
+        _table("Summary", summary),
+        _table("Slowest directories", report["slowest_directories"]),
+        _table("Slowest files", report["slowest_files"]),
+        _table("CPU time by function (self)", report["cpu"]["self"]),
+        _table("CPU time by function (cumulative)", report["cpu"]["cumulative"]),
+        _table("Allocation hot spots", report["memory"]["top_allocations"]),
+    ]
+    return (
+        "<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>Scan profile</title>"
+        "<style>body{font-family:sans-serif;margin:16px}table{border-collapse:collapse;margin-bottom:24px}"
+        "td,th{border:1px solid #ccc;padding:4px 8px;text-align:left;font-size:13px}"
+        "td{font-family:monospace}</style></head><body><h1>Scan profile</h1>"
+        + "".join(sections)
+        + "</body></html>"
+    )
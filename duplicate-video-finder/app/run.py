@@ -3,19 +3,43 @@
 import os
 import sys
 import json
+import shutil
+import socket
+import tempfile
+import argparse
+import asyncio
+import functools
 import logging
-import hashlib
+import multiprocessing
 import time
 from pathlib import Path
-from typing import Dict, List, Any, Set, Tuple, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Any, Set, Tuple, Optional
 
 import uvicorn
-from fastapi import FastAPI, Request, HTTPException, Depends
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Request, HTTPException, Depends, Query
+from fastapi.responses import FileResponse, HTMLResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 
+from agents import LOCAL_AGENT, POLL_SECONDS, AgentRegistry, hash_local, report_local, run_agent
+from checkpoint import ScanCheckpoint
+from chunking import DEFAULT_MIN_OVERLAP, ChunkIndex, find_overlaps
+from container import metadata_signature, read_metadata
+from export import EXPORT_FORMATS, write_results
+from grouping import ExternalGrouper, read_groups, spill_groups
+from hashing import HASH_MODES
+from http_cache import cached_json
+from index import FileIndex
+from lookup import find_copies
+from pipeline import ScanPipeline
+from profiling import ScanProfiler
+from state_store import StateStore
+from thumbnails import ThumbnailCache, file_identity
+from trees import duplicated_files_under, find_duplicate_trees, find_tree
+from truncation import find_truncated
+from walker import initial_frontier, scan_directory
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -27,11 +51,9 @@ logger = logging.getLogger("duplicate_video_finder")
 # Initialize FastAPI app
 app = FastAPI(title="Duplicate Video Finder")
 
-# Create the required directories if they don't exist
-static_dir = os.path.join(os.getcwd(), "static")
-templates_dir = os.path.join(os.getcwd(), "templates")
-os.makedirs(static_dir, exist_ok=True)
-os.makedirs(templates_dir, exist_ok=True)
+# Static files and templates ship next to this module
+static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+templates_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
 
 # Mount static files directory
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
@@ -39,14 +61,11 @@ app.mount("/static", StaticFiles(directory=static_dir), name="static")
 # Setup Jinja2 templates
 templates = Jinja2Templates(directory=templates_dir)
 
-# Video file extensions to look for
-VIDEO_EXTENSIONS = {
-    ".mp4", ".mkv", ".avi", ".mov", ".wmv", ".flv", ".webm",
-    ".m4v", ".mpeg", ".mpg", ".3gp", ".ts", ".mts", ".m2ts"
-}
+# Persistent add-on storage, overridable to run several instances on one host
+DATA_DIR = os.environ.get("DATA_DIR", "/data")
 
 # Load configuration from Home Assistant options
-config_path = "/data/options.json"
+config_path = os.path.join(DATA_DIR, "options.json")
 config = {}
 
 try:
@@ -72,229 +91,995 @@ except json.JSONDecodeError as e:
 log_level = getattr(logging, config.get("log_level", "info").upper())
 logger.setLevel(log_level)
 
-# Store the scan results
-scan_results = {}
+# Profiling reports of scans started with ``profile``
+REPORTS_DIR = os.path.join(DATA_DIR, "reports")
+
+# Sorted runs of name scans that outgrow the memory budget
+SPILL_DIR = os.path.join(DATA_DIR, "spill")
+MEMORY_BUDGET = config.get("memory_budget_mb", 512) * 1024 * 1024
+
+# The state below is opened by ``open_server_state`` in the processes
+# serving the add-on, and by ``run_headless`` for a command line scan, so
+# importing this module opens nothing.
+
+# Cache of per-file metadata and digests that survives restarts
+file_index: Optional[FileIndex] = None
+
+# Chunk digests of files analyzed for partial overlaps
+chunk_index: Optional[ChunkIndex] = None
+
+# Preview frames of duplicate videos, generated when the UI asks for them
+thumbnail_cache: Optional[ThumbnailCache] = None
+
+# File indexes reported by scan agents on other hosts, kept in the state
+# store so every API worker sees them
+agent_registry: Optional[AgentRegistry] = None
+
+# Progress of the running scan, kept so it can resume after a restart
+scan_checkpoint: Optional[ScanCheckpoint] = None
+
+# Status and results of scans, shared by the scanner and all API workers.
+# Published results carry a generation, used as their ETag together with
+# the id of the store.
+state_store: Optional[StateStore] = None
+
+# Spill directory of the running scan
+spill_dir = SPILL_DIR
+
+# Number of processes serving the API; scans always run in their own process
+API_WORKERS = config.get("api_workers", 1)
+
+# Environment variable telling API workers that a scanner process runs
+SCANNER_ENV = "DUPLICATE_VIDEO_FINDER_SCANNER"
+
+# Seconds between checks for queued scans, and between status updates
+SCANNER_POLL_SECONDS = 0.5
+
+# Task running queued scans when no scanner process was started
+scanner_task: Optional[asyncio.Task] = None
+# Pipeline of the running content scan, for provisional results
+scan_pipeline: Optional[ScanPipeline] = None
+# Progress of the scan run by this process, published to the store
 scan_status = {
     "status": "idle",
+    "stage": None,
     "last_scan": None,
     "total_files": 0,
     "processed_files": 0,
+    "hashed_files": 0,
     "duplicate_sets": 0,
+    "last_report": None,
 }
 
 
+def open_server_state(read_only_index: bool = False) -> None:
+    """Open the indexes, caches and stores of the add-on in ``DATA_DIR``.
+
+    Called by every process serving the add-on; state that is already open,
+    or was set up by the caller, is kept. API workers next to a scanner
+    process open the file index ``read_only_index``, so lookups never hold
+    the write lock the scanner needs.
+    """
+    global file_index, chunk_index, thumbnail_cache, agent_registry, scan_checkpoint, state_store
+    if file_index is None:
+        file_index = FileIndex(os.path.join(DATA_DIR, "index.db"), read_only=read_only_index)
+    if chunk_index is None:
+        chunk_index = ChunkIndex(os.path.join(DATA_DIR, "chunks.db"))
+    if thumbnail_cache is None:
+        thumbnail_cache = ThumbnailCache(
+            os.path.join(DATA_DIR, "thumbnails"), config.get("thumbnail_cache_mb", 256) * 1024 * 1024
+        )
+    if scan_checkpoint is None:
+        scan_checkpoint = ScanCheckpoint(os.path.join(DATA_DIR, "checkpoint.json"))
+    if state_store is None:
+        state_store = StateStore(os.path.join(DATA_DIR, "state.db"))
+    if agent_registry is None:
+        agent_registry = AgentRegistry(state_store)
+
+
 class ScanRequest(BaseModel):
     paths: Optional[List[str]] = None
     exclude_paths: Optional[List[str]] = None
     scan_by_content: bool = False
+    scan_by_metadata: bool = False
+    hash_mode: str = "full"
+    resume: bool = False
+    find_duplicate_trees: bool = True
+    find_overlaps: bool = False
+    min_overlap: float = DEFAULT_MIN_OVERLAP
+    find_truncated: bool = False
+    profile: bool = False
+
+
+class LookupRequest(BaseModel):
+    path: str
+    verify: bool = False
+
+
+class AgentFilesRequest(BaseModel):
+    reset: bool = False
+    files: List[List[Any]] = []
+
+
+class AgentDigestsRequest(BaseModel):
+    partial: Dict[str, str] = {}
+    full: Dict[str, str] = {}
+    missing: List[str] = []
 
 
 class DeleteRequest(BaseModel):
     file_path: str
 
 
-def get_video_files(scan_paths: List[str], exclude_paths: List[str]) -> Dict[str, List[str]]:
-    """Scan file system for video files and group by filename."""
-    video_files = {}
-    total_files = 0
-    processed_files = 0
+class DeleteTreeRequest(BaseModel):
+    path: str
+
+
+def get_video_files(
+    scan_paths: List[str],
+    exclude_paths: List[str],
+    state: Optional[Dict[str, Any]] = None,
+    profiler: Optional[ScanProfiler] = None,
+) -> ExternalGrouper:
+    """Scan file system for video files and group them by filename.
+
+    The walk keeps an explicit stack of directories still to visit. The
+    stack, the sorted runs spilled so far and the number of files found are
+    kept in ``state``, while the files themselves are appended to the
+    checkpoint's file list, so checkpoints never write the grouped files
+    out again and passing a saved ``state`` resumes an interrupted walk.
+    Files are grouped in memory up to the memory budget and in sorted runs
+    on disk beyond it. The caller streams the groups of the returned
+    grouper and closes it.
+    """
+    if state is None:
+        state = {}
+    if any(not os.path.exists(run) for run in state.get("runs", [])):
+        logger.warning("Sorted runs of the interrupted scan are missing, walking again")
+        state.pop("frontier", None)
+    if "frontier" not in state:
+        state.update(frontier=initial_frontier(scan_paths), runs=[], spilled_records=0, listed_files=0)
+        scan_checkpoint.clear()
+    frontier: List[str] = state["frontier"]
+    video_files = ExternalGrouper(spill_dir, MEMORY_BUDGET, state)
+
+    # Files found before an interruption are grouped again, except those
+    # already written to the sorted runs
+    spilled, listed = state["spilled_records"], 0
+    for batch in scan_checkpoint.read_files():
+        for file_path in batch[:state["listed_files"] - listed]:
+            if listed >= spilled:
+                video_files.add(os.path.basename(file_path), file_path)
+            listed += 1
+    processed_files = listed
+    unsaved: List[str] = []
 
     # Update scan status
     scan_status["status"] = "scanning"
-    scan_status["total_files"] = 0
-    scan_status["processed_files"] = 0
+    scan_status["stage"] = "walking"
+    scan_status["total_files"] = processed_files
+    scan_status["processed_files"] = processed_files
+    scan_status["hashed_files"] = 0
     scan_status["duplicate_sets"] = 0
 
-    # First pass to count total files (for progress reporting)
-    logger.info("Counting files for scan...")
-    for base_path in scan_paths:
-        try:
-            base_path = Path(base_path)
-            if not base_path.exists():
-                logger.warning(f"Path does not exist: {base_path}")
-                continue
-
-            for path in base_path.rglob("*"):
-                if path.is_file() and path.suffix.lower() in VIDEO_EXTENSIONS:
-                    # Check if this file should be excluded
-                    if any(str(path).startswith(exclude) for exclude in exclude_paths):
-                        continue
-                    total_files += 1
-        except Exception as e:
-            logger.error(f"Error counting files in {base_path}: {e}")
+    while frontier:
+        directory = frontier.pop()
+        started = time.perf_counter()
+        subdirs, paths = scan_directory(directory, exclude_paths)
+        if profiler is not None:
+            profiler.record_listing(directory, time.perf_counter() - started, len(subdirs) + len(paths))
+        frontier.extend(subdirs)
 
-    scan_status["total_files"] = total_files
-    logger.info(f"Found {total_files} video files to process")
+        for file_path in paths:
+            video_files.add(os.path.basename(file_path), file_path)
+            unsaved.append(file_path)
 
-    # Second pass to process files
-    for base_path in scan_paths:
-        try:
-            base_path = Path(base_path)
-            if not base_path.exists():
-                continue
-
-            for path in base_path.rglob("*"):
-                if path.is_file() and path.suffix.lower() in VIDEO_EXTENSIONS:
-                    # Check if this file should be excluded
-                    if any(str(path).startswith(exclude) for exclude in exclude_paths):
-                        continue
+            # Update progress
+            processed_files += 1
+            scan_status["processed_files"] = processed_files
+            scan_status["total_files"] = processed_files
 
-                    filename = path.name
-                    file_path = str(path)
+            # Log progress every 100 files
+            if processed_files % 100 == 0:
+                logger.info(f"Found {processed_files} video files")
 
-                    if filename not in video_files:
-                        video_files[filename] = []
-                    video_files[filename].append(file_path)
+        if scan_checkpoint.is_due():
+            save_walk_checkpoint(state, unsaved)
 
-                    # Update progress
-                    processed_files += 1
-                    scan_status["processed_files"] = processed_files
+    save_walk_checkpoint(state, unsaved)
+    logger.info(f"Found {processed_files} video files")
+    return video_files
 
-                    # Log progress every 100 files
-                    if processed_files % 100 == 0:
-                        logger.info(f"Processed {processed_files}/{total_files} files")
 
-        except Exception as e:
-            logger.error(f"Error scanning {base_path}: {e}")
+def save_checkpoint(state: Dict[str, Any]) -> None:
+    """Persist the scan state, committing completed digests to the index first."""
+    file_index.commit()
+    scan_checkpoint.save(state)
 
-    # Filter out non-duplicates
-    duplicate_files = {k: v for k, v in video_files.items() if len(v) > 1}
-    scan_status["duplicate_sets"] = len(duplicate_files)
 
-    return duplicate_files
+def save_walk_checkpoint(state: Dict[str, Any], unsaved: List[str]) -> None:
+    """Append the files found since the last checkpoint and persist the walk position."""
+    scan_checkpoint.add_files(unsaved)
+    state["listed_files"] += len(unsaved)
+    unsaved.clear()
+    save_checkpoint(state)
 
 
-def calculate_file_hash(file_path: str, chunk_size: int = 8192) -> str:
-    """Calculate MD5 hash of a file for content-based duplicate detection."""
-    hash_md5 = hashlib.md5()
+def get_file_metadata(file_path: str) -> Optional[Dict[str, Any]]:
+    """Get container metadata for a file, using the index when it is current."""
     try:
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(chunk_size), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
-    except Exception as e:
-        logger.error(f"Error hashing file {file_path}: {e}")
-        return "error"
+        st = os.stat(file_path)
+    except OSError as e:
+        logger.error(f"Error reading metadata for {file_path}: {e}")
+        return None
 
+    # Store an empty dict for unparseable files so they are not re-read
+    return file_index.get_or_compute(file_path, st, "meta", lambda: read_metadata(file_path) or {}) or None
 
-def get_duplicate_videos_by_content(files_by_name: Dict[str, List[str]]) -> Dict[str, List[str]]:
-    """Group duplicate videos by content hash."""
-    content_duplicates = {}
+
+def get_duplicate_videos_by_metadata(
+    files_by_name: Iterable[Tuple[str, List[str]]], total_files: int
+) -> Iterator[Tuple[str, List[str]]]:
+    """Split duplicate candidates by duration, track count, resolution and codec.
+
+    Only a few KB of each file header are read, so this is a cheap filter to
+    run before any content hashing. Groups are read and yielded one at a
+    time, so large libraries never have to be held in memory.
+    """
     files_processed = 0
-    total_files = sum(len(files) for files in files_by_name.values())
+    scan_status["stage"] = "metadata"
+    scan_status["total_files"] = total_files
+    scan_status["processed_files"] = 0
 
-    for filename, file_paths in files_by_name.items():
-        file_hashes = {}
+    for filename, file_paths in files_by_name:
+        file_signatures = {}
 
         for file_path in file_paths:
-            file_hash = calculate_file_hash(file_path)
+            signature = metadata_signature(get_file_metadata(file_path)) or "unknown"
             files_processed += 1
+            scan_status["processed_files"] = files_processed
 
-            if file_hash not in file_hashes:
-                file_hashes[file_hash] = []
-            file_hashes[file_hash].append(file_path)
+            if signature not in file_signatures:
+                file_signatures[signature] = []
+            file_signatures[signature].append(file_path)
 
-            # Log progress for large sets
-            if files_processed % 10 == 0:
-                logger.info(f"Hashed {files_processed}/{total_files} files")
+            if files_processed % 100 == 0:
+                logger.info(f"Read metadata for {files_processed}/{total_files} files")
 
-        # Keep only duplicates (more than one file with the same hash)
-        for file_hash, paths in file_hashes.items():
+        # Keep only groups that still contain more than one file
+        for signature, paths in file_signatures.items():
             if len(paths) > 1:
-                content_duplicates[f"{filename}_{file_hash[:8]}"] = paths
+                yield f"{filename}_{signature}", paths
 
-    return content_duplicates
+    file_index.commit()
 
 
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
     """Serve the main index page."""
+    status = await asyncio.get_running_loop().run_in_executor(None, state_store.status)
     return templates.TemplateResponse(
         "index.html",
-        {"request": request, "scan_status": scan_status}
+        {"request": request, "scan_status": status}
     )
 
 
 @app.get("/api/status")
-async def get_status():
+async def get_status(request: Request):
     """Get the current scan status."""
-    return scan_status
+    return await cached_json(request, lambda: {
+        **state_store.status(),
+        "generation": state_store.generation,
+    })
 
 
 @app.get("/api/results")
-async def get_results():
-    """Get the scan results."""
-    return {
-        "duplicates": [
-            {"name": name, "count": len(paths), "paths": paths}
-            for name, paths in scan_results.items()
-        ]
-    }
+async def get_results(
+    request: Request,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    paths: bool = True,
+):
+    """Get the scan results.
+
+    While a content scan runs, the sets it has confirmed so far are returned
+    instead, flagged as provisional. ``offset`` and ``limit`` select a page
+    of sets, and with ``paths`` off only the name and count of each set are
+    sent, so large results can be listed before any paths are needed.
+    """
+    provisional, generation, instance = await asyncio.get_running_loop().run_in_executor(None, served_version)
+
+    def payload() -> Dict[str, Any]:
+        return {
+            "provisional": provisional,
+            "generation": generation,
+            "instance": instance,
+            "total": state_store.count(provisional),
+            "duplicates": state_store.page(offset, limit, paths, provisional),
+        }
+
+    return await cached_json(
+        request,
+        payload,
+        # Provisional results change without a new generation
+        version=None if provisional else f"results-{instance}-{generation}-{offset}-{limit}-{paths:d}",
+    )
+
+
+@app.get("/api/results/set")
+async def get_result_set(request: Request, name: str):
+    """Get a single duplicate set with all of its paths."""
+    loop = asyncio.get_running_loop()
+    provisional, generation, instance = await loop.run_in_executor(None, served_version)
+    paths = await loop.run_in_executor(None, state_store.result_set, name, provisional)
+    if paths is None:
+        raise HTTPException(status_code=404, detail="Duplicate set not found")
+    return await cached_json(
+        request,
+        lambda: {"name": name, "count": len(paths), "paths": paths, "provisional": provisional},
+        version=None if provisional else f"set-{instance}-{generation}",
+    )
+
+
+@app.get("/api/results/changes")
+async def get_result_changes(request: Request, since: int, instance: Optional[str] = None):
+    """Get the duplicate sets added, removed or modified after generation ``since``.
+
+    Set names are stable across scans and serve as set IDs. When ``since``
+    is too old or belongs to another state database, ``reset`` tells the
+    client to fetch ``/api/results`` again.
+    """
+    loop = asyncio.get_running_loop()
+    _, generation, instance_id = await loop.run_in_executor(None, served_version)
+    if instance is not None and instance != instance_id:
+        changes = {"generation": generation, "reset": True}
+    else:
+        changes = await loop.run_in_executor(None, state_store.changes, since)
+
+    def sets(names: List[str]) -> List[Dict[str, Any]]:
+        entries = []
+        for name in names:
+            paths = state_store.result_set(name, provisional=False)
+            if paths is not None:
+                entries.append({"name": name, "count": len(paths), "paths": paths})
+        return entries
+
+    def payload() -> Dict[str, Any]:
+        if changes["reset"]:
+            return {**changes, "instance": instance_id}
+        return {
+            "generation": changes["generation"],
+            "instance": instance_id,
+            "reset": False,
+            "added": sets(changes["added"]),
+            "modified": sets(changes["modified"]),
+            "removed": changes["removed"],
+        }
+
+    return await cached_json(request, payload, version=f"changes-{instance_id}-{changes['generation']}-{since}")
+
+
+def served_version() -> Tuple[bool, int, str]:
+    """Return whether provisional sets are served, the generation and the state database id."""
+    return state_store.is_provisional(), state_store.generation, state_store.instance
+
+
+def forget_deleted(paths: List[str]) -> None:
+    """Drop deleted files from the results and publish the change.
+
+    Sets left with a single file are removed.
+    """
+    state_store.forget(paths)
+
+
+@app.get("/api/trees")
+async def get_trees(request: Request):
+    """Get directory trees that are fully or mostly duplicated."""
+    _, generation, instance = await asyncio.get_running_loop().run_in_executor(None, served_version)
+    return await cached_json(
+        request,
+        lambda: {"trees": state_store.get("trees", [])},
+        version=f"trees-{instance}-{generation}",
+    )
+
+
+@app.get("/api/truncated")
+async def get_truncated(request: Request):
+    """Get files that are incomplete copies of longer files."""
+    _, generation, instance = await asyncio.get_running_loop().run_in_executor(None, served_version)
+    return await cached_json(
+        request,
+        lambda: {"truncated": state_store.get("truncated", [])},
+        version=f"truncated-{instance}-{generation}",
+    )
+
+
+@app.get("/api/overlaps")
+async def get_overlaps(request: Request):
+    """Get partially overlapping files and the space deduplication would save."""
+    _, generation, instance = await asyncio.get_running_loop().run_in_executor(None, served_version)
+    return await cached_json(
+        request,
+        lambda: state_store.get("overlaps") or {"pairs": [], "savings": None, "files": 0},
+        version=f"overlaps-{instance}-{generation}",
+    )
+
+
+@app.get("/api/thumbnail")
+async def get_thumbnail(request: Request, path: str):
+    """Get a preview frame of a video from the scan results."""
+    loop = asyncio.get_running_loop()
+    if not await loop.run_in_executor(None, state_store.contains, path):
+        raise HTTPException(status_code=404, detail="File is not part of the scan results")
+    if not thumbnail_cache.available:
+        raise HTTPException(status_code=503, detail="Thumbnails need ffmpeg")
+
+    try:
+        etag = f'"{file_identity(path, await loop.run_in_executor(None, os.stat, path))}"'
+    except OSError:
+        raise HTTPException(status_code=404, detail="File not found")
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=3600"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    thumbnail = await thumbnail_cache.get(path)
+    if thumbnail is None:
+        raise HTTPException(status_code=404, detail="Could not extract a frame from the file")
+    return FileResponse(thumbnail, media_type="image/jpeg", headers=headers)
+
+
+@app.get("/api/reports")
+async def get_reports():
+    """List the profiling reports of earlier scans, newest first."""
+    try:
+        names = {os.path.splitext(name)[0] for name in os.listdir(REPORTS_DIR) if name.endswith(".json")}
+    except FileNotFoundError:
+        names = set()
+    return {"reports": sorted(names, reverse=True)}
+
+
+@app.get("/api/reports/{name}")
+async def get_report(name: str):
+    """Get one profiling report, as HTML or as JSON with a .json suffix."""
+    base, ext = os.path.splitext(os.path.basename(name))
+    if ext not in ("", ".json", ".html"):
+        raise HTTPException(status_code=404, detail="Report not found")
+    ext = ext or ".html"
+    report = os.path.join(REPORTS_DIR, f"{base}{ext}")
+    if not os.path.isfile(report):
+        raise HTTPException(status_code=404, detail="Report not found")
+    media_type = "application/json" if ext == ".json" else "text/html"
+    return FileResponse(report, media_type=media_type)
 
 
 @app.post("/api/scan")
 async def start_scan(request: ScanRequest):
-    """Start a scan for duplicate videos."""
-    global scan_results
-
-    # If already scanning, return error
-    if scan_status["status"] == "scanning":
+    """Queue a scan for duplicate videos with the scanner."""
+    if request.hash_mode not in HASH_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown hash mode: {request.hash_mode}")
+
+    loop = asyncio.get_running_loop()
+    if request.resume:
+        status = await loop.run_in_executor(None, state_store.status)
+        if not status.get("resumable"):
+            raise HTTPException(status_code=404, detail="No interrupted scan to resume")
+        params = None
+    else:
+        # Use provided paths or default from config
+        params = {
+            "paths": request.paths if request.paths else config["scan_paths"],
+            "exclude_paths": request.exclude_paths if request.exclude_paths else config["exclude_paths"],
+            "scan_by_metadata": request.scan_by_metadata,
+            "scan_by_content": request.scan_by_content,
+            "hash_mode": request.hash_mode,
+            "find_duplicate_trees": request.find_duplicate_trees,
+            "find_overlaps": request.find_overlaps,
+            "min_overlap": request.min_overlap,
+            "find_truncated": request.find_truncated,
+            "io_profile": config.get("io_profile", "auto"),
+        }
+
+    queued = await loop.run_in_executor(
+        None,
+        state_store.request_scan,
+        {"params": params, "resume": request.resume, "profile": request.profile},
+        time.strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    if not queued:
         raise HTTPException(status_code=400, detail="A scan is already in progress")
 
-    # Use provided paths or default from config
-    scan_paths = request.paths if request.paths else config["scan_paths"]
-    exclude_paths = request.exclude_paths if request.exclude_paths else config["exclude_paths"]
+    return {"status": "started"}
+
+
+def publish_status() -> None:
+    """Write the progress of this process's scan to the store."""
+    state_store.update_status({**scan_status, "resumable": scan_checkpoint.summary()})
+
+
+async def publish_progress() -> None:
+    """Publish the status, and the sets a content scan confirmed, until cancelled.
+
+    Writes run on the event loop, so none is left in flight once the task
+    is cancelled and the final results are published. Confirmed sets are
+    only written again after they changed.
+    """
+    shown = None
+    while True:
+        publish_status()
+        if scan_pipeline is not None and scan_pipeline.version != shown:
+            shown = scan_pipeline.version
+            state_store.set_provisional(scan_pipeline.results())
+        await asyncio.sleep(SCANNER_POLL_SECONDS)
+
+
+async def execute_scan(request: Dict[str, Any]) -> None:
+    """Run a scan request queued through the API."""
+    if request["resume"]:
+        state = scan_checkpoint.load()
+        if state is None:
+            logger.warning("No interrupted scan to resume")
+            scan_status["status"] = "idle"
+            publish_status()
+            return
+        params = state["params"]
+        logger.info(f"Resuming scan from the {state['stage']} stage saved at {state.get('saved_at')}")
+    else:
+        params = request["params"]
+        state = {"params": params, "stage": "pipeline" if params["scan_by_content"] else "walk"}
+        # Runs of an abandoned scan are not needed any more
+        shutil.rmtree(spill_dir, ignore_errors=True)
+        logger.info(f"Starting scan with paths: {params['paths']}, excluding: {params['exclude_paths']}")
 
-    logger.info(f"Starting scan with paths: {scan_paths}, excluding: {exclude_paths}")
-
-    # Run the scan in the background
     scan_status["status"] = "scanning"
-    scan_status["last_scan"] = time.strftime("%Y-%m-%d %H:%M:%S")
-
+    scan_status["last_scan"] = request["started"]
+    progress = asyncio.create_task(publish_progress())
     try:
-        # Get files grouped by name first
-        files_by_name = get_video_files(scan_paths, exclude_paths)
+        if await run_scan(params, state, state_store.publish, request["profile"]):
+            scan_status["status"] = "idle"
+            scan_status["stage"] = None
+        elif state_store.is_provisional():
+            state_store.set_provisional(None)
+    finally:
+        progress.cancel()
+        publish_status()
+
+
+def recover_status() -> None:
+    """Continue from the stored status, ending scans interrupted by a restart.
+
+    Interrupted scans are offered for resuming instead, from their checkpoint.
+    """
+    scan_status.update({key: value for key, value in state_store.status().items() if key in scan_status})
+    if scan_status["status"] == "scanning" and state_store.get("scan_request") is None:
+        scan_status["status"] = "idle"
+        scan_status["stage"] = None
+    if state_store.is_provisional():
+        state_store.set_provisional(None)
+    publish_status()
+
+
+async def scanner_loop() -> None:
+    """Run the scans queued by the API workers, one at a time."""
+    recover_status()
+    loop = asyncio.get_running_loop()
+    next_agent_poll = 0.0
+    while True:
+        request = state_store.take_scan_request()
+        if request is None:
+            # Agents' reports may call for digests of the library's files
+            if time.monotonic() >= next_agent_poll:
+                next_agent_poll = time.monotonic() + POLL_SECONDS
+                try:
+                    await loop.run_in_executor(None, hash_local, agent_registry, file_index)
+                except Exception as e:
+                    logger.error(f"Error hashing files for agents: {e}")
+            await asyncio.sleep(SCANNER_POLL_SECONDS)
+            continue
+        await execute_scan(request)
+
+
+def run_scanner() -> None:
+    """Entry point of the scanner process started by ``main``."""
+    open_server_state()
+    try:
+        asyncio.run(scanner_loop())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        file_index.close()
+        chunk_index.close()
+
+
+@app.on_event("startup")
+async def start_scanner():
+    """Open the add-on state and run scans, unless ``main`` started a scanner process."""
+    global scanner_task
+    open_server_state(read_only_index=os.environ.get(SCANNER_ENV) == "process")
+    if os.environ.get(SCANNER_ENV) != "process":
+        scanner_task = asyncio.create_task(scanner_loop())
+
+
+async def run_scan(
+    params: Dict[str, Any],
+    state: Dict[str, Any],
+    publish: Callable[[Iterable[Tuple[str, List[str]]], Dict[str, Any]], Any],
+    profile: bool = False,
+) -> bool:
+    """Run a scan to completion and hand its results to ``publish``.
+
+    ``publish`` is called in a worker thread with the duplicate sets, as
+    ``(name, paths)`` pairs that may be read from disk while it goes, and
+    the documents published along with them (trees, overlaps, truncated
+    copies). Returns False if the scan or publishing failed. Content scans
+    stream through the asyncio pipeline. Name scans walk and group in a
+    worker thread so the API stays responsive meanwhile, and their groups
+    are never all held in memory. With ``profile`` a report of where the
+    scan spent its time and memory is written to the reports directory.
+    """
+    global scan_pipeline
+    loop = asyncio.get_running_loop()
+    profiler = ScanProfiler(REPORTS_DIR) if profile else None
+    if profiler is not None:
+        profiler.start()
+    content_results: Dict[str, List[str]] = {}
+    video_files: Optional[ExternalGrouper] = None
+    all_files: Optional[List[str]] = None
 
-        # If content-based scan requested, further process by hash
-        if request.scan_by_content:
+    try:
+        if params["scan_by_content"]:
+            # Digests hashed before an interruption are reused from the index
+            if state.get("stage") != "pipeline":
+                state = {"params": params, "stage": "pipeline"}
             logger.info("Performing content-based duplicate detection")
-            scan_results = get_duplicate_videos_by_content(files_by_name)
+            scan_pipeline = ScanPipeline(
+                file_index, params, state, scan_status, checkpoint=scan_checkpoint,
+                hash_workers=params.get("hash_workers"), profiler=profiler,
+                spill_dir=spill_dir, memory_budget=MEMORY_BUDGET,
+            )
+            content_results = await scan_pipeline.run()
+            results: Iterable[Tuple[str, List[str]]] = content_results.items()
+            all_files = await loop.run_in_executor(None, scan_checkpoint.files)
         else:
-            scan_results = files_by_name
-
-        logger.info(f"Scan completed. Found {len(scan_results)} duplicate sets")
+            # Get files grouped by name first; a finished walk only regroups
+            # the files it found
+            if state.get("stage") != "walk":
+                state = {"params": params, "stage": "walk"}
+            video_files = await loop.run_in_executor(
+                None, get_video_files, params["paths"], params["exclude_paths"], state, profiler
+            )
+            results = video_files.groups()
+            if params.get("find_overlaps") and not video_files.spilled:
+                all_files = await loop.run_in_executor(None, scan_checkpoint.files)
+
+            # Cheaply drop candidates whose container metadata differs. The
+            # remaining sets go to disk, so publishing does not wait for
+            # metadata reads.
+            if params["scan_by_metadata"]:
+                logger.info("Performing metadata-based candidate filtering")
+                total = await loop.run_in_executor(
+                    None, lambda: sum(len(paths) for _, paths in video_files.groups())
+                )
+                filtered = await loop.run_in_executor(
+                    None, spill_groups, spill_dir, get_duplicate_videos_by_metadata(results, total)
+                )
+                results = read_groups(filtered)
+
+        # Roll duplicated files up into duplicated directory trees. Whole
+        # folders are deleted on the strength of these, so only sets whose
+        # contents were compared are rolled up.
+        trees = []
+        if params.get("find_duplicate_trees", True) and not params["scan_by_content"]:
+            logger.info("Skipping duplicate tree detection, it needs a content scan")
+        elif params.get("find_duplicate_trees", True):
+            trees = await loop.run_in_executor(
+                None, find_duplicate_trees, content_results, all_files, params["paths"]
+            )
+
+        # Head digests of the content scan single out incomplete copies
+        truncated = []
+        if params.get("find_truncated") and not params["scan_by_content"]:
+            logger.info("Skipping truncated copy detection, it needs a content scan")
+        elif params.get("find_truncated"):
+            logger.info("Looking for truncated copies")
+            truncated = await loop.run_in_executor(None, find_truncated, file_index, all_files, scan_status)
+
+        # Chunk the files that could overlap; chunks persist across scans
+        overlaps = None
+        if params.get("find_overlaps") and all_files is None:
+            logger.warning("Skipping overlap detection, the library exceeds the memory budget")
+        elif params.get("find_overlaps"):
+            logger.info("Chunking files to find partially overlapping videos")
+            overlaps = await loop.run_in_executor(
+                None, find_overlaps, chunk_index, file_index, all_files, scan_status,
+                params.get("min_overlap", DEFAULT_MIN_OVERLAP),
+            )
+
+        file_index.commit()
+        scan_status["stage"] = "publishing"
+        counted = [0]
+
+        def count(sets: Iterable[Tuple[str, List[str]]]) -> Iterator[Tuple[str, List[str]]]:
+            for entry in sets:
+                counted[0] += 1
+                yield entry
+
+        await loop.run_in_executor(None, publish, count(results), {
+            "trees": trees,
+            "overlaps": overlaps,
+            "truncated": truncated,
+            "content_verified": params["scan_by_content"],
+        })
+        # Drop index rows of files the completed walk no longer found
+        await loop.run_in_executor(
+            None, file_index.prune, params["paths"],
+            (path for batch in scan_checkpoint.read_files() for path in batch),
+        )
+        # The library takes part in the duplicates found across agents
+        if agent_registry is not None:
+            await loop.run_in_executor(None, report_local, agent_registry, scan_checkpoint.read_files(), file_index)
+        scan_checkpoint.clear()
+        scan_status["duplicate_sets"] = counted[0]
+        logger.info(f"Scan completed. Found {counted[0]} duplicate sets")
     except Exception as e:
         logger.error(f"Error during scan: {e}")
         scan_status["status"] = "error"
-        return {"status": "error", "message": str(e)}
+        return False
+    finally:
+        scan_pipeline = None
+        if profiler is not None:
+            scan_status["last_report"] = await loop.run_in_executor(None, profiler.stop, dict(scan_status))
+
+    # Sorted runs are kept for resuming until the results are published
+    if video_files is not None:
+        video_files.close()
+    shutil.rmtree(spill_dir, ignore_errors=True)
+    return True
+
+
+@app.post("/api/lookup")
+async def lookup_file(request: LookupRequest):
+    """Check whether a file already exists in the library.
+
+    Answers from the index of previous content scans without walking.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(None, find_copies, file_index, request.path, request.verify)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    except OSError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 
-    scan_status["status"] = "idle"
-    return {"status": "success", "duplicate_sets": len(scan_results)}
+@app.get("/api/agents")
+async def get_agents(request: Request):
+    """Get the reporting agents and the duplicates found across them."""
+    return await cached_json(request, lambda: {
+        "agents": agent_registry.summary(),
+        "duplicates": [
+            {"name": name, "count": len(paths), "paths": paths}
+            for name, paths in agent_registry.duplicates().items()
+        ],
+    })
+
+
+@app.post("/api/agents/{name}/files")
+async def report_agent_files(name: str, request: AgentFilesRequest):
+    """Receive a batch of an agent's file index."""
+    if name == LOCAL_AGENT:
+        raise HTTPException(status_code=400, detail=f"The agent name {LOCAL_AGENT} is reserved for this library")
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(
+        None, functools.partial(agent_registry.add_files, name, request.files, reset=request.reset)
+    )
+    return {"status": "success", "received": len(request.files)}
+
+
+@app.post("/api/agents/{name}/digests")
+async def report_agent_digests(name: str, request: AgentDigestsRequest):
+    """Receive digests from an agent and answer with the ones still needed."""
+    if name == LOCAL_AGENT:
+        raise HTTPException(status_code=400, detail=f"The agent name {LOCAL_AGENT} is reserved for this library")
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(
+        None, agent_registry.add_digests, name, request.partial, request.full, request.missing
+    )
+    return await loop.run_in_executor(None, agent_registry.needed, name)
 
 
 @app.post("/api/delete")
 async def delete_file(request: DeleteRequest):
     """Delete a file from the file system."""
     file_path = request.file_path
+    loop = asyncio.get_running_loop()
 
-    if not os.path.exists(file_path):
+    if not await loop.run_in_executor(None, os.path.exists, file_path):
         raise HTTPException(status_code=404, detail="File not found")
 
     try:
-        os.remove(file_path)
+        await loop.run_in_executor(None, os.remove, file_path)
         logger.info(f"Deleted file: {file_path}")
+        await loop.run_in_executor(None, forget_deleted, [file_path])
         return {"status": "success", "message": f"File deleted: {file_path}"}
     except Exception as e:
         logger.error(f"Error deleting file: {e}")
         return {"status": "error", "message": str(e)}
 
 
+def delete_duplicated_tree(directory: str) -> Dict[str, Any]:
+    """Delete the files of a reported duplicate tree that have a copy elsewhere.
+
+    Blocks on the file system and the state store, so it runs in an executor.
+    """
+    if not state_store.get("content_verified", False):
+        raise HTTPException(status_code=400, detail="Deleting folders needs the results of a content scan")
+    if find_tree(state_store.get("trees", []), directory) is None:
+        raise HTTPException(status_code=404, detail="Directory is not a reported duplicate tree")
+
+    deleted = []
+    freed_bytes = 0
+    errors = []
+    for file_path in duplicated_files_under(directory, state_store.results(provisional=False)):
+        try:
+            size = os.path.getsize(file_path)
+            os.remove(file_path)
+        except OSError as e:
+            logger.error(f"Error deleting file {file_path}: {e}")
+            errors.append(f"{file_path}: {e}")
+            continue
+        deleted.append(file_path)
+        freed_bytes += size
+
+    forget_deleted(deleted)
+    logger.info(f"Deleted {len(deleted)} files ({freed_bytes} bytes) from duplicate tree {directory}")
+    return {
+        "status": "error" if errors else "success",
+        "deleted": len(deleted),
+        "freed_bytes": freed_bytes,
+        "errors": errors,
+    }
+
+
+@app.post("/api/trees/delete")
+async def delete_tree(request: DeleteTreeRequest):
+    """Delete every file in a duplicated tree that still has a copy elsewhere.
+
+    Files without a copy outside the tree, and the directories themselves,
+    are left in place. Only results of a content scan are acted on.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, delete_duplicated_tree, os.path.normpath(request.path))
+
+
+def run_headless(args: argparse.Namespace) -> int:
+    """Run one scan from the command line and return the exit status.
+
+    The scan runs on the same engine as scans started through the API, but
+    the web server is never started and the add-on's status, results and
+    checkpoint are left alone: the checkpoint and spill files go to a
+    temporary directory, and digests are only cached in ``DATA_DIR`` when
+    it is set. Results go to ``--output``, logs to stderr.
+    """
+    global file_index, chunk_index, scan_checkpoint, spill_dir
+    params = {
+        "paths": args.paths or config["scan_paths"],
+        "exclude_paths": args.exclude if args.exclude is not None else config["exclude_paths"],
+        "scan_by_metadata": args.mode == "metadata",
+        "scan_by_content": args.mode == "content",
+        "hash_mode": args.hash_mode,
+        "hash_workers": args.workers,
+        "find_duplicate_trees": not args.no_trees,
+        "find_overlaps": args.overlaps,
+        "min_overlap": DEFAULT_MIN_OVERLAP,
+        "find_truncated": args.truncated,
+        "io_profile": config.get("io_profile", "auto"),
+    }
+    state = {"params": params, "stage": "pipeline" if params["scan_by_content"] else "walk"}
+    logger.info(f"Starting scan with paths: {params['paths']}, excluding: {params['exclude_paths']}")
+
+    def write(results: Iterable[Tuple[str, List[str]]], documents: Dict[str, Any]) -> None:
+        extra: Dict[str, Any] = {}
+        if args.truncated:
+            extra["truncated"] = documents["truncated"]
+        if args.overlaps:
+            extra["overlaps"] = documents["overlaps"]
+        if args.output == "-":
+            write_results(sys.stdout, args.format, results, documents["trees"], extra)
+        else:
+            with open(args.output, "w", newline="") as f:
+                write_results(f, args.format, results, documents["trees"], extra)
+
+    scan_status["status"] = "scanning"
+    scan_status["last_scan"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    # Digests are only cached across runs in a DATA_DIR set explicitly
+    cache_dir = os.environ.get("DATA_DIR")
+    with tempfile.TemporaryDirectory(prefix="duplicate-video-finder-") as work_dir:
+        file_index = FileIndex(os.path.join(cache_dir, "index.db") if cache_dir else ":memory:")
+        chunk_index = ChunkIndex(os.path.join(cache_dir, "chunks.db") if cache_dir else ":memory:")
+        scan_checkpoint = ScanCheckpoint(os.path.join(work_dir, "checkpoint.json"))
+        spill_dir = os.path.join(work_dir, "spill")
+        try:
+            completed = asyncio.run(run_scan(params, state, write))
+        finally:
+            file_index.close()
+            chunk_index.close()
+    return 0 if completed else 1
+
+
 def main():
     """Main entry point for the addon."""
+    parser = argparse.ArgumentParser(description="Duplicate Video Finder")
+    parser.add_argument("--port", type=int, default=7000, help="Port of the web interface")
+    parser.add_argument(
+        "--agent", metavar="URL",
+        help="Run as a scan agent reporting to the coordinator at URL instead of serving the web interface",
+    )
+    parser.add_argument("--name", default=socket.gethostname(), help="Agent name shown by the coordinator")
+    parser.add_argument("--paths", nargs="+", help="Paths the agent scans (default: scan_paths option)")
+    parser.add_argument("--exclude", nargs="*", help="Paths the agent skips (default: exclude_paths option)")
+    parser.add_argument("--interval", type=float, default=3600, help="Seconds between agent rescans")
+    parser.add_argument("--once", action="store_true", help="Exit once the coordinator needs nothing more")
+    parser.add_argument(
+        "--scan", action="store_true",
+        help="Run a single scan of --paths without the web interface, write its results and exit",
+    )
+    parser.add_argument(
+        "--mode", choices=["name", "metadata", "content"], default="name",
+        help="Compare file names only, also container metadata, or file contents (default: name)",
+    )
+    parser.add_argument("--hash-mode", choices=sorted(HASH_MODES), default="full", help="What content scans hash")
+    parser.add_argument("--workers", type=int, help="Concurrent full hash workers of content scans")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="json", help="Output format of --scan")
+    parser.add_argument("--output", default="-", help="File the results of --scan are written to (default: stdout)")
+    parser.add_argument(
+        "--no-trees", action="store_true", help="Do not look for duplicated folders (only content scans do)"
+    )
+    parser.add_argument("--truncated", action="store_true", help="Also look for truncated copies in content scans")
+    parser.add_argument("--overlaps", action="store_true", help="Also look for partially overlapping files")
+    args = parser.parse_args()
+
+    if args.scan:
+        sys.exit(run_headless(args))
+
+    if args.agent:
+        logger.info(f"Starting scan agent {args.name} for {args.agent}")
+        agent_index = FileIndex(os.path.join(DATA_DIR, "index.db"))
+        try:
+            run_agent(
+                args.agent,
+                args.name,
+                args.paths or config["scan_paths"],
+                args.exclude if args.exclude is not None else config["exclude_paths"],
+                agent_index,
+                interval=args.interval,
+                once=args.once,
+            )
+        except Exception as e:
+            logger.error(f"Agent stopped: {e}")
+            sys.exit(1)
+        finally:
+            agent_index.close()
+        return
+
+    # API workers open the file index read-only, so it is created with its
+    # current schema before any of them starts
+    FileIndex(os.path.join(DATA_DIR, "index.db")).close()
+
+    # Scans run in their own process, so the API workers only read state
+    os.environ[SCANNER_ENV] = "process"
+    scanner = multiprocessing.get_context("spawn").Process(target=run_scanner, name="scanner", daemon=True)
+    scanner.start()
+
     try:
-        # Start the Uvicorn server
-        logger.info("Starting Duplicate Video Finder")
-        uvicorn.run(app, host="0.0.0.0", port=7000, log_level="info")
+        # Start the Uvicorn server; several workers need the app as an import string
+        logger.info(f"Starting Duplicate Video Finder with {API_WORKERS} API workers")
+        uvicorn.run(
+            "run:app" if API_WORKERS > 1 else app,
+            host="0.0.0.0",
+            port=args.port,
+            workers=API_WORKERS,
+            log_level="info",
+        )
     except Exception as e:
         logger.error(f"Error starting server: {e}")
         sys.exit(1)
@@ -0,0 +1,86 @@
+"""Ordered reads for rotational disks.
+
+Hashing many files at once on a spinning drive makes the head jump between
+them, so throughput drops to a fraction of a sequential read. Files on such
+a disk are instead queued here and read by a single task per disk, always
+picking the next file at or after the current head position (one-way
+elevator, wrapping around at the end of the disk).
+"""
+
+import asyncio
+import bisect
+import itertools
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class _Elevator:
+    """Pending reads of one disk, sorted by physical offset."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._items: List[Tuple[int, int, Job, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._position = 0
+        self._wakeup = asyncio.Event()
+        self._closed = False
+        self.task = asyncio.create_task(self._read())
+
+    def submit(self, offset: int, job: Job) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        bisect.insort(self._items, (offset, next(self._seq), job, future))
+        self._wakeup.set()
+        return future
+
+    def close(self) -> None:
+        self._closed = True
+        self._wakeup.set()
+
+    async def _read(self) -> None:
+        while True:
+            if not self._items:
+                if self._closed:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            i = bisect.bisect_left(self._items, (self._position,))
+            if i == len(self._items):
+                i = 0
+            offset, _, job, future = self._items.pop(i)
+            self._position = offset
+            try:
+                future.set_result(await job())
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                future.set_exception(e)
+
+
+class SpindleScheduler:
+    """Run read jobs one at a time per disk, in on-disk order."""
+
+    def __init__(self):
+        """Initialize the scheduler without any disks."""
+        self._elevators: Dict[str, _Elevator] = {}
+
+    def submit(self, spindle: str, offset: int, job: Job) -> asyncio.Future:
+        """Queue a job reading the file at ``offset`` on a disk.
+
+        Returns a future resolved with the job's result once it has run.
+        """
+        elevator = self._elevators.get(spindle)
+        if elevator is None:
+            elevator = self._elevators[spindle] = _Elevator(spindle)
+        return elevator.submit(offset, job)
+
+    async def close(self, cancel: bool = False) -> None:
+        """Stop the readers after their queues are drained, or right away."""
+        for elevator in self._elevators.values():
+            if cancel:
+                elevator.task.cancel()
+            else:
+                elevator.close()
+        await asyncio.gather(*(e.task for e in self._elevators.values()), return_exceptions=True)
@@ -0,0 +1,346 @@
+"""Scan state shared between the scanner and the API worker processes."""
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("duplicate_video_finder")
+
+# Number of generations a client can lag behind and still get a delta
+MAX_GENERATIONS = 50
+
+# Kinds of stored duplicate sets
+PUBLISHED = "published"
+PROVISIONAL = "provisional"
+
+
+def _fingerprint(paths: List[str]) -> str:
+    return hashlib.sha1("\0".join(sorted(paths)).encode()).hexdigest()[:16]
+
+
+class StateStore:
+    """SQLite database in WAL mode holding status, results and their history.
+
+    The scanner writes, any number of API workers read; WAL lets readers
+    continue while a scan publishes. Duplicate sets are rows, so pages and
+    single sets are read without loading the whole result. Sets are
+    identified by their name, which survives rescans. Each published
+    generation records the names it added, removed or modified, so clients
+    can follow changes without downloading everything again.
+    """
+
+    def __init__(self, db_path: str):
+        """Open (and create if needed) the state database."""
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._transaction():
+            self._conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS result_sets ("
+                "kind TEXT, position INTEGER, name TEXT, count INTEGER, fingerprint TEXT, paths TEXT, "
+                "PRIMARY KEY (kind, position))"
+            )
+            self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS result_sets_name ON result_sets (kind, name)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS result_files ("
+                "kind TEXT, path TEXT, name TEXT, PRIMARY KEY (kind, path)) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS result_deltas (generation INTEGER PRIMARY KEY, delta TEXT)")
+            # Tells clients apart from ones that followed a deleted database
+            self._conn.execute(
+                "INSERT OR IGNORE INTO state (key, value) VALUES ('instance', ?)", (json.dumps(f"{time.time_ns():x}"),)
+            )
+
+    def close(self) -> None:
+        """Close the database."""
+        self._conn.close()
+
+    @contextlib.contextmanager
+    def _transaction(self, mode: str = "IMMEDIATE") -> Iterator[None]:
+        """Run a block in one transaction, holding the write lock unless deferred."""
+        with self._lock:
+            self._conn.execute(f"BEGIN {mode}")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run a block in one write transaction on the store's connection.
+
+        Lets other shared state, such as the reports of scan agents, keep
+        its tables in the same database.
+        """
+        with self._transaction():
+            yield self._conn
+
+    @contextlib.contextmanager
+    def snapshot(self) -> Iterator[sqlite3.Connection]:
+        """Read a consistent snapshot on the store's connection without the write lock."""
+        with self._transaction("DEFERRED"):
+            yield self._conn
+
+    def _get(self, key: str, default: Any = None) -> Any:
+        row = self._conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _set(self, key: str, value: Any) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return a stored document, such as ``trees``, or ``default``."""
+        with self._lock:
+            return self._get(key, default)
+
+    @property
+    def instance(self) -> str:
+        """Return the id of this database."""
+        return self.get("instance")
+
+    @property
+    def generation(self) -> int:
+        """Return the number of the published results."""
+        return self.get("generation", 0)
+
+    def status(self) -> Dict[str, Any]:
+        """Return the scan status last written by the scanner."""
+        return self.get("status", {})
+
+    def update_status(self, status: Dict[str, Any]) -> None:
+        """Replace the scan status."""
+        with self._lock:
+            self._set("status", status)
+
+    def request_scan(self, request: Dict[str, Any], started: str) -> bool:
+        """Queue a scan for the scanner, unless one is queued or running.
+
+        The status changes to scanning right away, so every worker refuses
+        further requests. Returns False if a scan was already pending.
+        """
+        with self._transaction():
+            status = self._get("status", {})
+            if status.get("status") == "scanning" or self._get("scan_request") is not None:
+                return False
+            self._set("scan_request", {**request, "started": started})
+            self._set("status", {**status, "status": "scanning", "last_scan": started})
+            return True
+
+    def take_scan_request(self) -> Optional[Dict[str, Any]]:
+        """Remove and return the queued scan request, if any."""
+        with self._transaction():
+            request = self._get("scan_request")
+            if request is not None:
+                self._conn.execute("DELETE FROM state WHERE key = 'scan_request'")
+            return request
+
+    def _write_sets(self, kind: str, results: Iterable[Tuple[str, List[str]]]) -> None:
+        """Replace the sets of ``kind``, reading ``results`` once."""
+        self._conn.execute("DELETE FROM result_sets WHERE kind = ?", (kind,))
+        self._conn.execute("DELETE FROM result_files WHERE kind = ?", (kind,))
+        for position, (name, paths) in enumerate(results):
+            self._conn.execute(
+                "INSERT INTO result_sets (kind, position, name, count, fingerprint, paths) VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, position, name, len(paths), _fingerprint(paths), json.dumps(paths)),
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO result_files (kind, path, name) VALUES (?, ?, ?)",
+                ((kind, path, name) for path in paths),
+            )
+
+    def _record_delta(self, delta: Dict[str, str]) -> int:
+        generation = self._get("generation", 0) + 1
+        self._conn.execute(
+            "INSERT OR REPLACE INTO result_deltas (generation, delta) VALUES (?, ?)", (generation, json.dumps(delta))
+        )
+        self._conn.execute("DELETE FROM result_deltas WHERE generation <= ?", (generation - MAX_GENERATIONS,))
+        self._set("generation", generation)
+        return generation
+
+    def publish(
+        self, results: Iterable[Tuple[str, List[str]]], documents: Optional[Dict[str, Any]] = None
+    ) -> int:
+        """Store ``results`` as the next generation and return its number.
+
+        ``results`` are ``(name, paths)`` pairs, read once as they are
+        written, so scans can stream them from disk. ``documents`` are
+        stored along with them, and provisional sets of the finished scan
+        are dropped.
+        """
+        with self._transaction():
+            previous = dict(self._conn.execute("SELECT name, fingerprint FROM result_sets WHERE kind = ?", (PUBLISHED,)))
+            delta = {}
+
+            def compared() -> Iterator[Tuple[str, List[str]]]:
+                for name, paths in results:
+                    fingerprint = previous.pop(name, None)
+                    if fingerprint is None:
+                        delta[name] = "added"
+                    elif fingerprint != _fingerprint(paths):
+                        delta[name] = "modified"
+                    yield name, paths
+
+            self._write_sets(PUBLISHED, compared())
+            for name in previous:
+                delta[name] = "removed"
+            self._write_sets(PROVISIONAL, ())
+            self._set("provisional", False)
+            for key, value in (documents or {}).items():
+                self._set(key, value)
+            return self._record_delta(delta)
+
+    def set_provisional(self, results: Optional[Dict[str, List[str]]]) -> None:
+        """Replace the sets confirmed so far by a running scan.
+
+        While provisional sets are stored, they are served instead of the
+        published ones; ``None`` drops them.
+        """
+        with self._transaction():
+            self._write_sets(PROVISIONAL, (results or {}).items())
+            self._set("provisional", results is not None)
+
+    def forget(self, paths: Iterable[str]) -> Optional[int]:
+        """Drop deleted files from the published sets.
+
+        Sets left with a single file are removed. Returns the new
+        generation, or None if no set contained any of the files.
+        """
+        deleted = set(paths)
+        with self._transaction():
+            names = {
+                row[0]
+                for path in deleted
+                for row in self._conn.execute(
+                    "SELECT name FROM result_files WHERE kind = ? AND path = ?", (PUBLISHED, path)
+                )
+            }
+            if not names:
+                return None
+            self._conn.executemany(
+                "DELETE FROM result_files WHERE kind = ? AND path = ?", ((PUBLISHED, path) for path in deleted)
+            )
+            delta = {}
+            for name in names:
+                position, set_paths = self._conn.execute(
+                    "SELECT position, paths FROM result_sets WHERE kind = ? AND name = ?", (PUBLISHED, name)
+                ).fetchone()
+                remaining = [path for path in json.loads(set_paths) if path not in deleted]
+                if len(remaining) > 1:
+                    self._conn.execute(
+                        "UPDATE result_sets SET count = ?, fingerprint = ?, paths = ? WHERE kind = ? AND position = ?",
+                        (len(remaining), _fingerprint(remaining), json.dumps(remaining), PUBLISHED, position),
+                    )
+                    delta[name] = "modified"
+                else:
+                    self._conn.execute("DELETE FROM result_sets WHERE kind = ? AND position = ?", (PUBLISHED, position))
+                    self._conn.executemany(
+                        "DELETE FROM result_files WHERE kind = ? AND path = ?", ((PUBLISHED, path) for path in remaining)
+                    )
+                    delta[name] = "removed"
+            status = self._get("status", {})
+            if status.get("status") != "scanning":
+                count = self._conn.execute("SELECT COUNT(*) FROM result_sets WHERE kind = ?", (PUBLISHED,)).fetchone()[0]
+                self._set("status", {**status, "duplicate_sets": count})
+            return self._record_delta(delta)
+
+    def _kind(self, provisional: Optional[bool]) -> str:
+        if provisional is None:
+            provisional = self._get("provisional", False)
+        return PROVISIONAL if provisional else PUBLISHED
+
+    def is_provisional(self) -> bool:
+        """Return True while a running scan's sets are served."""
+        return self.get("provisional", False)
+
+    def count(self, provisional: Optional[bool] = None) -> int:
+        """Return the number of sets currently served."""
+        with self._lock:
+            kind = self._kind(provisional)
+            return self._conn.execute("SELECT COUNT(*) FROM result_sets WHERE kind = ?", (kind,)).fetchone()[0]
+
+    def page(
+        self, offset: int = 0, limit: Optional[int] = None, paths: bool = True, provisional: Optional[bool] = None
+    ) -> List[Dict[str, Any]]:
+        """Return a page of sets in their published order."""
+        with self._lock:
+            kind = self._kind(provisional)
+            rows = self._conn.execute(
+                f"SELECT name, count{', paths' if paths else ''} FROM result_sets "
+                "WHERE kind = ? ORDER BY position LIMIT ? OFFSET ?",
+                (kind, -1 if limit is None else limit, offset),
+            ).fetchall()
+        if paths:
+            return [{"name": name, "count": count, "paths": json.loads(set_paths)} for name, count, set_paths in rows]
+        return [{"name": name, "count": count} for name, count in rows]
+
+    def result_set(self, name: str, provisional: Optional[bool] = None) -> Optional[List[str]]:
+        """Return the paths of one set, or None if there is no such set."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT paths FROM result_sets WHERE kind = ? AND name = ?", (self._kind(provisional), name)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def results(self, provisional: Optional[bool] = None) -> Dict[str, List[str]]:
+        """Return all sets as a dict of name to paths."""
+        return {entry["name"]: entry["paths"] for entry in self.page(provisional=provisional)}
+
+    def contains(self, path: str) -> bool:
+        """Return True if a served set contains ``path``."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM result_files WHERE kind = ? AND path = ?", (self._kind(None), path)
+            ).fetchone() is not None
+
+    def changes(self, since: int) -> Dict[str, Any]:
+        """Return the names of sets added, removed and modified after ``since``.
+
+        ``reset`` is set instead when ``since`` is unknown or too old, and the
+        client has to fetch all results again.
+        """
+        with self._transaction("DEFERRED"):
+            generation = self._get("generation", 0)
+            oldest = self._conn.execute("SELECT MIN(generation) FROM result_deltas").fetchone()[0]
+            oldest = generation if oldest is None else oldest - 1
+            if since > generation or since < oldest:
+                return {"generation": generation, "reset": True}
+
+            # The first event after ``since`` tells whether a set existed then
+            first_events: Dict[str, str] = {}
+            for (delta,) in self._conn.execute(
+                "SELECT delta FROM result_deltas WHERE generation > ? ORDER BY generation", (since,)
+            ):
+                for name, event in json.loads(delta).items():
+                    first_events.setdefault(name, event)
+
+            added, removed, modified = [], [], []
+            for name, event in first_events.items():
+                existed = event != "added"
+                present = self._conn.execute(
+                    "SELECT 1 FROM result_sets WHERE kind = ? AND name = ?", (PUBLISHED, name)
+                ).fetchone() is not None
+                if existed and present:
+                    modified.append(name)
+                elif present:
+                    added.append(name)
+                elif existed:
+                    removed.append(name)
+            return {
+                "generation": generation,
+                "reset": False,
+                "added": added,
+                "removed": removed,
+                "modified": modified,
+            }
@@ -0,0 +1,203 @@
+"""Detection of the storage behind scan paths and matching I/O strategies."""
+
+import fcntl
+import logging
+import os
+import re
+import struct
+from typing import Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger("duplicate_video_finder")
+
+MOUNTS_PATH = "/proc/mounts"
+SYS_DEV_BLOCK = "/sys/dev/block"
+
+# ioctl returning the physical extents of a file (linux/fs.h)
+FS_IOC_FIEMAP = 0xC020660B
+_FIEMAP_HEADER = struct.Struct("=QQIIII")
+_FIEMAP_EXTENT = struct.Struct("=QQQQQIIII")
+
+# Filesystems where every metadata operation is a network round-trip
+NETWORK_FILESYSTEMS = {
+    "nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "ceph", "glusterfs",
+    "fuse.sshfs", "fuse.rclone", "fuse.glusterfs", "fuse.s3fs", "afs",
+}
+
+
+class MountInfo(NamedTuple):
+    """One entry of /proc/mounts."""
+
+    device: str
+    mount_point: str
+    fs_type: str
+
+
+class IOProfile(NamedTuple):
+    """How aggressively to overlap I/O for one kind of storage."""
+
+    name: str
+    # Directories listed concurrently by the walker
+    walk_concurrency: int
+    # Take the stats of a directory's files from its entries while it is
+    # listed, when the attributes returned by the listing are still cached
+    # by the client
+    stat_on_list: bool
+    # Read size used when hashing
+    read_size: int
+    # Hash files one at a time per disk, in on-disk order
+    sequential: bool = False
+
+
+LOCAL_PROFILE = IOProfile("local", walk_concurrency=2, stat_on_list=False, read_size=1024 * 1024)
+NETWORK_PROFILE = IOProfile("network", walk_concurrency=16, stat_on_list=True, read_size=8 * 1024 * 1024)
+ROTATIONAL_PROFILE = IOProfile(
+    "rotational", walk_concurrency=2, stat_on_list=False, read_size=4 * 1024 * 1024, sequential=True
+)
+PROFILES = {profile.name: profile for profile in (LOCAL_PROFILE, NETWORK_PROFILE, ROTATIONAL_PROFILE)}
+
+
+def _unescape(field: str) -> str:
+    """Decode the octal escapes /proc/mounts uses for spaces and tabs.
+
+    Each escape stands for one byte, so the bytes are collected and decoded
+    like any other path; non-ASCII mount points stay intact.
+    """
+    if "\\" not in field:
+        return field
+    return os.fsdecode(re.sub(rb"\\([0-7]{3})", lambda m: bytes([int(m.group(1), 8)]), os.fsencode(field)))
+
+
+def read_mounts(mounts_path: str = MOUNTS_PATH) -> List[MountInfo]:
+    """Parse the mount table, returning an empty list if it is unavailable."""
+    mounts = []
+    try:
+        with open(mounts_path, "r", errors="surrogateescape") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 3:
+                    mounts.append(MountInfo(_unescape(fields[0]), _unescape(fields[1]), fields[2]))
+    except OSError as e:
+        logger.debug(f"Could not read mount table {mounts_path}: {e}")
+    return mounts
+
+
+def mount_for(path: str, mounts: List[MountInfo]) -> Optional[MountInfo]:
+    """Return the mount a path lives on (longest matching mount point)."""
+    path = os.path.realpath(path)
+    best = None
+    for mount in mounts:
+        point = mount.mount_point.rstrip("/") or "/"
+        if path == point or path.startswith(point.rstrip("/") + "/"):
+            if best is None or len(point) >= len(best.mount_point.rstrip("/") or "/"):
+                best = mount
+    return best
+
+
+def is_network_mount(mount: Optional[MountInfo]) -> bool:
+    """Return True for network filesystems such as NFS and SMB."""
+    return mount is not None and mount.fs_type in NETWORK_FILESYSTEMS
+
+
+def disk_for_device(st_dev: int) -> Optional[str]:
+    """Return the sysfs directory of the whole disk behind a device number.
+
+    Partitions are resolved to their parent disk, which owns the queue
+    settings. Returns None for devices without a block device, such as
+    network and virtual filesystems.
+    """
+    path = os.path.realpath(os.path.join(SYS_DEV_BLOCK, f"{os.major(st_dev)}:{os.minor(st_dev)}"))
+    for candidate in (path, os.path.dirname(path)):
+        if os.path.exists(os.path.join(candidate, "queue", "rotational")):
+            return candidate
+    return None
+
+
+def is_rotational(disk: str) -> bool:
+    """Return True if the kernel reports the disk as a spinning drive."""
+    try:
+        with open(os.path.join(disk, "queue", "rotational"), "r") as f:
+            return f.read().strip() == "1"
+    except OSError:
+        return False
+
+
+def physical_offset(path: str, st: os.stat_result) -> int:
+    """Return where a file starts on disk, falling back to its inode number.
+
+    Uses the FIEMAP ioctl for the first extent; filesystems that do not
+    support it usually allocate inodes and data in roughly the same order.
+    """
+    buf = bytearray(_FIEMAP_HEADER.size + _FIEMAP_EXTENT.size)
+    _FIEMAP_HEADER.pack_into(buf, 0, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0)
+    try:
+        with open(path, "rb") as f:
+            fcntl.ioctl(f.fileno(), FS_IOC_FIEMAP, buf, True)
+    except OSError:
+        return st.st_ino
+    if _FIEMAP_HEADER.unpack_from(buf)[3] == 0:
+        return st.st_ino
+    return _FIEMAP_EXTENT.unpack_from(buf, _FIEMAP_HEADER.size)[1]
+
+
+class StorageMap:
+    """Resolve the I/O profile of any path under a set of scan roots.
+
+    ``override`` forces a profile by name; "auto" detects it per mount.
+    """
+
+    def __init__(self, roots: List[str], override: str = "auto", mounts: Optional[List[MountInfo]] = None):
+        """Detect the filesystem of every scan root."""
+        self.override = PROFILES.get(override)
+        self.mounts = read_mounts() if mounts is None else mounts
+        self.root_profiles: Dict[str, IOProfile] = {}
+        self._spindles: Dict[int, Optional[str]] = {}
+        for root in roots:
+            mount = mount_for(root, self.mounts)
+            profile = self.override or self._detect_profile(root, mount)
+            self.root_profiles[os.path.normpath(root)] = profile
+            logger.info(
+                f"Scan path {root} is on {mount.fs_type if mount else 'unknown'} "
+                f"filesystem, using {profile.name} I/O profile"
+            )
+
+    def _detect_profile(self, root: str, mount: Optional[MountInfo]) -> IOProfile:
+        if is_network_mount(mount):
+            return NETWORK_PROFILE
+        try:
+            if self.spindle_for(os.stat(root)) is not None:
+                return ROTATIONAL_PROFILE
+        except OSError:
+            pass
+        return LOCAL_PROFILE
+
+    def profile_for(self, path: str) -> IOProfile:
+        """Return the profile of the scan root a path belongs to."""
+        best_root = None
+        for root in self.root_profiles:
+            if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+                if best_root is None or len(root) > len(best_root):
+                    best_root = root
+        if best_root is None:
+            return self.override or LOCAL_PROFILE
+        return self.root_profiles[best_root]
+
+    def spindle_for(self, st: os.stat_result) -> Optional[str]:
+        """Return the name of the rotational disk a file is on, or None."""
+        if st.st_dev not in self._spindles:
+            disk = disk_for_device(st.st_dev)
+            if self.override is not None:
+                rotational = self.override.sequential
+            else:
+                rotational = disk is not None and is_rotational(disk)
+            spindle = None
+            if rotational:
+                spindle = os.path.basename(disk) if disk else f"dev{st.st_dev}"
+                logger.info(f"Device {spindle} is rotational, hashing its files in on-disk order")
+            self._spindles[st.st_dev] = spindle
+        return self._spindles[st.st_dev]
+
+    @property
+    def walk_concurrency(self) -> int:
+        """Number of directories the walker lists at once."""
+        profiles = self.root_profiles.values() or [self.override or LOCAL_PROFILE]
+        return max(profile.walk_concurrency for profile in profiles)
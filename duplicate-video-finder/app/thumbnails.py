@@ -0,0 +1,162 @@
+"""On-demand video thumbnails with a size-capped on-disk LRU cache."""
+
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from container import read_metadata
+
+logger = logging.getLogger("duplicate_video_finder")
+
+# Width of generated thumbnails, height follows the aspect ratio
+THUMBNAIL_WIDTH = 320
+
+# Seconds to wait for ffmpeg before giving up on a file
+FFMPEG_TIMEOUT = 30
+
+# Position of the extracted frame, as a share of the duration, and the
+# fallback offset in seconds when the duration is unknown
+FRAME_POSITION = 0.1
+DEFAULT_OFFSET = 5.0
+
+# After eviction the cache is trimmed down to this share of its limit
+EVICT_TARGET = 0.9
+
+
+def file_identity(path: str, st: os.stat_result) -> str:
+    """Key a file by path, size, modification time and inode."""
+    raw = f"{path}\0{st.st_size}\0{st.st_mtime_ns}\0{st.st_ino}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class ThumbnailCache:
+    """Generate thumbnails with ffmpeg on first request and keep them on disk.
+
+    At most ``workers`` ffmpeg processes run at once, and concurrent requests
+    for the same file share one extraction. Files are evicted least recently
+    used first once the cache grows past ``max_bytes``; the modification time
+    of a cached thumbnail records its last use.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, workers: int = 2):
+        """Initialize the cache and measure what is already stored."""
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ffmpeg = shutil.which("ffmpeg")
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnail")
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with os.scandir(cache_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".tmp"):
+                        os.remove(entry.path)
+                    elif entry.is_file():
+                        self._total_bytes += entry.stat().st_size
+        except OSError as e:
+            logger.warning(f"Could not prepare thumbnail cache {cache_dir}: {e}")
+        if self.ffmpeg is None:
+            logger.warning("ffmpeg not found, thumbnails are disabled")
+
+    @property
+    def available(self) -> bool:
+        """Return True if thumbnails can be generated."""
+        return self.ffmpeg is not None
+
+    def _path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.jpg")
+
+    async def get(self, path: str) -> Optional[str]:
+        """Return the cached thumbnail of a video, generating it if needed.
+
+        Returns None if the video is missing or no frame could be extracted.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = file_identity(path, st)
+        thumbnail = self._path_for(key)
+        if os.path.exists(thumbnail):
+            try:
+                os.utime(thumbnail)
+            except OSError:
+                pass
+            return thumbnail
+        if not self.available:
+            return None
+
+        future = self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor, self._generate, path, thumbnail)
+            self._pending[key] = future
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+        return thumbnail if await asyncio.shield(future) else None
+
+    def _generate(self, path: str, thumbnail: str) -> bool:
+        """Extract one frame of a video into the cache."""
+        meta = read_metadata(path)
+        duration = meta.get("duration") if meta else None
+        offset = duration * FRAME_POSITION if duration else DEFAULT_OFFSET
+        tmp_path = f"{thumbnail}.tmp"
+        # Short clips may end before the offset, so retry from the start
+        for start in (offset, 0.0):
+            command = [
+                self.ffmpeg, "-hide_banner", "-loglevel", "error", "-nostdin",
+                "-ss", f"{start:.2f}", "-i", path,
+                "-frames:v", "1", "-vf", f"scale={THUMBNAIL_WIDTH}:-2", "-q:v", "5",
+                "-f", "image2", "-y", tmp_path,
+            ]
+            try:
+                subprocess.run(command, capture_output=True, timeout=FFMPEG_TIMEOUT, check=True)
+            except (OSError, subprocess.SubprocessError) as e:
+                logger.debug(f"ffmpeg failed for {path} at {start:.2f}s: {e}")
+                continue
+            if os.path.exists(tmp_path) and os.path.getsize(tmp_path) > 0:
+                break
+        else:
+            logger.warning(f"Could not extract a thumbnail from {path}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+        os.replace(tmp_path, thumbnail)
+        with self._lock:
+            self._total_bytes += os.path.getsize(thumbnail)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+        return True
+
+    def _evict(self) -> None:
+        """Remove least recently used thumbnails until under the size limit."""
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as scan:
+            for entry in scan:
+                if entry.is_file() and entry.name.endswith(".jpg"):
+                    st = entry.stat()
+                    entries.append((st.st_mtime_ns, st.st_size, entry.path))
+                    total += st.st_size
+        entries.sort()
+        target = self.max_bytes * EVICT_TARGET
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        self._total_bytes = total
+        logger.debug(f"Evicted {removed} thumbnails, cache now holds {total} bytes")
@@ -0,0 +1,262 @@
+"""Detection of duplicated directory trees from per-file duplicate sets."""
+
+import hashlib
+import logging
+import os
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger("duplicate_video_finder")
+
+# Minimum share of bytes two directories must have in common to be reported
+# as a mostly duplicated tree
+DEFAULT_MIN_OVERLAP = 0.9
+
+
+class _SizeCache:
+    """Lazily stat files, remembering sizes for the duration of one detection."""
+
+    def __init__(self):
+        self._sizes: Dict[str, int] = {}
+
+    def __call__(self, path: str) -> int:
+        size = self._sizes.get(path)
+        if size is None:
+            try:
+                size = os.stat(path).st_size
+            except OSError:
+                size = 0
+            self._sizes[path] = size
+        return size
+
+
+def _ancestors(path: str, roots: Set[str]) -> Iterable[str]:
+    """Yield the parent directories of a path up to and including its scan root."""
+    directory = os.path.dirname(path)
+    while True:
+        yield directory
+        if directory in roots:
+            return
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return
+        directory = parent
+
+
+def find_duplicate_trees(
+    duplicate_sets: Dict[str, List[str]],
+    all_files: List[str],
+    roots: List[str],
+    min_overlap: float = DEFAULT_MIN_OVERLAP,
+) -> List[Dict]:
+    """Find directory trees that are fully or mostly duplicated elsewhere.
+
+    Every file is labelled with the key of the duplicate set it belongs to
+    (unique files get a label of their own). A Merkle digest is then rolled
+    up bottom-up for every directory from the labels of its files and the
+    digests of its subdirectories, so identical trees share a digest no
+    matter how deep they are. Trees that are not identical but share at least
+    ``min_overlap`` of their bytes are reported as partial duplicates.
+
+    Only the outermost duplicated directory is reported, never its children.
+    """
+    roots_set = {os.path.normpath(root) for root in roots}
+    file_labels: Dict[str, str] = {}
+    for key, paths in duplicate_sets.items():
+        for path in paths:
+            file_labels[path] = key
+
+    # Build the directory tree of all video files
+    dir_files: Dict[str, List[str]] = {}
+    dir_children: Dict[str, Set[str]] = {}
+    for path in all_files:
+        dir_files.setdefault(os.path.dirname(path), []).append(path)
+        child = None
+        for directory in _ancestors(path, roots_set):
+            if child is not None:
+                dir_children.setdefault(directory, set()).add(child)
+            dir_files.setdefault(directory, [])
+            child = directory
+
+    size_of = _SizeCache()
+
+    # Roll up digests bottom-up, deepest directories first
+    digests: Dict[str, str] = {}
+    file_counts: Dict[str, int] = {}
+    for directory in sorted(dir_files, key=lambda d: d.count(os.sep), reverse=True):
+        tokens = [f"f:{file_labels.get(path, 'u:' + path)}" for path in dir_files[directory]]
+        count = len(dir_files[directory])
+        for child in dir_children.get(directory, ()):
+            tokens.append(f"d:{digests[child]}")
+            count += file_counts[child]
+        digests[directory] = hashlib.sha1("\n".join(sorted(tokens)).encode()).hexdigest()
+        file_counts[directory] = count
+
+    totals: Dict[str, int] = {}
+
+    def tree_size(directory: str) -> int:
+        if directory not in totals:
+            total = sum(size_of(path) for path in dir_files[directory])
+            totals[directory] = total + sum(tree_size(child) for child in dir_children.get(directory, ()))
+        return totals[directory]
+
+    trees: List[Dict] = []
+
+    # Identical trees: directories that share a digest
+    by_digest: Dict[str, List[str]] = {}
+    for directory, digest in digests.items():
+        if file_counts[directory] > 0:
+            by_digest.setdefault(digest, []).append(directory)
+    # Directory -> digest of the identical tree it is reported as a copy of
+    identical: Dict[str, str] = {}
+    for digest, directories in by_digest.items():
+        if len(directories) < 2:
+            continue
+        directories.sort()
+        parents = {os.path.dirname(d) for d in directories}
+        # Skip if the parents are themselves identical copies of each other
+        if (
+            len(parents) == len(directories)
+            and not parents & set(directories)
+            and len({digests.get(p) for p in parents}) == 1
+            and not any(d in roots_set for d in directories)
+        ):
+            continue
+        size = tree_size(directories[0])
+        trees.append({
+            "id": digest[:16],
+            "kind": "identical",
+            "paths": directories,
+            "files": file_counts[directories[0]],
+            "size": size,
+            "overlap": 1.0,
+            "reclaimable_bytes": size * (len(directories) - 1),
+        })
+        for directory in directories:
+            identical[directory] = digest
+
+    def same_tree(dir_a: str, dir_b: str) -> bool:
+        return dir_a in identical and identical[dir_a] == identical.get(dir_b)
+
+    overlaps = _overlapping_pairs(duplicate_sets, digests, by_digest, roots_set, tree_size, size_of, min_overlap)
+    for pair, (overlap, shared_bytes) in overlaps.items():
+        if same_tree(*pair):
+            continue
+        parent_pair = tuple(sorted(os.path.dirname(d) for d in pair))
+        if parent_pair in overlaps or same_tree(*parent_pair):
+            continue
+        # Nested inside an identical tree that is already reported
+        if _inside_identical(pair, same_tree):
+            continue
+        trees.append({
+            "id": hashlib.sha1("\n".join(pair).encode()).hexdigest()[:16],
+            "kind": "partial",
+            "paths": list(pair),
+            "files": max(file_counts[pair[0]], file_counts[pair[1]]),
+            "size": max(totals[pair[0]], totals[pair[1]]),
+            "overlap": round(overlap, 4),
+            "reclaimable_bytes": min(shared_bytes, totals[pair[0]], totals[pair[1]]),
+        })
+
+    trees.sort(key=lambda tree: tree["reclaimable_bytes"], reverse=True)
+    logger.info(f"Found {len(trees)} duplicated directory trees")
+    return trees
+
+
+def _overlapping_pairs(
+    duplicate_sets: Dict[str, List[str]],
+    digests: Dict[str, str],
+    by_digest: Dict[str, List[str]],
+    roots: Set[str],
+    tree_size: Callable[[str], int],
+    size_of: Callable[[str], int],
+    min_overlap: float,
+) -> Dict[Tuple[str, str], Tuple[float, int]]:
+    """Find directory pairs sharing at least ``min_overlap`` of the larger one's bytes.
+
+    Every directory is described by the duplicate sets found under it and
+    how deep below it their files lie, in one global order (largest files
+    first). Two directories share a set when its files lie at the same depth
+    in both. A pair can only reach the overlap if both directories share a
+    set within the shortest prefix of their order whose remainder is too
+    small to reach it alone, so pairs are only formed from directories
+    listed under the same set id in those prefixes, and then verified.
+    Copies of an identical tree share all of their sets; only one of them
+    is paired.
+
+    Returns ``(overlap, shared bytes)`` for every qualifying pair.
+    """
+    # Directory -> (set id, depth of its file below the directory) -> bytes
+    contents: Dict[str, Dict[Tuple[str, int], int]] = {}
+    for key, paths in duplicate_sets.items():
+        size = size_of(paths[0])
+        for path in paths:
+            for depth, directory in enumerate(_ancestors(path, roots)):
+                contents.setdefault(directory, {})[(key, depth)] = size
+
+    def rank(entry: Tuple[Tuple[str, int], int]) -> Tuple[int, str, int]:
+        (key, depth), size = entry
+        return -size, key, depth
+
+    skipped = {d for directories in by_digest.values() for d in directories[1:]}
+    holders: Dict[Tuple[str, int], List[str]] = {}
+    for directory, sets in contents.items():
+        if directory in skipped or directory not in digests:
+            continue
+        needed = min_overlap * tree_size(directory)
+        remaining = sum(sets.values())
+        for entry, size in sorted(sets.items(), key=rank):
+            if remaining < needed:
+                break
+            holders.setdefault(entry, []).append(directory)
+            remaining -= size
+
+    overlaps: Dict[Tuple[str, str], Tuple[float, int]] = {}
+    checked: Set[Tuple[str, str]] = set()
+    for directories in holders.values():
+        for i, first in enumerate(directories):
+            for second in directories[i + 1:]:
+                pair = (first, second) if first < second else (second, first)
+                if pair in checked:
+                    continue
+                checked.add(pair)
+                dir_a, dir_b = pair
+                if dir_b.startswith(dir_a + os.sep):
+                    continue
+                sets_a, sets_b = contents[dir_a], contents[dir_b]
+                if len(sets_a) > len(sets_b):
+                    sets_a, sets_b = sets_b, sets_a
+                shared = sum(size for entry, size in sets_a.items() if entry in sets_b)
+                largest = max(tree_size(dir_a), tree_size(dir_b))
+                if largest and shared >= min_overlap * largest:
+                    overlaps[pair] = (min(shared / largest, 1.0), shared)
+    return overlaps
+
+
+def _inside_identical(pair: Tuple[str, str], same_tree: Callable[[str, str], bool]) -> bool:
+    dir_a, dir_b = pair
+    while True:
+        parent_a, parent_b = os.path.dirname(dir_a), os.path.dirname(dir_b)
+        if parent_a == dir_a or parent_b == dir_b or parent_a == parent_b:
+            return False
+        dir_a, dir_b = parent_a, parent_b
+        if same_tree(dir_a, dir_b):
+            return True
+
+
+def duplicated_files_under(directory: str, duplicate_sets: Dict[str, List[str]]) -> List[str]:
+    """List files under a directory that still have a copy outside of it."""
+    prefix = directory.rstrip(os.sep) + os.sep
+    files = []
+    for paths in duplicate_sets.values():
+        inside = [path for path in paths if path.startswith(prefix)]
+        if inside and len(inside) < len(paths):
+            files.extend(inside)
+    return files
+
+
+def find_tree(trees: List[Dict], directory: str) -> Optional[Dict]:
+    """Return the reported tree that has ``directory`` as one of its copies."""
+    for tree in trees:
+        if directory in tree["paths"]:
+            return tree
+    return None
@@ -0,0 +1,103 @@
+"""Detection of truncated copies, such as interrupted downloads.
+
+A truncated copy is a strict prefix of a longer file. Both share their head
+digest, so files larger than the head are grouped by it across sizes, and
+a shorter file only needs its full digest compared against the digest of
+the same-length prefix of the longer file. Head digests are kept in the
+index, so later scans only read the heads of new or changed files.
+"""
+
+import logging
+import os
+from typing import Any, Dict, List, Tuple
+
+from hashing import PARTIAL_HASH_SIZE, calculate_prefix_hashes, get_file_hash, get_partial_hash
+from index import FileIndex
+
+logger = logging.getLogger("duplicate_video_finder")
+
+# Bytes at the end of a shorter file compared with the longer file before
+# any hashing; most candidates that are not prefixes fail here
+TAIL_PROBE = 64 * 1024
+
+def _tail_matches(short_path: str, short_size: int, long_path: str) -> bool:
+    """Check that the last bytes of the shorter file appear at the same offset in the longer one."""
+    probe = min(TAIL_PROBE, short_size)
+    offset = short_size - probe
+    with open(short_path, "rb") as short_file, open(long_path, "rb") as long_file:
+        short_file.seek(offset)
+        long_file.seek(offset)
+        return short_file.read(probe) == long_file.read(probe)
+
+
+def find_truncated(
+    index: FileIndex,
+    file_paths: List[str],
+    status: Dict[str, Any],
+    chunk_size: int = 1024 * 1024,
+) -> List[Dict[str, Any]]:
+    """Find files that are strict prefixes of longer files.
+
+    Every file larger than the head is grouped by its head digest, taken
+from the index when a content scan stored it and hashed otherwise, so
+renamed copies are found as well. Full digests come from the index when
+available. Every longer file is read once, up to the largest candidate
+prefix, no matter how many shorter files it is checked against.
+
+    Returns one entry per truncated file, largest first, with the longer
+    files it is a prefix of, also largest first.
+    """
+    status["stage"] = "truncation"
+    status["total_files"] = len(file_paths)
+    status["processed_files"] = 0
+
+    by_head: Dict[str, List[Tuple[str, os.stat_result]]] = {}
+    for path in file_paths:
+        status["processed_files"] += 1
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        # Shorter files have a different head digest than any longer file
+        if st.st_size <= PARTIAL_HASH_SIZE:
+            continue
+        head = get_partial_hash(index, path, st)
+        if head is not None:
+            by_head.setdefault(head, []).append((path, st))
+
+    truncated: Dict[str, Dict[str, Any]] = {}
+    for members in by_head.values():
+        if len({st.st_size for _, st in members}) < 2:
+            continue
+        members.sort(key=lambda member: member[1].st_size)
+        for long_path, long_st in reversed(members):
+            shorter = []
+            for short_path, short_st in members:
+                if short_st.st_size >= long_st.st_size:
+                    break
+                try:
+                    if _tail_matches(short_path, short_st.st_size, long_path):
+                        shorter.append((short_path, short_st))
+                except OSError as e:
+                    logger.error(f"Error comparing {short_path} with {long_path}: {e}")
+            if not shorter:
+                continue
+            try:
+                prefixes = calculate_prefix_hashes(long_path, [st.st_size for _, st in shorter], chunk_size)
+            except OSError as e:
+                logger.error(f"Error hashing {long_path}: {e}")
+                continue
+            for short_path, short_st in shorter:
+                digest = get_file_hash(index, short_path, short_st, chunk_size=chunk_size)
+                if digest is None or prefixes.get(short_st.st_size) != digest:
+                    continue
+                entry = truncated.setdefault(short_path, {
+                    "path": short_path,
+                    "size": short_st.st_size,
+                    "complete": [],
+                })
+                entry["complete"].append({"path": long_path, "size": long_st.st_size})
+    index.commit()
+
+    logger.info(f"Found {len(truncated)} truncated copies")
+    return sorted(truncated.values(), key=lambda entry: entry["size"], reverse=True)
@@ -0,0 +1,64 @@
+"""Directory listing shared by the scan engines."""
+
+import logging
+import os
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger("duplicate_video_finder")
+
+# Video file extensions to look for
+VIDEO_EXTENSIONS = {
+    ".mp4", ".mkv", ".avi", ".mov", ".wmv", ".flv", ".webm",
+    ".m4v", ".mpeg", ".mpg", ".3gp", ".ts", ".mts", ".m2ts"
+}
+
+
+def initial_frontier(scan_paths: List[str]) -> List[str]:
+    """Build the directory stack a walk starts from, skipping missing paths."""
+    frontier = []
+    for base_path in reversed(scan_paths):
+        if not os.path.isdir(base_path):
+            logger.warning(f"Path does not exist: {base_path}")
+            continue
+        frontier.append(base_path)
+    return frontier
+
+
+def list_directory(
+    directory: str, exclude_paths: List[str], stat_files: bool = False
+) -> Tuple[List[str], List[Tuple[str, Optional[os.stat_result]]]]:
+    """List one directory, returning (subdirectories, (video file, stat)) as full paths.
+
+    With ``stat_files`` the stat of every video file is taken from its
+    directory entry while the listing is read, otherwise it is None.
+    Symlinks are not followed so one file is never reported twice.
+    """
+    subdirs = []
+    video_files: List[Tuple[str, Optional[os.stat_result]]] = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                # Check if this path should be excluded
+                if any(entry.path.startswith(exclude) for exclude in exclude_paths):
+                    continue
+
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    if os.path.splitext(entry.name)[1].lower() in VIDEO_EXTENSIONS:
+                        st = None
+                        if stat_files:
+                            try:
+                                st = entry.stat(follow_symlinks=False)
+                            except OSError:
+                                pass
+                        video_files.append((entry.path, st))
+    except OSError as e:
+        logger.error(f"Error scanning {directory}: {e}")
+    return subdirs, video_files
+
+
+def scan_directory(directory: str, exclude_paths: List[str]) -> Tuple[List[str], List[str]]:
+    """List one directory, returning (subdirectories, video files) as full paths."""
+    subdirs, video_files = list_directory(directory, exclude_paths)
+    return subdirs, [path for path, _ in video_files]
@@ -0,0 +1,11 @@
+"""Make the add-on modules importable by the tests."""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The add-on modules import each other by their bare names
+APP_DIR = os.path.join(ROOT, "duplicate-video-finder", "app")
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
@@ -0,0 +1,101 @@
+"""Duplicates across scan agents and the coordinator's own library."""
+
+import os
+
+import pytest
+
+from agents import LOCAL_AGENT, AgentRegistry, hash_local, report_local
+from hashing import PARTIAL_HASH_SIZE, get_file_hash, get_partial_hash
+from index import FileIndex
+from state_store import StateStore
+
+SIZE = PARTIAL_HASH_SIZE + 10
+
+
+@pytest.fixture
+def registry(tmp_path):
+    store = StateStore(str(tmp_path / "state.db"))
+    yield AgentRegistry(store)
+    store.close()
+
+
+def _row(path, size=SIZE, partial=None, full=None):
+    return [path, size, 1, 1, partial, full]
+
+
+def test_digests_are_asked_for_until_copies_are_confirmed(registry):
+    registry.add_files("a", [_row("/v/1.mkv"), _row("/v/2.mkv", size=5)], reset=True)
+    registry.add_files("b", [_row("/w/1.mkv")], reset=True)
+    assert registry.needed("a") == {"partial": ["/v/1.mkv"], "full": []}
+
+    registry.add_digests("a", {"/v/1.mkv": "p"}, {}, [])
+    registry.add_digests("b", {"/w/1.mkv": "p"}, {}, [])
+    assert registry.needed("b") == {"partial": [], "full": ["/w/1.mkv"]}
+
+    registry.add_digests("a", {}, {"/v/1.mkv": "f"}, [])
+    registry.add_digests("b", {}, {"/w/1.mkv": "f"}, [])
+    assert registry.needed("a") == registry.needed("b") == {"partial": [], "full": []}
+    assert list(registry.duplicates().values()) == [["a:/v/1.mkv", "b:/w/1.mkv"]]
+    assert [(agent["name"], agent["files"]) for agent in registry.summary()] == [("a", 2), ("b", 1)]
+
+
+def test_missing_files_are_forgotten(registry):
+    registry.add_files("a", [_row("/v/1.mkv")], reset=True)
+    registry.add_files("b", [_row("/w/1.mkv")], reset=True)
+    registry.add_digests("b", {}, {}, ["/w/1.mkv"])
+    assert registry.needed("a") == {"partial": [], "full": []}
+    assert [agent["files"] for agent in registry.summary()] == [1, 0]
+
+
+def test_reads_do_not_write(registry):
+    registry.add_files("a", [_row("/v/1.mkv")], reset=True)
+    registry.add_files("b", [_row("/w/1.mkv")], reset=True)
+    changes = registry.store._conn.total_changes
+    registry.needed("a")
+    registry.duplicates()
+    registry.summary()
+    assert registry.store._conn.total_changes == changes
+
+
+def _library(tmp_path, names):
+    paths = []
+    for name in names:
+        path = tmp_path / "library" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"v" * SIZE)
+        paths.append(str(path))
+    return paths
+
+
+def test_library_copies_are_only_hashed_for_other_agents(registry, tmp_path):
+    paths = _library(tmp_path, ["a.mkv", "b.mkv"])
+    index = FileIndex(str(tmp_path / "index.db"))
+    report_local(registry, [paths], index)
+    assert registry.needed(LOCAL_AGENT) == {"partial": [], "full": []}
+    assert registry.duplicates() == {}
+
+    registry.add_files("nas", [_row("/nas/a.mkv")], reset=True)
+    registry.add_digests("nas", {"/nas/a.mkv": "x"}, {}, [])
+    assert hash_local(registry, index) == 2
+    assert registry.needed(LOCAL_AGENT) == {"partial": [], "full": []}
+    assert registry.duplicates() == {}
+    index.close()
+
+
+def test_library_copies_of_agent_files_are_listed(registry, tmp_path):
+    (path,) = _library(tmp_path, ["a.mkv"])
+    index = FileIndex(str(tmp_path / "index.db"))
+    report_local(registry, [[path]], index)
+    hash_local(registry, index)
+    assert registry.needed(LOCAL_AGENT) == {"partial": [], "full": []}
+
+    # The agent hashes the same content on its side
+    remote = tmp_path / "remote.mkv"
+    remote.write_bytes(b"v" * SIZE)
+    st = os.stat(remote)
+    registry.add_files("nas", [_row("/nas/a.mkv", partial=get_partial_hash(index, str(remote), st))], reset=True)
+    registry.add_digests("nas", {}, {"/nas/a.mkv": get_file_hash(index, str(remote), st)}, [])
+    hash_local(registry, index)
+
+    assert list(registry.duplicates().values()) == [[f"{LOCAL_AGENT}:{path}", "nas:/nas/a.mkv"]]
+    index.close()
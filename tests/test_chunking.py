@@ -0,0 +1,122 @@
+"""Content-defined chunking and the overlap report."""
+
+import os
+import random
+
+import pytest
+
+import chunking
+from chunking import (
+    MAX_CHUNK,
+    MIN_CHUNK,
+    ChunkIndex,
+    chunk_file,
+    find_overlaps,
+    overlap_candidates,
+)
+from index import FileIndex
+
+
+def _random(size, seed):
+    return random.Random(seed).randbytes(size)
+
+
+def _write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def _chunk_lengths(chunks):
+    return sum(length * count for length, count in chunks.values())
+
+
+def test_numpy_and_python_boundaries_agree():
+    pytest.importorskip("numpy")
+    data = bytearray(_random(300 * 1024, 1))
+    # Boundaries after an offset use the bytes before it as context
+    for skip in (0, 1000):
+        assert chunking._boundaries(data, skip) == chunking._boundaries_python(data, skip)
+
+
+def test_chunks_do_not_depend_on_read_size(tmp_path, monkeypatch):
+    path = _write(tmp_path / "movie.mkv", _random(10 * 1024 * 1024, 2))
+    chunks, blocks = chunk_file(path)
+
+    assert _chunk_lengths(chunks) == _chunk_lengths(blocks) == os.path.getsize(path)
+    assert all(length <= MAX_CHUNK for length, _ in chunks.values())
+    assert sorted(length for length, _ in chunks.values())[1] >= MIN_CHUNK
+
+    monkeypatch.setattr(chunking, "READ_SIZE", 1024 * 1024 + 17)
+    assert chunk_file(path) == (chunks, blocks)
+
+
+def test_boundaries_resync_after_an_insertion(tmp_path):
+    movie = _random(10 * 1024 * 1024, 3)
+    chunks, blocks = chunk_file(_write(tmp_path / "movie.mkv", movie))
+    longer, longer_blocks = chunk_file(_write(tmp_path / "intro.mkv", _random(1000, 4) + movie))
+
+    shared = sum(length for digest, (length, _) in chunks.items() if digest in longer)
+    assert shared >= 0.8 * len(movie)
+    # Fixed blocks no longer line up once the content has moved
+    assert not set(blocks) & set(longer_blocks)
+
+
+def test_overlapping_files_are_reported(tmp_path):
+    movie = _random(8 * 1024 * 1024, 3)
+    paths = [
+        _write(tmp_path / "movie.mkv", movie),
+        _write(tmp_path / "copy.mkv", movie),
+        _write(tmp_path / "intro.mkv", _random(5000, 6) + movie),
+        _write(tmp_path / "other.mkv", _random(8 * 1024 * 1024, 7)),
+    ]
+    file_index = FileIndex(str(tmp_path / "index.db"))
+    index = ChunkIndex(str(tmp_path / "chunks.db"))
+    status = {}
+
+    result = find_overlaps(index, file_index, paths, status)
+
+    assert (result["files"], status["processed_files"]) == (4, 4)
+    pairs = sorted(tuple(sorted(os.path.basename(p) for p in pair["paths"])) for pair in result["pairs"])
+    # Byte-identical files are plain duplicates and are not listed
+    assert pairs == [("copy.mkv", "intro.mkv"), ("intro.mkv", "movie.mkv")]
+    assert result["savings"]["blocks"] == len(movie)
+    assert result["savings"]["chunks"] >= 2 * 0.8 * len(movie)
+    index.close()
+    file_index.close()
+
+
+def test_unchanged_files_are_not_chunked_again(tmp_path, monkeypatch):
+    paths = [_write(tmp_path / name, _random(MIN_CHUNK * 3, 8)) for name in ("a.mkv", "b.mkv")]
+    file_index = FileIndex(str(tmp_path / "index.db"))
+    index = ChunkIndex(str(tmp_path / "chunks.db"))
+    find_overlaps(index, file_index, paths, {})
+    index.close()
+
+    def fail(path):
+        raise AssertionError(f"{path} chunked twice")
+
+    monkeypatch.setattr(chunking, "chunk_file", fail)
+    index = ChunkIndex(str(tmp_path / "chunks.db"))
+    assert find_overlaps(index, file_index, paths, {})["files"] == 2
+    index.close()
+    file_index.close()
+
+
+def test_candidates_need_a_similar_file(tmp_path):
+    paths = [
+        _write(tmp_path / "a.mkv", _random(MIN_CHUNK * 4, 9)),
+        _write(tmp_path / "b.mkv", _random(MIN_CHUNK * 4 + 100, 10)),
+        _write(tmp_path / "c.mkv", _random(MIN_CHUNK * 8, 11)),
+        _write(tmp_path / "d.mp4", _random(MIN_CHUNK * 4, 12)),
+        _write(tmp_path / "e.mkv", _random(MIN_CHUNK, 13)),
+        _write(tmp_path / "f.mkv", _random(MIN_CHUNK, 14)),
+    ]
+    file_index = FileIndex(str(tmp_path / "index.db"))
+    # A stored head digest shared with a file of another size selects both
+    for path in (paths[2], paths[3]):
+        file_index.put(path, os.stat(path), partial_hash="head")
+
+    candidates = overlap_candidates(file_index, paths)
+
+    assert [os.path.basename(path) for path, _ in candidates] == ["a.mkv", "b.mkv", "c.mkv", "d.mp4"]
+    file_index.close()
@@ -0,0 +1,53 @@
+"""Container metadata parsing of malformed MP4 files."""
+
+import importlib.util
+import os
+import struct
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _load(name, path):
+    # The integration package imports Home Assistant, so its container
+    # module is loaded on its own
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+PARSERS = [
+    _load("addon_container", os.path.join("duplicate-video-finder", "app", "container.py")),
+    _load("integration_container", os.path.join("custom_components", "duplicate_video_finder", "container.py")),
+]
+
+
+def _box(box_type, payload=b""):
+    return struct.pack(">I", 8 + len(payload)) + box_type + payload
+
+
+def _mp4(tmp_path, moov_children):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(_box(b"ftyp", b"isom\0\0\0\0") + _box(b"moov", b"".join(moov_children)))
+    return str(path)
+
+
+@pytest.mark.parametrize("container", PARSERS)
+@pytest.mark.parametrize("mvhd", [b"", b"\x01", b"\x00" * 10])
+def test_truncated_mvhd_is_skipped(tmp_path, container, mvhd):
+    meta = container.read_metadata(_mp4(tmp_path, [_box(b"mvhd", mvhd)]))
+    assert meta["duration"] == 0.0
+
+
+@pytest.mark.parametrize("container", PARSERS)
+def test_empty_tkhd_is_skipped(tmp_path, container):
+    hdlr = _box(b"hdlr", b"\0" * 8 + b"vide")
+    trak = _box(b"trak", _box(b"tkhd") + hdlr)
+    mvhd = _box(b"mvhd", b"\0" * 12 + struct.pack(">II", 1000, 5000))
+    meta = container.read_metadata(_mp4(tmp_path, [mvhd, trak]))
+    assert meta["duration"] == 5.0
+    assert meta["tracks"] == 1
+    assert meta["width"] == 0
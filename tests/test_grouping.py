@@ -0,0 +1,67 @@
+"""Grouping of scanned files past the memory budget."""
+
+import os
+
+import pytest
+
+from grouping import ExternalGrouper, read_groups, spill_groups
+
+
+def _records():
+    return [(f"name{i % 37}.mkv", f"/media/{i}/name{i % 37}.mkv") for i in range(500)]
+
+
+def _expected(records):
+    groups = {}
+    for key, value in records:
+        groups.setdefault(key, []).append(value)
+    return {key: sorted(values) for key, values in groups.items() if len(values) > 1}
+
+
+def _groups(grouper):
+    return {key: sorted(values) for key, values in grouper.groups()}
+
+
+@pytest.mark.parametrize("budget", [10**9, 2000])
+def test_groups_match_in_memory_grouping(tmp_path, budget):
+    records = _records() + [("unique.mkv", "/media/unique.mkv")]
+    grouper = ExternalGrouper(str(tmp_path), budget)
+    for key, value in records:
+        grouper.add(key, value)
+
+    assert grouper.spilled == (budget < 10**9)
+    assert len(grouper) == len(records)
+    assert _groups(grouper) == _expected(records)
+    grouper.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_state_holds_runs_but_no_buffered_records(tmp_path):
+    state = {}
+    grouper = ExternalGrouper(str(tmp_path), 2000, state)
+    for key, value in _records():
+        grouper.add(key, value)
+
+    assert set(state) == {"runs", "spilled_records"}
+    assert 0 < state["spilled_records"] < len(_records())
+
+
+def test_resumed_grouper_only_needs_records_after_the_runs(tmp_path):
+    records = _records()
+    state = {}
+    grouper = ExternalGrouper(str(tmp_path), 2000, state)
+    for key, value in records[:300]:
+        grouper.add(key, value)
+    saved = {"runs": list(state["runs"]), "spilled_records": state["spilled_records"]}
+
+    resumed = ExternalGrouper(str(tmp_path), 2000, saved)
+    for key, value in records[saved["spilled_records"]:]:
+        resumed.add(key, value)
+
+    assert _groups(resumed) == _expected(records)
+
+
+def test_spilled_groups_are_read_back(tmp_path):
+    groups = [("a.mkv", ["/x/a.mkv", "/y/a.mkv"]), ("b.mkv", ["/x/b.mkv", "/z/b.mkv"])]
+    path = spill_groups(str(tmp_path / "spill"), iter(groups))
+    assert list(read_groups(path)) == groups
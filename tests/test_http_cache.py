@@ -0,0 +1,79 @@
+"""Conditional GET and compression of the JSON API."""
+
+import asyncio
+import gzip
+import json
+
+import pytest
+from fastapi import Request
+
+import http_cache
+from http_cache import _encode, _matches, cached_json
+
+
+def _request(**headers):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/results",
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ('W/"v1"', True),
+    ('"v1"', True),
+    ('"v0", W/"v1"', True),
+    ("*", True),
+    ('"v2"', False),
+])
+def test_if_none_match_uses_weak_comparison(header, expected):
+    assert _matches(header, 'W/"v1"') is expected
+
+
+@pytest.mark.parametrize("header, with_brotli, expected", [
+    ("", True, None),
+    ("gzip, deflate", True, "gzip"),
+    ("gzip, br", True, "br"),
+    ("gzip, br", False, "gzip"),
+    ("gzip;q=1, br;q=0.5", True, "gzip"),
+    ("br;q=0, *", True, "gzip"),
+    ("gzip;q=0, identity", True, None),
+    ("*;q=0", True, None),
+])
+def test_encoding_follows_accept_encoding(monkeypatch, header, with_brotli, expected):
+    monkeypatch.setattr(http_cache, "brotli", object() if with_brotli else None)
+    assert _encode(_request(accept_encoding=header), b"x" * http_cache.MIN_COMPRESS_SIZE) == expected
+
+
+def test_small_bodies_are_sent_uncompressed():
+    assert _encode(_request(accept_encoding="gzip"), b"{}") is None
+
+
+def test_versioned_payload_is_not_built_for_a_matching_etag():
+    calls = []
+
+    def payload():
+        calls.append(True)
+        return {"sets": []}
+
+    response = asyncio.run(cached_json(_request(if_none_match='"7"'), payload, version="7"))
+
+    assert response.status_code == 304
+    assert response.headers["etag"] == 'W/"7"'
+    assert calls == []
+
+
+def test_body_etag_and_compression(monkeypatch):
+    monkeypatch.setattr(http_cache, "brotli", None)
+    payload = {"sets": [{"paths": [f"/media/movie{i}.mkv" for i in range(100)]}]}
+
+    response = asyncio.run(cached_json(_request(accept_encoding="gzip"), lambda: payload))
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert json.loads(gzip.decompress(response.body)) == payload
+
+    again = asyncio.run(cached_json(_request(if_none_match=response.headers["etag"]), lambda: payload))
+    assert again.status_code == 304
@@ -0,0 +1,59 @@
+"""Add-on file index pruning and read-only access."""
+
+import os
+import sqlite3
+
+import pytest
+
+from index import FileIndex
+
+
+def _files(tmp_path, names):
+    paths = []
+    for name in names:
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(name.encode())
+        paths.append(str(path))
+    return paths
+
+
+def test_prune_drops_files_the_walk_did_not_find(tmp_path):
+    library = tmp_path / "library"
+    other = tmp_path / "other"
+    kept, gone = _files(library, ["a.mkv", "sub/b.mkv"]), _files(library, ["c.mkv"])
+    outside = _files(other, ["d.mkv"])
+    index = FileIndex(str(tmp_path / "index.db"))
+    for path in kept + gone + outside:
+        index.put(path, os.stat(path), partial_hash="x")
+
+    assert index.prune([str(library) + os.sep], iter(kept)) == 1
+    assert [index.get(path, os.stat(path)) is not None for path in kept + gone + outside] == [
+        True, True, False, True
+    ]
+    index.close()
+
+
+def test_read_only_index_is_not_pruned(tmp_path):
+    (path,) = _files(tmp_path, ["a.mkv"])
+    FileIndex(str(tmp_path / "index.db")).close()
+    writer = FileIndex(str(tmp_path / "index.db"))
+    writer.put(path, os.stat(path))
+    writer.close()
+
+    reader = FileIndex(str(tmp_path / "index.db"), read_only=True)
+    assert reader.prune([str(tmp_path)], []) == 0
+    assert reader.get(path, os.stat(path)) is not None
+
+
+def test_read_only_index_opens_the_database_read_only(tmp_path):
+    (path,) = _files(tmp_path, ["a.mkv"])
+    writer = FileIndex(str(tmp_path / "index.db"))
+    writer.put(path, os.stat(path), partial_hash="x")
+    writer.commit()
+
+    reader = FileIndex(str(tmp_path / "index.db"), read_only=True)
+    assert reader.get(path, os.stat(path))["partial_hash"] == "x"
+    with pytest.raises(sqlite3.OperationalError):
+        reader._conn.execute("DELETE FROM files")
+    writer.close()
@@ -0,0 +1,75 @@
+"""Scans of the Home Assistant integration."""
+
+import asyncio
+import os
+import types
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from custom_components.duplicate_video_finder.scanner import DuplicateVideoScanner  # noqa: E402
+
+
+class _Hass:
+    def __init__(self, config_dir):
+        self.config = types.SimpleNamespace(path=lambda *parts: os.path.join(config_dir, *parts))
+
+    async def async_add_executor_job(self, func, *args):
+        return func(*args)
+
+
+def _write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+def _scan(hass, library, incremental=False):
+    scanner = DuplicateVideoScanner(hass, use_metadata=False, verify_partial=True)
+    scanner._get_root_paths = lambda: [str(library)]
+    try:
+        sets = asyncio.run(scanner.scan(incremental))
+    finally:
+        scanner.close()
+    return sorted(sorted(os.path.relpath(path, library) for path in paths) for paths in sets)
+
+
+def test_links_are_not_reported_as_copies(tmp_path):
+    library = tmp_path / "library"
+    original = _write(library / "a" / "movie.mkv", b"m" * 5000)
+    os.makedirs(library / "b")
+    os.link(original, library / "b" / "movie.mkv")
+    os.makedirs(library / "c")
+    os.symlink(original, library / "c" / "movie.mkv")
+    _write(library / "a" / "show.mkv", b"s" * 5000)
+    _write(library / "d" / "show.mkv", b"s" * 5000)
+    hass = _Hass(str(tmp_path / "config"))
+
+    expected = [["a/show.mkv", "d/show.mkv"]]
+    assert _scan(hass, library) == expected
+    assert _scan(hass, library, incremental=True) == expected
+
+
+def test_lookups_after_a_restart_use_stored_head_digests(tmp_path, monkeypatch):
+    library = tmp_path / "library"
+    copy = _write(library / "a" / "movie.mkv", b"m" * 5000)
+    _write(library / "b" / "movie.mkv", b"m" * 5000)
+    hass = _Hass(str(tmp_path / "config"))
+    _scan(hass, library)
+
+    reads = []
+    real_open = open
+
+    def tracking_open(path, *args, **kwargs):
+        reads.append(str(path))
+        return real_open(path, *args, **kwargs)
+
+    scanner = DuplicateVideoScanner(hass)
+    monkeypatch.setattr("builtins.open", tracking_open)
+    result = asyncio.run(scanner.check_file(copy))
+    monkeypatch.undo()
+    scanner.close()
+
+    assert result["matches"] == [str(library / "b" / "movie.mkv")]
+    assert not [path for path in reads if path.startswith(str(library))]
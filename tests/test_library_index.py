@@ -0,0 +1,40 @@
+"""Head digests kept in the integration's library index."""
+
+import importlib.util
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The integration package imports Home Assistant, so its index module is
+# loaded on its own
+_spec = importlib.util.spec_from_file_location(
+    "integration_index", os.path.join(ROOT, "custom_components", "duplicate_video_finder", "index.py")
+)
+_index = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_index)
+LibraryIndex = _index.LibraryIndex
+
+
+def test_head_digests_survive_reopening_while_files_are_unchanged(tmp_path):
+    db_path = str(tmp_path / "index.db")
+    index = LibraryIndex(db_path)
+    scan = index.begin_scan()
+    index.put_listing(scan, "/media", 1, [], 2, [("a.mkv", 10, 100), ("b.mkv", 10, 100)])
+    index.put_partial_hash("/media/a.mkv", 10, 100, "aaa")
+    index.put_partial_hash("/media/b.mkv", 10, 100, "bbb")
+    index.finish_scan(scan)
+    index.close()
+
+    index = LibraryIndex(db_path)
+    assert index.get_partial_hash("/media/a.mkv", 10, 100) == "aaa"
+    assert index.get_partial_hash("/media/a.mkv", 10, 101) is None
+
+    # A new listing keeps the digest of the unchanged file only
+    scan = index.begin_scan()
+    index.put_listing(scan, "/media", 2, [], 2, [("a.mkv", 10, 100), ("b.mkv", 10, 200)])
+    assert index.get_partial_hash("/media/a.mkv", 10, 100) == "aaa"
+    assert index.get_partial_hash("/media/b.mkv", 10, 200) is None
+
+    index.put_listing(scan, "/media", 3, [], 1, [("b.mkv", 10, 200)])
+    assert index.find_by_size(10) == ["/media/b.mkv"]
+    index.close()
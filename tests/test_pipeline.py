@@ -0,0 +1,92 @@
+"""Content scans, with small groups compared in lockstep."""
+
+import asyncio
+import os
+
+import pytest
+
+import hashing
+import pipeline
+from hashing import PARTIAL_HASH_SIZE, calculate_file_hash, compare_files
+from index import FileIndex
+
+
+def _write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_lockstep_comparison_splits_at_the_first_differing_block(tmp_path):
+    head = b"h" * 100
+    paths = [
+        _write(tmp_path / "a.mkv", head + b"x" * 50),
+        _write(tmp_path / "b.mkv", head + b"x" * 50),
+        _write(tmp_path / "c.mkv", head + b"y" * 50),
+        _write(tmp_path / "d.mkv", head + b"y" * 50),
+        _write(tmp_path / "e.mkv", head + b"z" * 50),
+    ]
+
+    classes = sorted(compare_files(paths, chunk_size=32), key=lambda entry: entry[1])
+    assert [members for _, members in classes] == [paths[:2], paths[2:4]]
+    assert [digest for digest, _ in classes] == [calculate_file_hash(paths[0]), calculate_file_hash(paths[2])]
+
+
+def _library(tmp_path):
+    head = b"v" * PARTIAL_HASH_SIZE
+    library = tmp_path / "library"
+    files = {
+        "movie": _write(library / "a" / "movie.mkv", head + b"1" * 10),
+        "copy": _write(library / "b" / "movie copy.mkv", head + b"1" * 10),
+        # Same size and head, different tail
+        "other": _write(library / "c" / "other.mkv", head + b"2" * 10),
+        "unique": _write(library / "c" / "unique.mkv", b"u" * (PARTIAL_HASH_SIZE + 10)),
+        "small": _write(library / "a" / "small.mp4", b"s" * 100),
+        "small copy": _write(library / "c" / "small.mp4", b"s" * 100),
+    }
+    expected = {
+        frozenset({files["movie"], files["copy"]}),
+        frozenset({files["small"], files["small copy"]}),
+    }
+    return str(library), files, expected
+
+
+def _scan(tmp_path, library):
+    index = FileIndex(str(tmp_path / "index.db"))
+    params = {"paths": [library], "exclude_paths": [], "hash_mode": "full", "io_profile": "auto"}
+    try:
+        results = asyncio.run(pipeline.ScanPipeline(index, params, {}, {}).run())
+    finally:
+        index.close()
+    return {frozenset(paths) for paths in results.values()}
+
+
+@pytest.mark.parametrize("lockstep_max_files", [pipeline.LOCKSTEP_MAX_FILES, 1])
+def test_lockstep_and_hashing_find_the_same_sets(tmp_path, monkeypatch, lockstep_max_files):
+    groups = []
+
+    def get_group_hashes(index, files, *args):
+        groups.append(sorted(path for path, _ in files))
+        return real_get_group_hashes(index, files, *args)
+
+    real_get_group_hashes = pipeline.get_group_hashes
+    monkeypatch.setattr(pipeline, "get_group_hashes", get_group_hashes)
+    monkeypatch.setattr(pipeline, "LOCKSTEP_MAX_FILES", lockstep_max_files)
+    library, files, expected = _library(tmp_path)
+
+    assert _scan(tmp_path, library) == expected
+    # The three files sharing size and head are compared side by side
+    movies = sorted([files["movie"], files["copy"], files["other"]])
+    assert groups == ([movies] if lockstep_max_files > 1 else [])
+
+
+def test_rescans_reuse_the_digests_of_lockstep_groups(tmp_path, monkeypatch):
+    library, files, expected = _library(tmp_path)
+    os.remove(files["other"])
+    assert _scan(tmp_path, library) == expected
+
+    def compare_files(*args):
+        raise AssertionError("unchanged files were read again")
+
+    monkeypatch.setattr(hashing, "compare_files", compare_files)
+    assert _scan(tmp_path, library) == expected
@@ -0,0 +1,98 @@
+"""Cron schedules, scan windows and deferred scheduled scans."""
+
+from datetime import datetime, time
+
+import pytest
+
+pytest.importorskip("homeassistant")
+
+from custom_components.duplicate_video_finder.const import (  # noqa: E402
+    DOMAIN,
+    STATE_IDLE,
+    STATE_SCANNING,
+)
+from custom_components.duplicate_video_finder.scheduler import (  # noqa: E402
+    CronSchedule,
+    ScanScheduler,
+    in_time_window,
+    parse_time_window,
+)
+
+
+@pytest.mark.parametrize("expression", ["* * *", "60 * * * *", "*/0 * * * *", "5-1 * * * *"])
+def test_invalid_cron_expressions_are_rejected(expression):
+    with pytest.raises(ValueError):
+        CronSchedule(expression)
+
+
+def test_cron_minute_and_hour():
+    schedule = CronSchedule("*/15 2 * * *")
+    assert schedule.matches(datetime(2026, 3, 4, 2, 30))
+    assert not schedule.matches(datetime(2026, 3, 4, 2, 31))
+    assert not schedule.matches(datetime(2026, 3, 4, 3, 0))
+
+
+def test_restricted_day_and_weekday_match_either():
+    # The 1st of the month or any Sunday
+    schedule = CronSchedule("0 3 1 * 0")
+    assert schedule.matches(datetime(2026, 3, 1, 3, 0))
+    assert schedule.matches(datetime(2026, 3, 8, 3, 0))
+    assert not schedule.matches(datetime(2026, 3, 9, 3, 0))
+
+
+def test_stepped_day_of_month_still_requires_the_weekday():
+    # Like cron, */2 counts as unrestricted, so both fields have to match
+    schedule = CronSchedule("0 3 */2 * 1")
+    assert schedule.matches(datetime(2026, 3, 9, 3, 0))
+    assert not schedule.matches(datetime(2026, 3, 16, 3, 0))
+    assert not schedule.matches(datetime(2026, 3, 11, 3, 0))
+
+
+def test_sunday_may_be_seven():
+    assert CronSchedule("0 0 * * 7").matches(datetime(2026, 3, 8, 0, 0))
+
+
+def test_overnight_window():
+    window = parse_time_window("22:00", "06:00")
+    assert in_time_window(time(23, 30), window)
+    assert in_time_window(time(5, 59), window)
+    assert not in_time_window(time(6, 0), window)
+    assert not in_time_window(time(12, 0), window)
+
+
+def test_no_window_always_allows():
+    assert parse_time_window("", "") is None
+    assert in_time_window(time(12, 0), None)
+
+
+@pytest.mark.parametrize("start, end", [("02:00", "02:00"), ("02:00", ""), ("25:00", "03:00")])
+def test_invalid_windows_are_rejected(start, end):
+    with pytest.raises(ValueError):
+        parse_time_window(start, end)
+
+
+class _Hass:
+    def __init__(self, state):
+        self.data = {DOMAIN: {"entry": {"state": state, "scheduled": False}}}
+        self.tasks = []
+
+    def async_create_task(self, coro):
+        self.tasks.append(coro)
+        coro.close()
+
+
+def test_schedule_firing_during_a_manual_scan_is_deferred():
+    started = []
+
+    async def start_scan():
+        started.append(True)
+
+    hass = _Hass(STATE_SCANNING)
+    scheduler = ScanScheduler(hass, "entry", start_scan, CronSchedule("0 2 * * *"), None)
+
+    scheduler._async_tick(datetime(2026, 3, 4, 2, 0))
+    assert hass.tasks == []
+
+    hass.data[DOMAIN]["entry"]["state"] = STATE_IDLE
+    scheduler._async_tick(datetime(2026, 3, 4, 2, 1))
+    assert len(hass.tasks) == 1
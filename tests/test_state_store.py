@@ -0,0 +1,74 @@
+"""Result generations and the deltas between them."""
+
+import pytest
+
+import state_store
+from state_store import StateStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = StateStore(str(tmp_path / "state.db"))
+    yield store
+    store.close()
+
+
+def _sets(**sets):
+    return list(sets.items())
+
+
+def test_deltas_name_added_modified_and_removed_sets(store):
+    first = store.publish(_sets(a=["/1/a", "/2/a"], b=["/1/b", "/2/b"], c=["/1/c", "/2/c"]))
+    second = store.publish(_sets(a=["/1/a", "/2/a"], b=["/1/b", "/3/b"], d=["/1/d", "/2/d"]))
+
+    assert second == first + 1
+    changes = store.changes(first)
+    assert (changes["added"], changes["modified"], changes["removed"]) == (["d"], ["b"], ["c"])
+    assert store.changes(second) == {
+        "generation": second, "reset": False, "added": [], "removed": [], "modified": [],
+    }
+
+
+def test_changes_over_several_generations_follow_the_first_event(store):
+    base = store.publish(_sets(a=["/1/a", "/2/a"]))
+    store.publish(_sets(a=["/1/a", "/2/a"], b=["/1/b", "/2/b"]))
+    store.publish(_sets(b=["/1/b", "/3/b"]))
+
+    # b did not exist at ``base``, so it is added however often it changed since
+    changes = store.changes(base)
+    assert (changes["added"], changes["modified"], changes["removed"]) == (["b"], [], ["a"])
+
+
+def test_forgetting_files_modifies_or_removes_sets(store):
+    base = store.publish(_sets(a=["/1/a", "/2/a", "/3/a"], b=["/1/b", "/2/b"]))
+    generation = store.forget(["/3/a", "/2/b"])
+
+    assert generation == base + 1
+    assert store.result_set("a") == ["/1/a", "/2/a"]
+    assert store.result_set("b") is None
+    assert not store.contains("/1/b")
+    changes = store.changes(base)
+    assert (changes["modified"], changes["removed"]) == (["a"], ["b"])
+    assert store.forget(["/elsewhere"]) is None
+
+
+def test_old_or_unknown_generations_reset(store, monkeypatch):
+    monkeypatch.setattr(state_store, "MAX_GENERATIONS", 2)
+    first = store.publish(_sets(a=["/1/a", "/2/a"]))
+    for _ in range(3):
+        last = store.publish(_sets(a=["/1/a", "/2/a"]))
+
+    assert store.changes(first)["reset"]
+    assert store.changes(last + 1)["reset"]
+    assert not store.changes(last - 1)["reset"]
+
+
+def test_provisional_sets_are_served_until_published(store):
+    store.publish(_sets(a=["/1/a", "/2/a"]))
+    store.set_provisional({"b": ["/1/b", "/2/b"]})
+    assert store.is_provisional()
+    assert [entry["name"] for entry in store.page()] == ["b"]
+
+    store.publish(_sets(c=["/1/c", "/2/c"]))
+    assert not store.is_provisional()
+    assert store.results() == {"c": ["/1/c", "/2/c"]}
@@ -0,0 +1,70 @@
+"""Duplicated directory trees from per-file duplicate sets."""
+
+from trees import duplicated_files_under, find_duplicate_trees, find_tree
+
+
+def _library(tmp_path):
+    """Two libraries holding the same shows, plus a partial copy of one show."""
+    sets = {}
+    all_files = []
+
+    def add(path, size):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * size)
+        all_files.append(str(path))
+        return str(path)
+
+    for show in range(3):
+        for episode in range(10):
+            size = 1000 + show * 100 + episode
+            name = f"Show{show}/S1/e{episode}.mkv"
+            paths = [add(tmp_path / "lib1" / name, size), add(tmp_path / "lib2" / name, size)]
+            if show == 0 and episode < 9:
+                paths.append(add(tmp_path / "lib3" / f"Copy/S1/e{episode}.mkv", size))
+            sets[f"{show}-{episode}"] = paths
+    return sets, all_files
+
+
+def test_only_the_outermost_copies_are_reported(tmp_path):
+    sets, all_files = _library(tmp_path)
+
+    trees = find_duplicate_trees(sets, all_files, [str(tmp_path)], min_overlap=0.8)
+
+    identical = [tree for tree in trees if tree["kind"] == "identical"]
+    assert [tree["paths"] for tree in identical] == [[str(tmp_path / "lib1"), str(tmp_path / "lib2")]]
+    assert identical[0]["files"] == 30
+    assert identical[0]["reclaimable_bytes"] == sum(1000 + show * 100 + e for show in range(3) for e in range(10))
+    partial = [tree for tree in trees if tree["kind"] == "partial"]
+    # Only one of the identical copies of Show0 is paired with the partial one
+    assert [sorted(tree["paths"]) for tree in partial] == [
+        [str(tmp_path / "lib1" / "Show0"), str(tmp_path / "lib3" / "Copy")],
+    ]
+    assert 0.8 <= partial[0]["overlap"] < 0.9
+
+
+def test_a_unique_file_breaks_an_identical_tree(tmp_path):
+    sets, all_files = _library(tmp_path)
+    extra = tmp_path / "lib1" / "Show1" / "S1" / "extra.mkv"
+    extra.write_bytes(b"x" * 10)
+    all_files.append(str(extra))
+
+    trees = find_duplicate_trees(sets, all_files, [str(tmp_path)])
+
+    identical = sorted(tree["paths"] for tree in trees if tree["kind"] == "identical")
+    assert [str(tmp_path / "lib1" / "Show0"), str(tmp_path / "lib2" / "Show0")] in identical
+    assert [str(tmp_path / "lib1" / "Show2"), str(tmp_path / "lib2" / "Show2")] in identical
+    # The libraries only differ by a small file, so they are still mostly
+    # duplicated; the show holding it is inside that pair
+    assert find_tree(trees, str(tmp_path / "lib1"))["kind"] == "partial"
+    assert find_tree(trees, str(tmp_path / "lib1" / "Show1")) is None
+    # The copy of Show0 lacks an episode, under the default overlap
+    assert find_tree(trees, str(tmp_path / "lib3" / "Copy")) is None
+
+
+def test_files_under_a_tree_that_have_a_copy_elsewhere(tmp_path):
+    sets = {
+        "a": [str(tmp_path / "old" / "a.mkv"), str(tmp_path / "new" / "a.mkv")],
+        "b": [str(tmp_path / "old" / "b.mkv"), str(tmp_path / "old" / "sub" / "b.mkv")],
+        "c": [str(tmp_path / "older" / "c.mkv"), str(tmp_path / "new" / "c.mkv")],
+    }
+    assert duplicated_files_under(str(tmp_path / "old") + "/", sets) == [str(tmp_path / "old" / "a.mkv")]
@@ -0,0 +1,57 @@
+"""Truncated copy detection across sizes and names."""
+
+import os
+
+from hashing import PARTIAL_HASH_SIZE
+from index import FileIndex
+from truncation import find_truncated
+
+
+def _write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def _content(size):
+    return bytes((i * 7 + i // 251) % 256 for i in range(size))
+
+
+def _find(tmp_path, paths):
+    index = FileIndex(str(tmp_path / "index.db"))
+    try:
+        return find_truncated(index, paths, {})
+    finally:
+        index.close()
+
+
+def test_renamed_truncated_copy_is_found(tmp_path):
+    data = _content(3 * PARTIAL_HASH_SIZE)
+    complete = _write(tmp_path / "Movie (2020).mkv", data)
+    partial = _write(tmp_path / "download_1234.bin", data[: 2 * PARTIAL_HASH_SIZE + 17])
+
+    truncated = _find(tmp_path, [complete, partial])
+
+    assert [entry["path"] for entry in truncated] == [partial]
+    assert truncated[0]["complete"] == [{"path": complete, "size": len(data)}]
+
+
+def test_same_head_with_different_tail_is_not_truncated(tmp_path):
+    data = _content(3 * PARTIAL_HASH_SIZE)
+    complete = _write(tmp_path / "a.mkv", data)
+    other = _write(tmp_path / "b.mkv", data[: 2 * PARTIAL_HASH_SIZE] + b"\xff" * 100)
+
+    assert _find(tmp_path, [complete, other]) == []
+
+
+def test_head_digests_are_kept_in_the_index(tmp_path):
+    data = _content(2 * PARTIAL_HASH_SIZE)
+    complete = _write(tmp_path / "a.mkv", data)
+    partial = _write(tmp_path / "b.mkv", data[: PARTIAL_HASH_SIZE + 1])
+    _find(tmp_path, [complete, partial])
+
+    index = FileIndex(str(tmp_path / "index.db"))
+    try:
+        for path in (complete, partial):
+            assert index.get(path, os.stat(path))["partial_hash"] is not None
+    finally:
+        index.close()
@@ -0,0 +1,31 @@
+"""Directory listing of the add-on walker."""
+
+import os
+
+from walker import list_directory, scan_directory
+
+
+def _tree(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "skip").mkdir()
+    (tmp_path / "movie.mkv").write_bytes(b"x" * 10)
+    (tmp_path / "notes.txt").write_bytes(b"x")
+    (tmp_path / "skip" / "other.mp4").write_bytes(b"x")
+    os.symlink(tmp_path / "movie.mkv", tmp_path / "link.mkv")
+
+
+def test_stats_come_with_the_listing(tmp_path):
+    _tree(tmp_path)
+    subdirs, files = list_directory(str(tmp_path), [str(tmp_path / "skip")], stat_files=True)
+
+    assert subdirs == [str(tmp_path / "sub")]
+    assert [path for path, _ in files] == [str(tmp_path / "movie.mkv")]
+    st = files[0][1]
+    assert (st.st_size, st.st_ino) == (10, os.stat(tmp_path / "movie.mkv").st_ino)
+
+
+def test_stats_are_left_out_unless_asked_for(tmp_path):
+    _tree(tmp_path)
+    _, files = list_directory(str(tmp_path), [])
+    assert files == [(str(tmp_path / "movie.mkv"), None)]
+    assert scan_directory(str(tmp_path), [])[1] == [str(tmp_path / "movie.mkv")]